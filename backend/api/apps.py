@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        if settings.SERVER_TIMING:
+            from .timing import instrument_serializers
+            instrument_serializers()
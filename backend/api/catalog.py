@@ -0,0 +1,128 @@
+"""Готовые ответы для каталогов ингредиентов и тегов.
+
+Полные списки ингредиентов и тегов одинаковы для всех клиентов, поэтому
+каждый процесс один раз на версию данных рендерит их в JSON и сжимает
+gzip и brotli (пакет ``Brotli`` из requirements.txt; без него ответы
+сжимаются только gzip). Запрос обслуживается отдачей готовых байтов
+в подходящей клиенту кодировке.
+"""
+import gzip
+import threading
+
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+from . import versioning
+from .serializers import IngredientSerializer, TagSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL = {'public': True, 'max_age': 0, 'must_revalidate': True}
+
+
+def _compressors():
+    compressors = {'gzip': lambda body: gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        compressors['br'] = lambda body: brotli.compress(body, quality=11)
+    return compressors
+
+
+def accepted_encodings(header):
+    """Возвращает кодировки из Accept-Encoding с ненулевым весом."""
+    encodings = set()
+    for item in header.split(','):
+        name, *params = (part.strip() for part in item.split(';'))
+        weight = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        if name and weight > 0:
+            encodings.add(name.lower())
+    return encodings
+
+
+class CatalogResponse:
+    """Сжатые варианты JSON-ответа каталога для текущей версии данных."""
+
+    # Порядок предпочтения кодировок при выборе варианта.
+    PREFERRED = ('br', 'gzip')
+
+    def __init__(self, scope, build_data):
+        self.scope = scope
+        self.build_data = build_data
+        self._lock = threading.Lock()
+        self._version = None
+        self._bodies = {}
+
+    def build(self, version=None):
+        """Рендерит каталог и готовит его сжатые варианты."""
+        with self._lock:
+            return self._build(version)
+
+    def get_bodies(self):
+        """Возвращает варианты ответа, перестраивая их после изменений."""
+        version = versioning.get_version(self.scope)
+        # Сборка идет под блокировкой: параллельные запросы ждут ее
+        # вместо того, чтобы рендерить и сжимать каталог каждый сам.
+        with self._lock:
+            if version != self._version:
+                self._build(version)
+            return self._bodies
+
+    def choose_encoding(self, request, bodies=None):
+        """Выбирает лучшую из принимаемых клиентом кодировок."""
+        if bodies is None:
+            bodies = self.get_bodies()
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        return next(
+            (name for name in self.PREFERRED
+             if name in accepted and name in bodies),
+            'identity',
+        )
+
+    def response(self, request):
+        """Формирует ответ в лучшей из принимаемых клиентом кодировок."""
+        bodies = self.get_bodies()
+        encoding = self.choose_encoding(request, bodies)
+        response = HttpResponse(
+            bodies[encoding], content_type='application/json'
+        )
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, **CACHE_CONTROL)
+        return response
+
+    def _build(self, version):
+        if version is None:
+            version = versioning.get_version(self.scope)
+        body = JSONRenderer().render(self.build_data())
+        bodies = {'identity': body}
+        for encoding, compress in _compressors().items():
+            compressed = compress(body)
+            if len(compressed) < len(body):
+                bodies[encoding] = compressed
+        self._bodies, self._version = bodies, version
+        return bodies
+
+
+def _ingredients_data():
+    return IngredientSerializer(Ingredient.objects.all(), many=True).data
+
+
+def _tags_data():
+    return TagSerializer(Tag.objects.all(), many=True).data
+
+
+ingredient_catalog = CatalogResponse(versioning.INGREDIENTS, _ingredients_data)
+tag_catalog = CatalogResponse(versioning.TAGS, _tags_data)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core import checks
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш shared должен быть общим для всех процессов."""
+    if settings.CACHES.get('shared', {}).get('BACKEND') != LOCMEM:
+        return []
+    return [checks.Warning(
+        'Кэш shared использует LocMemCache: версии данных не дойдут '
+        'до других воркеров и команд управления.',
+        hint='Задайте SHARED_CACHE_BACKEND=file или redis.',
+        id='api.W001',
+    )]
@@ -0,0 +1,93 @@
+"""Буферизованный подсчет переходов по коротким ссылкам.
+
+Переходы накапливаются в памяти процесса и записываются в базу данных
+одним запросом ``UPDATE ... SET clicks = clicks + CASE ...`` фоновым
+потоком раз в ``SHORT_LINK_CLICKS_FLUSH_INTERVAL`` секунд, а также сразу,
+когда накопилось ``SHORT_LINK_CLICKS_FLUSH_THRESHOLD`` переходов.
+Остаток сбрасывается при завершении процесса; при аварийном завершении
+теряются переходы не более чем за один интервал.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, Value, When
+
+from recipes.models import ShortLink
+
+logger = logging.getLogger(__name__)
+
+
+class ClickCounter:
+    """Счетчики переходов по рецептам с периодической записью в базу."""
+
+    def __init__(self, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._pending = 0
+        self._thread = None
+
+    def add(self, recipe_id):
+        """Учитывает переход и при необходимости записывает счетчики."""
+        with self._lock:
+            self._counts[recipe_id] += 1
+            self._pending += 1
+            due = self._pending >= self.flush_threshold
+            if self._thread is None:
+                # Поток создается в воркере, а не в родительском процессе
+                # до fork, где он бы не выжил.
+                self._thread = threading.Thread(
+                    target=self._run, name='click-counter', daemon=True
+                )
+                self._thread.start()
+        if due:
+            self.flush()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # Поток не должен завершаться: без него переходы копились
+                # бы в памяти до выхода процесса.
+                logger.exception('Ошибка фоновой записи переходов')
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Прибавляет накопленные переходы к счетчикам в базе данных."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+        if not counts:
+            return
+        try:
+            ShortLink.objects.filter(recipe_id__in=counts).update(
+                clicks=F('clicks') + Case(
+                    *(
+                        When(recipe_id=recipe_id, then=Value(count))
+                        for recipe_id, count in counts.items()
+                    ),
+                    default=Value(0),
+                )
+            )
+        except DatabaseError:
+            logger.exception('Не удалось записать переходы по ссылкам')
+            with self._lock:
+                self._counts.update(counts)
+                self._pending += sum(counts.values())
+
+
+click_counter = ClickCounter(
+    settings.SHORT_LINK_CLICKS_FLUSH_INTERVAL,
+    settings.SHORT_LINK_CLICKS_FLUSH_THRESHOLD,
+)
+atexit.register(click_counter.flush)
@@ -1,5 +1,7 @@
 import django_filters
-from recipes.models import Recipe, Ingredient
+from django.db.models import Exists, OuterRef
+from recipes.models import Recipe, Ingredient, Tag
+from recipes.search import search_recipes
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -12,10 +14,18 @@ class RecipeFilter(django_filters.FilterSet):
         method='filter_is_in_shopping_cart'
     )
     author = django_filters.NumberFilter(field_name='author__id')
+    tags = django_filters.ModelMultipleChoiceFilter(
+        queryset=Tag.objects.all(),
+        to_field_name='slug',
+        method='filter_tags',
+    )
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'author', 'tags', 'search'
+        ]
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтр по избранным рецептам."""
@@ -41,6 +51,20 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset.exclude(shopping_cart__user=self.request.user)
         return queryset
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, без дублей от соединений."""
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag__in=value
+            )
+        ))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(django_filters.FilterSet):
     """Фильтр для ингредиентов."""
@@ -0,0 +1,115 @@
+"""Кэш не зависящей от зрителя части представления рецептов.
+
+Фрагмент — это сериализованный рецепт без флагов избранного, корзины
+и подписки и с относительными ссылками на файлы. Ключ фрагмента
+включает версии рецепта, его автора, тегов и ингредиентов, поэтому
+любое их изменение делает старые фрагменты недостижимыми без явного
+удаления. Флаги зрителя и абсолютные ссылки добавляются при
+формировании ответа.
+
+Счетчики попаданий и промахов хранятся в общем кэше ``shared``, чтобы
+их видели все воркеры и команда ``recipe_cache_stats``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import RecipeIngredient
+from . import versioning
+
+HITS_KEY = 'recipe-fragment:hits'
+MISSES_KEY = 'recipe-fragment:misses'
+
+
+def _scopes(recipe):
+    return (
+        versioning.recipe_scope(recipe.pk),
+        versioning.user_scope(recipe.author_id),
+        versioning.TAGS,
+        versioning.INGREDIENTS,
+    )
+
+
+def _key(recipe, versions):
+    return 'recipe-fragment:{}:{}'.format(
+        recipe.pk,
+        ':'.join(str(versions[scope]) for scope in _scopes(recipe)),
+    )
+
+
+def get_fragments(recipes, render):
+    """Возвращает фрагменты {id: данные}, строя недостающие через render.
+
+    Связанные объекты загружаются только для рецептов, которых нет
+    в кэше.
+    """
+    if not recipes:
+        return {}
+    versions = versioning.get_versions(*{
+        scope for recipe in recipes for scope in _scopes(recipe)
+    })
+    keys = {_key(recipe, versions): recipe for recipe in recipes}
+    found = cache.get_many(keys)
+    fragments = {keys[key].pk: data for key, data in found.items()}
+    missing = {
+        key: recipe for key, recipe in keys.items() if key not in found
+    }
+    if missing:
+        prefetch_related_objects(
+            list(missing.values()),
+            'author',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+            'tags',
+        )
+        rendered = {key: render(recipe) for key, recipe in missing.items()}
+        # Фрагмент, версии которого изменились во время построения, мог
+        # прочитать устаревшие данные; в кэш он не попадает.
+        current = versioning.get_versions(*{
+            scope for recipe in missing.values()
+            for scope in _scopes(recipe)
+        })
+        cache.set_many({
+            key: data for key, data in rendered.items()
+            if _key(missing[key], current) == key
+        })
+        fragments.update(
+            (missing[key].pk, data) for key, data in rendered.items()
+        )
+    _count(HITS_KEY, len(found))
+    _count(MISSES_KEY, len(missing))
+    return fragments
+
+
+def is_enabled():
+    """Проверяет, включен ли кэш фрагментов в настройках."""
+    return settings.RECIPE_FRAGMENT_CACHE
+
+
+def get_stats():
+    """Возвращает счетчики попаданий и промахов кэша фрагментов."""
+    found = versioning.shared_cache.get_many((HITS_KEY, MISSES_KEY))
+    return {
+        'hits': found.get(HITS_KEY, 0),
+        'misses': found.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    """Обнуляет счетчики кэша фрагментов."""
+    versioning.shared_cache.delete_many((HITS_KEY, MISSES_KEY))
+
+
+def _count(key, value):
+    if not value:
+        return
+    shared_cache = versioning.shared_cache
+    try:
+        shared_cache.incr(key, value)
+    except ValueError:
+        if not shared_cache.add(key, value, timeout=None):
+            shared_cache.incr(key, value)
@@ -0,0 +1,62 @@
+"""Индекс ингредиентов в памяти для автодополнения по префиксу.
+
+Каталог ингредиентов небольшой и меняется редко, поэтому каждый процесс
+держит его отсортированным по названию в нижнем регистре и отвечает на
+запрос по префиксу двоичным поиском, не обращаясь к базе данных.
+Индекс перестраивается, когда меняется версия каталога.
+"""
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+from . import versioning
+
+# Символ, который больше любого другого, ограничивает диапазон ключей
+# с заданным префиксом справа.
+MAX_CHAR = '\U0010ffff'
+
+
+class IngredientIndex:
+    """Отсортированный массив ингредиентов с поиском по префиксу."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+
+    def build(self, version=None):
+        """Загружает каталог из базы данных и строит индекс."""
+        if version is None:
+            version = versioning.get_version(versioning.INGREDIENTS)
+        catalog = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        )
+        entries = sorted(
+            (name.casefold(), name, measurement_unit, pk)
+            for pk, name, measurement_unit in catalog.iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, measurement_unit, pk in entries
+        ]
+        with self._lock:
+            self._keys, self._rows, self._version = keys, rows, version
+
+    def search(self, prefix, limit=None):
+        """Возвращает ингредиенты, название которых начинается с prefix."""
+        version = versioning.get_version(versioning.INGREDIENTS)
+        if version != self._version:
+            self.build(version)
+        with self._lock:
+            keys, rows = self._keys, self._rows
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + MAX_CHAR, lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return rows[start:end]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,95 @@
+"""Разрешение коротких кодов в идентификаторы рецептов.
+
+Код ищется сначала в ограниченном LRU-кэше процесса, затем в общем кэше
+``shared`` и только потом в базе данных. Отсутствующие коды тоже
+кэшируются на короткое время, чтобы перебор несуществующих ссылок
+не нагружал базу.
+
+Удаление ссылки сразу очищает общий кэш, а LRU-кэши других процессов
+держат запись не дольше ``local_timeout`` секунд.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from recipes.models import ShortLink
+from .versioning import shared_cache
+
+# Значение в кэшах для кода, которого нет в базе данных.
+MISSING = 0
+
+
+def cache_key(code):
+    return f'short-link:{code}'
+
+
+class LinkResolver:
+    """LRU-кэш кодов перед общим кэшем и базой данных."""
+
+    def __init__(self, max_size, local_timeout, negative_timeout):
+        self.max_size = max_size
+        self.local_timeout = local_timeout
+        self.negative_timeout = negative_timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def resolve(self, code):
+        """Возвращает идентификатор рецепта или None."""
+        recipe_id = self._get_local(code)
+        if recipe_id is None:
+            recipe_id = shared_cache.get(cache_key(code))
+            if recipe_id is None:
+                recipe_id = ShortLink.objects.filter(
+                    short_code=code
+                ).values_list('recipe_id', flat=True).first() or MISSING
+                self.store(code, recipe_id)
+            else:
+                self._set_local(code, recipe_id)
+        return recipe_id or None
+
+    def store(self, code, recipe_id):
+        """Сохраняет результат поиска кода в оба кэша."""
+        shared_cache.set(
+            cache_key(code),
+            recipe_id,
+            timeout=None if recipe_id else self.negative_timeout,
+        )
+        self._set_local(code, recipe_id)
+
+    def forget(self, code):
+        """Удаляет код из кэшей после изменения ссылки."""
+        shared_cache.delete(cache_key(code))
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def _get_local(self, code):
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                return None
+            recipe_id, expires = entry
+            if expires < time.monotonic():
+                del self._entries[code]
+                return None
+            self._entries.move_to_end(code)
+            return recipe_id
+
+    def _set_local(self, code, recipe_id):
+        timeout = self.local_timeout
+        if not recipe_id:
+            timeout = min(timeout, self.negative_timeout)
+        expires = time.monotonic() + timeout
+        with self._lock:
+            self._entries[code] = (recipe_id, expires)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+link_resolver = LinkResolver(
+    settings.SHORT_LINK_CACHE_SIZE,
+    settings.SHORT_LINK_LOCAL_TIMEOUT,
+    settings.SHORT_LINK_NEGATIVE_TIMEOUT,
+)
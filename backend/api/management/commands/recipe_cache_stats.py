@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import fragments
+
+
+class Command(BaseCommand):
+    """Команда для просмотра счетчиков кэша фрагментов рецептов."""
+
+    help = 'Вывод числа попаданий и промахов кэша фрагментов рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счетчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        stats = fragments.get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}'
+        )
+        if options['reset']:
+            fragments.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
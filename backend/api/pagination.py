@@ -1,4 +1,9 @@
-from rest_framework.pagination import PageNumberPagination
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor, CursorPagination, PageNumberPagination
+)
+from rest_framework.response import Response
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -6,3 +11,112 @@ class CustomPageNumberPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     max_page_size = 100
+
+
+class CustomCursorPagination(CursorPagination):
+    """Курсорная пагинация без подсчета общего количества объектов."""
+
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class CursorOrPageNumberPagination(CustomPageNumberPagination):
+    """Пагинация по номерам страниц с включаемым курсорным режимом.
+
+    Курсорный режим включается параметром ``cursor`` (пустое значение
+    означает первую страницу) и не выполняет ``COUNT`` и ``OFFSET``.
+    Если клиент передает ``page`` или один из параметров
+    ``page_only_params``, используется пагинация по номерам.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering = None
+    # Параметры, задающие свой порядок выдачи, несовместимый с курсором.
+    page_only_params = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        params = request.query_params
+        if self.cursor_query_param in params and not any(
+            param in params
+            for param in (self.page_query_param, *self.page_only_params)
+        ):
+            self.cursor_paginator = CustomCursorPagination()
+            self.cursor_paginator.cursor_query_param = (
+                self.cursor_query_param
+            )
+            self.cursor_paginator.ordering = self.ordering
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CursorOrPageNumberPagination):
+    """Пагинация ленты рецептов, курсор по дате публикации.
+
+    Результаты поиска упорядочены по релевантности, поэтому с ``search``
+    используется пагинация по номерам.
+    """
+
+    ordering = ('-pub_date', '-id')
+    page_only_params = ('search',)
+
+
+class SubscriptionPagination(CursorOrPageNumberPagination):
+    """Пагинация подписок, курсор по идентификатору подписки."""
+
+    ordering = ('-follow_id',)
+
+
+class FeedPagination(CustomCursorPagination):
+    """Курсор ленты подписок по паре (дата публикации, id рецепта).
+
+    Страница ленты собирается из нескольких источников, поэтому позиция
+    передается функции выборки ``fetch(position, limit)``, а не
+    применяется к queryset. Переход возможен только вперед.
+    """
+
+    def paginate_keys(self, fetch, request):
+        """Возвращает id рецептов страницы."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        position = None
+        if cursor is not None and cursor.position:
+            position = self._parse_position(cursor.position)
+        keys = fetch(position, self.page_size + 1)
+        self.next_position = None
+        if len(keys) > self.page_size:
+            keys = keys[:self.page_size]
+            self.next_position = keys[-1]
+        return [recipe_id for _, recipe_id in keys]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        pub_date, recipe_id = self.next_position
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=f'{pub_date.isoformat()}|{recipe_id}',
+        ))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def _parse_position(self, position):
+        pub_date, _, recipe_id = position.partition('|')
+        try:
+            pub_date = parse_datetime(pub_date)
+            recipe_id = int(recipe_id)
+        except ValueError:
+            pub_date = None
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, recipe_id
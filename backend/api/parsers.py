@@ -0,0 +1,110 @@
+"""Парсеры загрузки изображений файлом, а не строкой base64.
+
+Файлы из ``multipart/form-data`` и тела ``image/*`` записываются во
+временный файл частями, а размер загрузки ограничен настройкой
+``IMAGE_UPLOAD_MAX_SIZE``: при превышении клиент получает 413.
+"""
+import json
+import mimetypes
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, FileUploadParser
+from rest_framework.parsers import MultiPartParser
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер загружаемого файла превышает допустимый.'
+    default_code = 'upload_too_large'
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл во временный файл, прерывая слишком большую загрузку."""
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.IMAGE_UPLOAD_MAX_SIZE
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class CappedUploadMixin:
+    """Проверяет Content-Length и подключает CappedUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        # Кроме файла, тело multipart содержит поля формы.
+        if length > (
+            settings.IMAGE_UPLOAD_MAX_SIZE
+            + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        ):
+            raise UploadTooLarge()
+        request._request.upload_handlers = [
+            CappedUploadHandler(request._request)
+        ]
+        return super().parse(stream, media_type, parser_context)
+
+
+class MultiPartJSONParser(CappedUploadMixin, MultiPartParser):
+    """Форма с файлами, где остальные данные переданы JSON в части data.
+
+    Так вложенные поля (например, ингредиенты рецепта) передаются в том
+    же виде, что и в теле JSON. Формы без части data разбираются как
+    обычно.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if 'data' not in parsed.data:
+            return parsed
+        try:
+            data = json.loads(parsed.data['data'])
+        except ValueError as error:
+            raise ParseError(f'Некорректный JSON в части data: {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Часть data должна содержать объект JSON.')
+        # Файлы переносятся в данные сразу: DRF объединяет данные
+        # с MultiValueDict через dict.update, получая списки вместо файлов.
+        data.update(parsed.files.dict())
+        return DataAndFiles(data, MultiValueDict())
+
+
+class ImageUploadParser(CappedUploadMixin, FileUploadParser):
+    """Изображение в теле запроса без кодирования.
+
+    Файл попадает в поле, указанное атрибутом ``raw_upload_field``
+    представления.
+    """
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        view = parser_context['view']
+        field_name = getattr(view, 'raw_upload_field', None)
+        if field_name is None:
+            raise ParseError(
+                'Загрузка файла в теле запроса не поддерживается.'
+            )
+        parsed = super().parse(stream, media_type, parser_context)
+        return DataAndFiles({}, {field_name: parsed.files['file']})
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        extension = mimetypes.guess_extension(media_type.split(';')[0]) or ''
+        return f'{uuid.uuid4()}{extension}'
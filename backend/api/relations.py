@@ -0,0 +1,181 @@
+"""Связи пользователя с рецептами и авторами: избранное, корзина, подписки.
+
+Одиночные действия выполняются одной вставкой или одним удалением без
+предварительной выборки связи. Массовые действия принимают список id
+и меняют все связи одним ``bulk_create(ignore_conflicts=True)`` или
+одним ``DELETE``, возвращая результат для каждого id. Массовая вставка
+не отправляет сигналы, поэтому работу их обработчиков (версии данных
+зрителя, заполнение ленты) выполняет ``bulk_created``.
+"""
+from django.db import IntegrityError, transaction
+from django.http import Http404
+
+from recipes import shopping_list, timeline
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+from . import versioning
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+def parse_id(value):
+    """Возвращает id объекта из адреса или 404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+class Relation:
+    """Связь пользователя с объектами модели ``target``."""
+
+    def __init__(self, model, target, field, version_kind):
+        self.model = model
+        self.target = target
+        self.field = f'{field}_id'
+        self.version_kind = version_kind
+
+    def add_one(self, user, target_id):
+        """Создает связь; возвращает False, если она уже была.
+
+        Объект ``target_id`` должен существовать.
+        """
+        try:
+            with transaction.atomic():
+                self.model.objects.create(
+                    user=user, **{self.field: target_id}
+                )
+                self.added(user, [target_id])
+        except IntegrityError:
+            return False
+        return True
+
+    def remove_one(self, user, target_id):
+        """Удаляет связь; возвращает False, если ее не было.
+
+        Если не существует сам объект, вызывает Http404.
+        """
+        with transaction.atomic():
+            deleted, _ = self.model.objects.filter(
+                user=user, **{self.field: target_id}
+            ).delete()
+            if deleted:
+                self.removed(user, [target_id])
+        if not deleted and not self.target.objects.filter(
+            pk=target_id
+        ).exists():
+            raise Http404
+        return bool(deleted)
+
+    @transaction.atomic
+    def add_many(self, user, target_ids):
+        """Создает связи со всеми объектами; возвращает {id: результат}."""
+        self._lock(user)
+        target_ids = list(dict.fromkeys(target_ids))
+        found = set(self.target.objects.filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True))
+        existing = self._existing(user, target_ids)
+        outcomes, new_ids = {}, []
+        for target_id in target_ids:
+            if target_id not in found:
+                outcomes[target_id] = NOT_FOUND
+            elif not self.allowed(user, target_id):
+                outcomes[target_id] = SELF
+            elif target_id in existing:
+                outcomes[target_id] = EXISTS
+            else:
+                outcomes[target_id] = CREATED
+                new_ids.append(target_id)
+        if new_ids:
+            self.model.objects.bulk_create(
+                (
+                    self.model(user=user, **{self.field: target_id})
+                    for target_id in new_ids
+                ),
+                ignore_conflicts=True,
+            )
+            self.added(user, new_ids)
+            self.bulk_created(user, new_ids)
+        return outcomes
+
+    @transaction.atomic
+    def remove_many(self, user, target_ids):
+        """Удаляет связи со всеми объектами; возвращает {id: результат}."""
+        self._lock(user)
+        target_ids = list(dict.fromkeys(target_ids))
+        existing = self._existing(user, target_ids)
+        if existing:
+            # delete() отправляет сигналы, версии меняют их обработчики.
+            self.model.objects.filter(
+                user=user, **{f'{self.field}__in': existing}
+            ).delete()
+            self.removed(user, [
+                target_id for target_id in target_ids
+                if target_id in existing
+            ])
+        return {
+            target_id: DELETED if target_id in existing else MISSING
+            for target_id in target_ids
+        }
+
+    def allowed(self, user, target_id):
+        """Можно ли связать пользователя с объектом."""
+        return True
+
+    def added(self, user, target_ids):
+        """Вызывается в транзакции после создания связей."""
+
+    def removed(self, user, target_ids):
+        """Вызывается в транзакции после удаления связей."""
+
+    def bulk_created(self, user, target_ids):
+        """Выполняет работу обработчиков post_save после bulk_create."""
+        versioning.bump_version(
+            versioning.viewer_scope(self.version_kind, user.pk)
+        )
+
+    def _existing(self, user, target_ids):
+        return set(self.model.objects.filter(
+            user=user, **{f'{self.field}__in': target_ids}
+        ).values_list(self.field, flat=True))
+
+    def _lock(self, user):
+        # Параллельные массовые изменения связей одного пользователя
+        # выполняются по очереди, поэтому результаты по id точны.
+        list(User.objects.select_for_update().filter(
+            pk=user.pk
+        ).values_list('pk', flat=True))
+
+
+class CartRelation(Relation):
+    """Корзина: изменения сразу применяются к списку покупок."""
+
+    def added(self, user, target_ids):
+        shopping_list.add_recipes(user, target_ids)
+
+    def removed(self, user, target_ids):
+        shopping_list.remove_recipes(user, target_ids)
+
+
+class FollowRelation(Relation):
+    """Подписки: на себя подписаться нельзя."""
+
+    def allowed(self, user, target_id):
+        return target_id != user.pk
+
+    def bulk_created(self, user, target_ids):
+        super().bulk_created(user, target_ids)
+        timeline.schedule_backfill(user.pk, target_ids)
+
+
+favorites = Relation(Favorite, Recipe, 'recipe', versioning.FAVORITES)
+shopping_cart = CartRelation(
+    ShoppingCart, Recipe, 'recipe', versioning.CART
+)
+follows = FollowRelation(Follow, User, 'author', versioning.FOLLOWS)
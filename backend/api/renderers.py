@@ -0,0 +1,76 @@
+import csv
+import json
+from abc import ABCMeta, abstractmethod
+
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Псевдофайл, возвращающий записанную строку вместо буферизации."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """Базовый рендерер списка покупок, выдающий строки по мере чтения.
+
+    Сам список формируется во вьюхе потоком через ``stream``; ``render``
+    используется только для ответов об ошибках.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    @abstractmethod
+    def stream(self, rows):
+        """Выдает части файла для строк (название, единица, количество)."""
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield 'Список покупок:\n'
+        yield '=' * 50 + '\n'
+        empty = True
+        for name, measurement_unit, amount in rows:
+            empty = False
+            yield f'{name} ({measurement_unit}) — {amount}\n'
+        if empty:
+            yield 'Список покупок пуст.\n'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for name, measurement_unit, amount in rows:
+            yield separator + json.dumps(
+                {
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                    'amount': amount,
+                },
+                ensure_ascii=False,
+            )
+            separator = ','
+        yield ']' if separator == ',' else '[]'
@@ -1,20 +1,31 @@
 import base64
+import binascii
+import io
 import uuid
 import re
+from collections import defaultdict
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes import images, shopping_list
 from recipes.models import (
     Ingredient, Tag, Recipe, RecipeIngredient,
     ShortLink
 )
 from users.models import User
 from django.conf import settings
+from . import fragments, versioning
+from .viewer import get_viewer
 
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для обработки изображений в формате Base64."""
+    """Поле для обработки изображений в формате Base64.
+
+    Размеры проверяются по заголовку еще до декодирования всех данных,
+    а сохраняется копия изображения без метаданных.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str):
@@ -25,12 +36,88 @@ class Base64ImageField(serializers.ImageField):
             if data.startswith('data:image'):
                 format, imgstr = data.split(';base64,')
                 ext = format.split('/')[-1]
-                data = ContentFile(
-                    base64.b64decode(imgstr),
-                    name=f'{uuid.uuid4()}.{ext}'
-                )
+                self._check_header(imgstr)
+                try:
+                    content = base64.b64decode(imgstr)
+                except (binascii.Error, ValueError):
+                    raise serializers.ValidationError(
+                        'Некорректные данные изображения.'
+                    )
+                data = ContentFile(content, name=f'{uuid.uuid4()}.{ext}')
+        if hasattr(data, 'read'):
+            try:
+                data = images.sanitize(data, str(uuid.uuid4()))
+            except images.ImageRejected as error:
+                raise serializers.ValidationError(str(error))
         return super().to_internal_value(data)
 
+    def _check_header(self, imgstr):
+        peek = settings.IMAGE_HEADER_PEEK // 4 * 4
+        try:
+            images.check_dimensions(
+                io.BytesIO(base64.b64decode(imgstr[:peek]))
+            )
+        except images.ImageTooLarge as error:
+            raise serializers.ValidationError(str(error))
+        except (images.ImageRejected, binascii.Error, ValueError):
+            # Заголовок не уместился в начало данных: размеры проверятся
+            # после полного декодирования.
+            pass
+
+
+def image_variants(image, request=None):
+    """Возвращает адреса уменьшенных копий {формат: srcset}."""
+    def build_url(width, image_format, name):
+        url = reverse('image-rendition', kwargs={
+            'width': width, 'image_format': image_format, 'name': name,
+        })
+        return request.build_absolute_uri(url) if request else url
+
+    variants = images.variant_urls(image.name if image else None, build_url)
+    if variants is None:
+        return None
+    return {
+        image_format: ', '.join(
+            f'{url} {width}w' for width, url in urls.items()
+        )
+        for image_format, urls in variants.items()
+    }
+
+
+def absolute_variants(variants, request):
+    """Делает абсолютными адреса в результате image_variants."""
+    if not variants or request is None:
+        return variants
+    return {
+        image_format: ', '.join(
+            f'{request.build_absolute_uri(url)} {width}'
+            for url, width in (
+                candidate.split(' ') for candidate in srcset.split(', ')
+            )
+        )
+        for image_format, srcset in variants.items()
+    }
+
+
+class ImageVariantsField(serializers.Field):
+    """Адреса уменьшенных копий изображения в формате srcset."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return image_variants(value, self.context.get('request'))
+
+
+class ViewerListSerializer(serializers.ListSerializer):
+    """Список, регистрирующий объекты страницы в снимке связей зрителя."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prime(items)
+        return super().to_representation(items)
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
 
@@ -55,20 +142,24 @@ class CustomUserSerializer(UserSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar'
+            'last_name', 'is_subscribed', 'avatar', 'avatar_variants'
         )
+        list_serializer_class = ViewerListSerializer
+
+    def prime(self, users):
+        get_viewer(self.context).prime_authors(user.id for user in users)
 
     def get_is_subscribed(self, obj):
         """Проверяет, подписан ли текущий пользователь на автора."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.follower.filter(author=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_viewer(self.context).is_subscribed(obj.id)
 
 
 class SetAvatarSerializer(serializers.ModelSerializer):
@@ -111,37 +202,129 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+    """Не зависящая от зрителя часть представления автора рецепта."""
+
+    avatar = serializers.ImageField(read_only=True)
+    avatar_variants = ImageVariantsField(source='avatar')
+
+    class Meta:
+        model = User
+        fields = (
+            'email', 'id', 'username', 'first_name', 'last_name', 'avatar',
+            'avatar_variants'
+        )
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Не зависящая от зрителя часть представления рецепта для кэша."""
+
+    tags = TagSerializer(many=True, read_only=True)
+    author = AuthorFragmentSerializer(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients', 'name', 'image', 'text',
+            'cooking_time'
+        )
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
     """Сериализатор для списка рецептов."""
 
+    tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         source='recipe_ingredients', many=True, read_only=True
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text',
+            'id', 'tags', 'author', 'ingredients', 'is_favorited',
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
             'cooking_time'
         )
+        list_serializer_class = ViewerListSerializer
+
+    def prime(self, recipes):
+        viewer = get_viewer(self.context)
+        viewer.prime_recipes(recipe.id for recipe in recipes)
+        viewer.prime_authors(recipe.author_id for recipe in recipes)
+        if fragments.is_enabled():
+            self._fragments = fragments.get_fragments(
+                recipes, self._render_fragment
+            )
+
+    def to_representation(self, instance):
+        """Собирает рецепт из кэшированного фрагмента и флагов зрителя."""
+        if not fragments.is_enabled():
+            if hasattr(instance, 'is_subscribed_to_author'):
+                instance.author.is_subscribed = (
+                    instance.is_subscribed_to_author
+                )
+            return super().to_representation(instance)
+        fragment = getattr(self, '_fragments', {}).get(instance.pk)
+        if fragment is None:
+            fragment = fragments.get_fragments(
+                [instance], self._render_fragment
+            )[instance.pk]
+        author = {
+            **fragment['author'],
+            'is_subscribed': self._is_subscribed_to_author(instance),
+            'avatar': self._absolute_url(fragment['author']['avatar']),
+            'avatar_variants': absolute_variants(
+                fragment['author']['avatar_variants'],
+                self.context.get('request'),
+            ),
+        }
+        data = {
+            **fragment,
+            'author': {
+                field: author[field]
+                for field in CustomUserSerializer.Meta.fields
+            },
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'image': self._absolute_url(fragment['image']),
+            'image_variants': image_variants(
+                instance.image, self.context.get('request')
+            ),
+        }
+        return {field: data[field] for field in self.Meta.fields}
+
+    def _render_fragment(self, recipe):
+        return dict(RecipeFragmentSerializer(recipe).data)
+
+    def _absolute_url(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def _is_subscribed_to_author(self, obj):
+        if hasattr(obj, 'is_subscribed_to_author'):
+            return obj.is_subscribed_to_author
+        return get_viewer(self.context).is_subscribed(obj.author_id)
 
     def get_is_favorited(self, obj):
         """Проверяет, находится ли рецепт в избранном."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.favorites.filter(recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return get_viewer(self.context).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         """Проверяет, находится ли рецепт в списке покупок."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.shopping_cart.filter(recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return get_viewer(self.context).is_in_shopping_cart(obj.id)
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -199,10 +382,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 'Ингредиенты не должны повторяться.'
             )
 
-        for item in value:
-            if not Ingredient.objects.filter(id=item['id']).exists():
+        existing = Ingredient.objects.in_bulk(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            if ingredient_id not in existing:
                 raise serializers.ValidationError(
-                    f'Ингредиент с id {item["id"]} не существует.'
+                    f'Ингредиент с id {ingredient_id} не существует.'
                 )
 
         return value
@@ -253,10 +437,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags', [])
 
         recipe = Recipe.objects.create(**validated_data)
-        if tags_data:
-            recipe.tags.set(tags_data)
-
-        self._create_ingredients(recipe, ingredients_data)
+        self._write_tags(recipe, tags_data)
+        self._write_ingredients(recipe, ingredients_data)
 
         return recipe
 
@@ -267,27 +449,74 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags', None)
 
         if tags_data is not None:
-            instance.tags.set(tags_data)
+            self._write_tags(instance, tags_data)
 
         if ingredients_data is not None:
-            instance.recipe_ingredients.all().delete()
-            self._create_ingredients(instance, ingredients_data)
+            changes = self._write_ingredients(instance, ingredients_data)
+            shopping_list.change_recipe(instance.id, changes)
 
         return super().update(instance, validated_data)
 
-    def _create_ingredients(self, recipe, ingredients_data):
-        """Создание ингредиентов для рецепта."""
-        recipe_ingredients = []
-        for ingredient_data in ingredients_data:
-            ingredient = Ingredient.objects.get(id=ingredient_data['id'])
-            recipe_ingredients.append(
-                RecipeIngredient(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    amount=ingredient_data['amount']
-                )
+    def _write_tags(self, recipe, tags_data):
+        """Добавляет новые и удаляет лишние теги рецепта."""
+        through = Recipe.tags.through
+        current = set() if self.instance is None else set(
+            through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        wanted = {tag.pk for tag in tags_data}
+        if current - wanted:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current - wanted
+            ).delete()
+        if wanted - current:
+            through.objects.bulk_create(
+                through(recipe=recipe, tag_id=tag_id)
+                for tag_id in wanted - current
             )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+
+    def _write_ingredients(self, recipe, ingredients_data):
+        """Записывает только изменившиеся ингредиенты рецепта.
+
+        Возвращает словарь {ingredient_id: разность количества}.
+        """
+        current = {} if self.instance is None else {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.only(
+                'id', 'recipe_id', 'ingredient_id', 'amount'
+            )
+        }
+        changes = defaultdict(int)
+        created, updated = [], []
+        for item in ingredients_data:
+            existing = current.pop(item['id'], None)
+            if existing is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=item['id'],
+                    amount=item['amount'],
+                ))
+            elif existing.amount != item['amount']:
+                changes[item['id']] -= existing.amount
+                existing.amount = item['amount']
+                updated.append(existing)
+            else:
+                continue
+            changes[item['id']] += item['amount']
+        for ingredient_id, item in current.items():
+            changes[ingredient_id] -= item.amount
+        if current:
+            RecipeIngredient.objects.filter(
+                pk__in=[item.pk for item in current.values()]
+            ).delete()
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        # Массовые запросы не отправляют сигналы, версию рецепта меняем явно.
+        versioning.bump_recipe(recipe.pk)
+        return changes
 
     def to_representation(self, instance):
         """Возвращает представление созданного рецепта."""
@@ -299,9 +528,21 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для краткого представления рецепта."""
 
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+def get_recipes_limit(request):
+    """Возвращает значение параметра recipes_limit или None."""
+    if request is None:
+        return None
+    try:
+        return max(int(request.query_params['recipes_limit']), 0)
+    except (KeyError, ValueError):
+        return None
 
 
 class UserWithRecipesSerializer(CustomUserSerializer):
@@ -314,23 +555,20 @@ class UserWithRecipesSerializer(CustomUserSerializer):
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'recipes', 'recipes_count', 'avatar'
+            'is_subscribed', 'recipes', 'recipes_count', 'avatar',
+            'avatar_variants'
         )
+        list_serializer_class = ViewerListSerializer
 
     def get_recipes(self, obj):
         """Возвращает рецепты пользователя."""
-        request = self.context.get('request')
-        recipes_limit = None
-
-        if request:
-            recipes_limit = request.query_params.get('recipes_limit')
-
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                pass
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
 
         return RecipeMinifiedSerializer(
             recipes, many=True, context=self.context
@@ -338,9 +576,21 @@ class UserWithRecipesSerializer(CustomUserSerializer):
 
     def get_recipes_count(self, obj):
         """Возвращает количество рецептов пользователя."""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
+class RelationIdsSerializer(serializers.Serializer):
+    """Список id для массового изменения избранного, корзины, подписок."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RELATION_MAX_IDS,
+    )
+
+
 class ShortLinkSerializer(serializers.ModelSerializer):
     """Сериализатор для короткой ссылки."""
 
@@ -0,0 +1,99 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, ShortLink,
+    Tag
+)
+from users.models import Follow, User
+from . import versioning
+from .link_resolver import link_resolver
+
+# Поля, изменение которых не влияет на представление пользователя.
+USER_SERVICE_FIELDS = frozenset({'last_login', 'password'})
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    """Инвалидирует производные данные каталога ингредиентов."""
+    versioning.bump_version(versioning.INGREDIENTS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    """Инвалидирует кэшированное представление рецепта."""
+    versioning.bump_recipe(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def bump_recipe_ingredients_version(sender, instance, **kwargs):
+    """Инвалидирует представление рецепта при изменении его состава."""
+    versioning.bump_recipe(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, **kwargs):
+    """Инвалидирует представление рецепта при изменении его тегов."""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        versioning.bump_version(versioning.TAGS)
+    else:
+        versioning.bump_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    """Инвалидирует представления всех рецептов при изменении тегов."""
+    versioning.bump_version(versioning.TAGS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, instance, created=False, update_fields=None,
+                      **kwargs):
+    """Инвалидирует профиль пользователя и представления его рецептов."""
+    if update_fields and USER_SERVICE_FIELDS.issuperset(update_fields):
+        return
+    versioning.bump_version(versioning.user_scope(instance.pk))
+    if not created:
+        # У нового пользователя еще нет рецептов в списках.
+        versioning.bump_version(versioning.USERS)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def bump_favorites_version(sender, instance, **kwargs):
+    """Инвалидирует ответы, зависящие от избранного пользователя."""
+    versioning.bump_version(
+        versioning.viewer_scope(versioning.FAVORITES, instance.user_id)
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def bump_cart_version(sender, instance, **kwargs):
+    """Инвалидирует ответы, зависящие от корзины пользователя."""
+    versioning.bump_version(
+        versioning.viewer_scope(versioning.CART, instance.user_id)
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follows_version(sender, instance, **kwargs):
+    """Инвалидирует ответы, зависящие от подписок пользователя."""
+    versioning.bump_version(
+        versioning.viewer_scope(versioning.FOLLOWS, instance.user_id)
+    )
+
+
+@receiver(post_save, sender=ShortLink)
+@receiver(post_delete, sender=ShortLink)
+def forget_short_link(sender, instance, **kwargs):
+    """Сбрасывает закэшированный результат поиска кода."""
+    link_resolver.forget(instance.short_code)
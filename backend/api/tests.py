@@ -0,0 +1,380 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from rest_framework.test import APIClient
+
+from api import fragments, versioning
+from api.catalog import CatalogResponse
+from api.click_counter import ClickCounter
+from recipes.models import Ingredient, Recipe, RecipeIngredient, ShortLink
+from users.models import User
+
+TEST_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'api-tests-{alias}',
+    }
+    for alias in ('default', 'shared')
+}
+BUMP_SCRIPT = '''
+import django
+django.setup()
+from api import versioning
+versioning.bump_version(versioning.INGREDIENTS)
+print(versioning.get_version(versioning.INGREDIENTS))
+'''
+
+
+class SharedVersionsTest(SimpleTestCase):
+    """Версии данных общие для всех процессов."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+        shared = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': self.location,
+        }
+        overridden = override_settings(
+            CACHES={**settings.CACHES, 'shared': shared}
+        )
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def bump_in_other_process(self):
+        result = subprocess.run(
+            [sys.executable, '-c', BUMP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'foodgram.settings',
+                'SHARED_CACHE_BACKEND': 'file',
+                'SHARED_CACHE_LOCATION': self.location,
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return int(result.stdout)
+
+    def test_bump_in_other_process_is_visible(self):
+        before = versioning.get_version(versioning.INGREDIENTS)
+        bumped = self.bump_in_other_process()
+        self.assertGreater(bumped, before)
+        self.assertEqual(
+            versioning.get_version(versioning.INGREDIENTS), bumped
+        )
+
+    def test_bump_in_this_process_is_seen_by_other_process(self):
+        versioning.bump_version(versioning.INGREDIENTS)
+        bumped = versioning.get_version(versioning.INGREDIENTS)
+        self.assertGreater(self.bump_in_other_process(), bumped)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngredientCatalogTest(TestCase):
+    """Индекс ингредиентов перестраивается после изменений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('мука', 'мед', 'молоко', 'сахар')
+        )
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+
+    def search(self, prefix):
+        return [
+            ingredient['name'] for ingredient in self.client.get(
+                '/api/ingredients/', {'name': prefix}
+            ).json()
+        ]
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search('М'), ['мед', 'молоко', 'мука'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('са'), ['сахар'])
+
+    def test_search_follows_changes(self):
+        self.search('м')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient = self.ingredients[0]
+            ingredient.name = 'манка'
+            ingredient.save()
+            Ingredient.objects.create(name='масло', measurement_unit='г')
+        self.assertEqual(self.search('ма'), ['манка', 'масло'])
+
+    def test_catalog_follows_changes(self):
+        self.client.get('/api/ingredients/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[3].delete()
+        names = [
+            ingredient['name']
+            for ingredient in self.client.get('/api/ingredients/').json()
+        ]
+        self.assertNotIn('сахар', names)
+
+    def test_etag_depends_on_encoding(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(50)
+        )
+        compressed = self.client.get(
+            '/api/ingredients/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertTrue(compressed['ETag'].endswith('-gzip"'))
+        plain = self.client.get('/api/ingredients/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+        self.assertEqual(
+            self.client.get(
+                '/api/ingredients/', HTTP_IF_NONE_MATCH=compressed['ETag']
+            ).status_code,
+            200,
+        )
+        self.assertEqual(
+            self.client.get(
+                '/api/ingredients/',
+                HTTP_ACCEPT_ENCODING='gzip',
+                HTTP_IF_NONE_MATCH=compressed['ETag'],
+            ).status_code,
+            304,
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogResponseTest(SimpleTestCase):
+    """Каталог перестраивается один раз на версию данных."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def test_parallel_requests_build_once(self):
+        calls = []
+
+        def build_data():
+            calls.append(1)
+            time.sleep(0.05)
+            return [{'id': 1}]
+
+        catalog = CatalogResponse('test-catalog', build_data)
+        threads = [
+            threading.Thread(target=catalog.get_bodies) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        versioning.bump_version('test-catalog')
+        catalog.get_bodies()
+        self.assertEqual(len(calls), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FragmentCacheTest(TestCase):
+    """Кэш фрагментов рецептов и его счетчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Автор',
+            password='secret-pass-1',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/test.png',
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=1
+            )
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.recipes = list(Recipe.objects.order_by('pk'))
+
+    def test_hits_and_misses(self):
+        client = APIClient()
+        client.get('/api/recipes/')
+        client.get('/api/recipes/')
+        self.assertEqual(fragments.get_stats(), {'hits': 3, 'misses': 3})
+        fragments.reset_stats()
+        self.assertEqual(fragments.get_stats(), {'hits': 0, 'misses': 0})
+
+    def test_fragments_follow_ingredient_rename(self):
+        client = APIClient()
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        client.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'манка'
+            self.ingredient.save()
+        names = [
+            item['name'] for item in client.get(path).json()['ingredients']
+        ]
+        self.assertEqual(names, ['манка'])
+
+    def test_changed_during_render_is_not_stored(self):
+        changed = self.recipes[0]
+
+        def render(recipe):
+            if recipe.pk == changed.pk:
+                with self.captureOnCommitCallbacks(execute=True):
+                    versioning.bump_recipe(recipe.pk)
+            return recipe.pk
+
+        stale_key = fragments._key(
+            changed, versioning.get_versions(*fragments._scopes(changed))
+        )
+        fragments.get_fragments(self.recipes, render)
+        self.assertIsNone(caches['default'].get(stale_key))
+        rendered = []
+        fragments.get_fragments(self.recipes, rendered.append)
+        self.assertEqual(rendered, [changed])
+
+
+class ClickCounterTest(TransactionTestCase):
+    """Фоновая запись переходов по коротким ссылкам."""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Автор',
+            password='secret-pass-1',
+        )
+        # Фоновые задачи ленты обращались бы к базе параллельно с тестом.
+        with mock.patch('recipes.timeline._submit'):
+            self.recipe = Recipe.objects.create(
+                author=author,
+                name='Рецепт',
+                text='Описание',
+                cooking_time=10,
+            )
+        self.link = ShortLink.objects.create(
+            recipe=self.recipe, short_code='test'
+        )
+
+    def watch_flushes(self, counter, failures=()):
+        """Подменяет flush счетчика; возвращает событие успешной записи.
+
+        Тест ждет события, а не опрашивает базу: SQLite в памяти не дает
+        двум потокам одновременно обращаться к одной таблице.
+        """
+        flushed = threading.Event()
+        flush = counter.flush
+        failures = list(failures)
+
+        def watched_flush():
+            if failures:
+                raise failures.pop()
+            flush()
+            flushed.set()
+
+        counter.flush = watched_flush
+        return flushed
+
+    def assert_clicks(self, expected):
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.clicks, expected)
+
+    def test_timer_flush(self):
+        counter = ClickCounter(flush_interval=0.1, flush_threshold=1000)
+        flushed = self.watch_flushes(counter)
+        counter.add(self.recipe.pk)
+        counter.add(self.recipe.pk)
+        self.assertTrue(flushed.wait(5))
+        self.assert_clicks(2)
+
+    def test_threshold_flush(self):
+        counter = ClickCounter(flush_interval=3600, flush_threshold=3)
+        for _ in range(3):
+            counter.add(self.recipe.pk)
+        self.assert_clicks(3)
+
+    def test_thread_survives_errors(self):
+        counter = ClickCounter(flush_interval=0.1, flush_threshold=1000)
+        flushed = self.watch_flushes(counter, [RuntimeError('сбой')])
+        with self.assertLogs('api.click_counter', 'ERROR'):
+            counter.add(self.recipe.pk)
+            self.assertTrue(flushed.wait(5))
+        self.assert_clicks(1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ServerTimingTest(TestCase):
+    """Заголовок Server-Timing и строка лога с метриками запроса."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def get(self, path):
+        # Промежуточные слои загружаются при первом запросе клиента,
+        # поэтому клиент создается после подмены настроек.
+        with self.assertLogs('api.timing', 'INFO') as logs:
+            response = APIClient().get(path)
+        return response, json.loads(logs.records[0].getMessage())
+
+    @override_settings(SERVER_TIMING=True)
+    def test_header(self):
+        response, record = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        metrics = [
+            metric.split(';')[0]
+            for metric in response['Server-Timing'].split(', ')
+        ]
+        self.assertEqual(metrics, ['db', 'serialize', 'render', 'total'])
+        self.assertIn(
+            f'desc="{record["queries"]} queries"', response['Server-Timing']
+        )
+        self.assertEqual(record['view'], 'RecipeViewSet.list')
+        self.assertGreater(record['queries'], 0)
+        self.assertNotIn('sql', record)
+
+    @override_settings(
+        SERVER_TIMING=True,
+        SQL_SAMPLE_RATE=1.0,
+        SQL_SAMPLE_VIEWS=['TagViewSet.list'],
+    )
+    def test_sql_sample(self):
+        _, record = self.get('/api/recipes/')
+        self.assertNotIn('sql', record)
+        _, record = self.get('/api/tags/')
+        self.assertTrue(record['sql'])
+        self.assertEqual(len(record['sql']), record['queries'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
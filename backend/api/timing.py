@@ -0,0 +1,172 @@
+"""Метрики запроса: SQL, сериализация и рендеринг.
+
+``ServerTimingMiddleware`` считает запросы к базе и их общее время
+(через ``execute_wrapper`` всех соединений), время вычисления
+``serializer.data`` и рендеринга ответа DRF. Метрики отдаются в
+заголовке ``Server-Timing`` и пишутся строкой JSON в лог ``api.timing``
+вместе с именем представления вида ``RecipeViewSet.list``. Для доли
+``SQL_SAMPLE_RATE`` запросов (только представлений из
+``SQL_SAMPLE_VIEWS``, если список задан) в строку лога попадает текст
+SQL без параметров и длительность каждого запроса.
+
+Время сериализации включает запросы, выполненные при сериализации;
+запросы потоковых ответов, которые выполняются после возврата из
+промежуточных слоев, не учитываются.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Метрики одного запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        # Список выполненных SQL, если запрос попал в выборку.
+        self.sql = None
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        """Обертка execute_wrapper: учитывает запрос к базе."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            if self.sql is not None:
+                self.sql.append({'sql': sql, 'ms': _ms(elapsed)})
+
+    def header(self, total):
+        """Значение заголовка Server-Timing."""
+        return ', '.join((
+            f'db;dur={_ms(self.db)};desc="{self.queries} queries"',
+            f'serialize;dur={_ms(self.serialize)}',
+            f'render;dur={_ms(self.render)}',
+            f'total;dur={_ms(total)}',
+        ))
+
+    def record(self, request, response, total):
+        """Строка лога с метриками запроса."""
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': self.view,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'db_ms': _ms(self.db),
+            'queries': self.queries,
+            'serialize_ms': _ms(self.serialize),
+            'render_ms': _ms(self.render),
+        }
+        if self.sql is not None:
+            record['sql'] = self.sql
+        return record
+
+
+class ServerTimingMiddleware:
+    """Добавляет к ответам заголовок Server-Timing и пишет метрики в лог."""
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = timing.header(total)
+        logger.info(json.dumps(
+            timing.record(request, response, total), ensure_ascii=False
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = _current.get()
+        timing.view = view_name(view_func, request.method)
+        if random.random() < settings.SQL_SAMPLE_RATE and (
+            not settings.SQL_SAMPLE_VIEWS
+            or timing.view in settings.SQL_SAMPLE_VIEWS
+        ):
+            timing.sql = []
+
+    def process_template_response(self, request, response):
+        timing = _current.get()
+        started = time.perf_counter()
+
+        def rendered(response):
+            timing.render += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def view_name(view_func, method):
+    """Имя представления: ``Класс.действие`` для DRF, иначе имя функции."""
+    view_class = getattr(view_func, 'cls', None) or getattr(
+        view_func, 'view_class', None
+    )
+    if view_class is None:
+        return view_func.__name__
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+def instrument_serializers():
+    """Учитывает время вычисления ``serializer.data`` в метриках запроса.
+
+    Вложенные вызовы ``.data`` (например, в SerializerMethodField)
+    входят во время внешнего сериализатора.
+    """
+    data = BaseSerializer.data.fget
+    if getattr(data, 'timed', False):
+        return
+
+    def timed_data(serializer):
+        timing = _current.get()
+        if timing is None or timing.serializing:
+            return data(serializer)
+        timing.serializing = True
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            timing.serializing = False
+            timing.serialize += time.perf_counter() - started
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
@@ -1,7 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, TagViewSet, RecipeViewSet, UserViewSet
+from .views import (
+    IngredientViewSet, TagViewSet, RecipeViewSet, UserViewSet, image_rendition
+)
 
 router = DefaultRouter()
 router.register('ingredients', IngredientViewSet, basename='ingredients')
@@ -11,5 +13,10 @@ router.register('users', UserViewSet, basename='users')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path(
+        'images/<int:width>/<str:image_format>/<path:name>',
+        image_rendition,
+        name='image-rendition'
+    ),
     path('auth/', include('djoser.urls.authtoken')),
 ]
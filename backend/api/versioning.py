@@ -0,0 +1,100 @@
+"""Версии данных для инвалидации кэшей и индексов в памяти.
+
+Версия области данных (например, ``ingredients``) хранится в кэше
+``shared``, общем для всех воркеров и команд управления, и после
+фиксации каждого изменения соответствующих моделей заменяется
+отметкой времени в наносекундах. Процессы, построившие производные структуры,
+сравнивают сохраненную версию с текущей и перестраивают их при
+расхождении, а HTTP-ответы используют версии для ETag и Last-Modified.
+"""
+import time
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+# Кэш, общий для всех процессов: версии данных и счетчики.
+shared_cache = ConnectionProxy(caches, 'shared')
+
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+TAGS = 'tags'
+USERS = 'users'
+FAVORITES = 'favorites'
+CART = 'cart'
+FOLLOWS = 'follows'
+VIEWER_KINDS = (FAVORITES, CART, FOLLOWS)
+
+
+def recipe_scope(recipe_id):
+    """Область данных отдельного рецепта."""
+    return f'recipe:{recipe_id}'
+
+
+def user_scope(user_id):
+    """Область данных профиля пользователя."""
+    return f'user:{user_id}'
+
+
+def viewer_scope(kind, user_id):
+    """Область связей пользователя: избранного, корзины или подписок."""
+    return f'{kind}:{user_id}'
+
+
+def viewer_scopes(user):
+    """Области всех связей пользователя, влияющих на ответы API."""
+    if not user.is_authenticated:
+        return ()
+    return tuple(viewer_scope(kind, user.pk) for kind in VIEWER_KINDS)
+
+
+def _key(scope):
+    return f'data-version:{scope}'
+
+
+def get_version(scope):
+    """Возвращает текущую версию области данных."""
+    return get_versions(scope)[scope]
+
+
+def get_versions(*scopes):
+    """Возвращает версии нескольких областей одним обращением к кэшу."""
+    keys = {_key(scope): scope for scope in scopes}
+    found = shared_cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, scope in keys.items():
+        if scope not in versions:
+            # Начальное значение зависит от времени, чтобы версия после
+            # вытеснения ключа из кэша не совпала ни с одной из прежних.
+            shared_cache.add(key, time.time_ns(), timeout=None)
+            versions[scope] = shared_cache.get(key)
+    return versions
+
+
+def bump_version(scope):
+    """Заменяет версию области данных после фиксации транзакции.
+
+    Пока изменение не зафиксировано, параллельные запросы читают старые
+    данные и должны видеть старую версию, иначе новый ETag или фрагмент
+    достанется устаревшему ответу. Вне транзакции версия меняется сразу.
+    """
+    transaction.on_commit(partial(_bump, scope))
+
+
+def _bump(scope):
+    key = _key(scope)
+    # Версия строго растет, даже если часы процессов немного расходятся.
+    version = max(time.time_ns(), (shared_cache.get(key) or 0) + 1)
+    shared_cache.set(key, version, timeout=None)
+
+
+def bump_recipe(recipe_id):
+    """Увеличивает версии рецепта и списка рецептов."""
+    bump_version(recipe_scope(recipe_id))
+    bump_version(RECIPES)
+
+
+def last_modified(versions):
+    """Возвращает время последнего изменения в секундах по версиям."""
+    return max(versions.values()) // 1_000_000_000
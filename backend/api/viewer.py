@@ -0,0 +1,102 @@
+from django.contrib.auth.models import AnonymousUser
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+class ViewerRelations:
+    """Снимок связей текущего пользователя с авторами и рецептами.
+
+    Идентификаторы объектов регистрируются заранее (например, всей
+    страницей), а при первой проверке флага связи загружаются одним
+    запросом только для зарегистрированных идентификаторов.
+    """
+
+    FOLLOW = 'follow'
+    FAVORITE = 'favorite'
+    CART = 'cart'
+    RELATIONS = {
+        FOLLOW: (Follow, 'author_id'),
+        FAVORITE: (Favorite, 'recipe_id'),
+        CART: (ShoppingCart, 'recipe_id'),
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = {kind: set() for kind in self.RELATIONS}
+        self._checked = {kind: set() for kind in self.RELATIONS}
+        self._related = {kind: set() for kind in self.RELATIONS}
+
+    @classmethod
+    def for_request(cls, request):
+        """Возвращает снимок, общий для всех сериализаторов запроса."""
+        viewer = getattr(request, '_viewer_relations', None)
+        if viewer is None or viewer.user != request.user:
+            viewer = cls(request.user)
+            request._viewer_relations = viewer
+        return viewer
+
+    def prime_authors(self, author_ids):
+        """Регистрирует авторов, для которых понадобится флаг подписки."""
+        self._prime(self.FOLLOW, author_ids)
+
+    def prime_recipes(self, recipe_ids):
+        """Регистрирует рецепты для флагов избранного и покупок."""
+        recipe_ids = set(recipe_ids)
+        self._prime(self.FAVORITE, recipe_ids)
+        self._prime(self.CART, recipe_ids)
+
+    def is_subscribed(self, author_id):
+        return self._lookup(self.FOLLOW, author_id)
+
+    def is_favorited(self, recipe_id):
+        return self._lookup(self.FAVORITE, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self._lookup(self.CART, recipe_id)
+
+    def remember(self, kind, object_id, related):
+        """Фиксирует известное состояние связи без обращения к базе."""
+        self._checked[kind].add(object_id)
+        self._pending[kind].discard(object_id)
+        if related:
+            self._related[kind].add(object_id)
+        else:
+            self._related[kind].discard(object_id)
+
+    def _prime(self, kind, object_ids):
+        if self.user.is_authenticated:
+            self._pending[kind].update(
+                object_id for object_id in object_ids
+                if object_id not in self._checked[kind]
+            )
+
+    def _lookup(self, kind, object_id):
+        if not self.user.is_authenticated:
+            return False
+        if object_id not in self._checked[kind]:
+            self._pending[kind].add(object_id)
+            self._load(kind)
+        return object_id in self._related[kind]
+
+    def _load(self, kind):
+        model, field = self.RELATIONS[kind]
+        object_ids = self._pending[kind]
+        self._related[kind].update(
+            model.objects.filter(
+                user=self.user, **{f'{field}__in': object_ids}
+            ).values_list(field, flat=True)
+        )
+        self._checked[kind].update(object_ids)
+        self._pending[kind] = set()
+
+
+def get_viewer(context):
+    """Возвращает снимок связей зрителя из контекста сериализатора."""
+    viewer = context.get('viewer')
+    if viewer is not None:
+        return viewer
+    request = context.get('request')
+    if request is None:
+        return ViewerRelations(AnonymousUser())
+    return ViewerRelations.for_request(request)
@@ -1,30 +1,177 @@
 import hashlib
-from django.db.models import Sum
-from django.http import HttpResponse
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from django.db.models import Count, F, Prefetch, Value
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse, Http404, HttpResponseRedirect, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import NotAuthenticated
 
-from recipes.models import (
-    Ingredient, Tag, Recipe,
-    Favorite, ShoppingCart, ShortLink
-)
-from users.models import User, Follow
+from recipes import images, short_links, timeline
+from recipes.models import Ingredient, Tag, Recipe
+from users.models import User
+from . import fragments, relations, versioning
+from .catalog import ingredient_catalog, tag_catalog
+from .click_counter import click_counter
 from .filters import RecipeFilter, IngredientFilter
+from .ingredient_index import ingredient_index
+from .link_resolver import link_resolver
+from .parsers import ImageUploadParser, MultiPartJSONParser
+from .pagination import (
+    FeedPagination, RecipePagination, SubscriptionPagination
+)
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (
+    ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+    ShoppingListTextRenderer
+)
 from .serializers import (
     IngredientSerializer, TagSerializer, RecipeListSerializer,
     RecipeCreateSerializer, RecipeMinifiedSerializer,
     UserWithRecipesSerializer, SetAvatarSerializer,
-    ShortLinkSerializer
+    ShortLinkSerializer, RelationIdsSerializer, get_recipes_limit
 )
+from .viewer import ViewerRelations
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+
 
+class ViewerContextMixin:
+    """Передает сериализаторам общий для запроса снимок связей зрителя."""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['viewer'] = ViewerRelations.for_request(self.request)
+        return context
+
+
+class BulkRelationMixin:
+    """Массовое добавление и удаление связей списком id."""
+
+    def change_relations(self, relation, request):
+        serializer = RelationIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            outcomes = relation.add_many(request.user, ids)
+        else:
+            outcomes = relation.remove_many(request.user, ids)
+        return Response({'results': [
+            {'id': target_id, 'status': outcome}
+            for target_id, outcome in outcomes.items()
+        ]})
+
+
+class ConditionalGetMixin(metaclass=ABCMeta):
+    """Отвечает 304 по ETag, вычисленному из версий данных.
+
+    Проверка в ``conditional`` выполняется до выборки объектов и
+    сериализации. Наследники перечисляют области данных ответа
+    в ``get_version_scopes``; области связей зрителя и адрес запроса
+    добавляются автоматически.
+
+    Last-Modified отдается справочно: в нем секунды, а версии меняются
+    чаще, поэтому If-Modified-Since без If-None-Match не дает 304.
+    """
+
+    # Ответ зависит от пользователя: учитывать его связи и Authorization.
+    viewer_dependent = True
+
+    @abstractmethod
+    def get_version_scopes(self):
+        """Возвращает области данных, от которых зависит ответ.
+
+        Области отдельных объектов вычисляются только для найденных
+        объектов, чтобы произвольные id из адреса не заводили ключей
+        в общем кэше версий.
+        """
+
+    def get_etag_variant(self, request):
+        """Суффикс ETag для разных байтовых представлений ответа."""
+        return ''
+
+    def conditional(self, handler, request, *args, **kwargs):
+        """Вызывает handler, только если у клиента нет актуальной копии."""
+        scopes = self.get_version_scopes()
+        viewer = ''
+        if self.viewer_dependent:
+            scopes += versioning.viewer_scopes(request.user)
+            viewer = str(request.user.pk)
+        versions = versioning.get_versions(*scopes)
+        variant = self.get_etag_variant(request)
+        etag = '"{}{}"'.format(hashlib.md5('|'.join((
+            request.get_full_path(),
+            request.accepted_media_type or '',
+            viewer,
+            *(f'{scope}={versions[scope]}' for scope in sorted(versions)),
+        )).encode()).hexdigest(), f'-{variant}' if variant else '')
+        modified = versioning.last_modified(versions)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified)
+            if self.viewer_dependent:
+                patch_vary_headers(response, ('Authorization',))
+        return response
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class ConditionalReadMixin(ConditionalGetMixin):
+    """Условные ответы для стандартных действий list и retrieve."""
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class CatalogMixin(ConditionalReadMixin):
+    """Отдает полный каталог без фильтров готовым сжатым ответом."""
+
+    catalog = None
+    viewer_dependent = False
+
+    def list(self, request, *args, **kwargs):
+        if self.serves_catalog(request):
+            return self.conditional(self.catalog.response, request)
+        return super().list(request, *args, **kwargs)
+
+    def serves_catalog(self, request):
+        """Отвечает ли запрос готовым каталогом."""
+        return (
+            self.action == 'list'
+            and not request.query_params
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def get_etag_variant(self, request):
+        # Сжатые и несжатые байты каталога различаются, поэтому
+        # у каждой кодировки свой сильный ETag.
+        if self.serves_catalog(request):
+            encoding = self.catalog.choose_encoding(request)
+            if encoding != 'identity':
+                return encoding
+        return ''
+
+
+class IngredientViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
 
     queryset = Ingredient.objects.all()
@@ -32,23 +179,74 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    catalog = ingredient_catalog
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по префиксу названия обслуживается индексом в памяти."""
+        name = request.query_params.get('name')
+        if name:
+            return self.conditional(self._search, request, name)
+        return super().list(request, *args, **kwargs)
 
+    def _search(self, request, name):
+        return Response(ingredient_index.search(
+            name, limit=settings.INGREDIENT_SEARCH_LIMIT
+        ))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_version_scopes(self):
+        return (versioning.INGREDIENTS,)
+
+
+class TagViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    catalog = tag_catalog
 
+    def get_version_scopes(self):
+        return (versioning.TAGS,)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    ConditionalReadMixin, ViewerContextMixin, BulkRelationMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет для рецептов."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    parser_classes = (JSONParser, FormParser, MultiPartJSONParser)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'feed'):
+            queryset = queryset.with_user_flags(self.request.user)
+            if not fragments.is_enabled():
+                # Иначе связанные объекты загружаются только для
+                # рецептов, которых нет в кэше фрагментов.
+                queryset = queryset.with_related()
+        return queryset
+
+    def get_version_scopes(self):
+        if self.action == 'list':
+            return (
+                versioning.RECIPES, versioning.TAGS, versioning.USERS,
+                versioning.INGREDIENTS,
+            )
+        recipe = generics.get_object_or_404(
+            Recipe.objects.only('author_id'), pk=self.kwargs['pk']
+        )
+        return (
+            versioning.recipe_scope(recipe.pk),
+            versioning.TAGS,
+            versioning.INGREDIENTS,
+            versioning.user_scope(recipe.author_id),
+        )
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
@@ -67,28 +265,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, pk=None):
         """Добавление/удаление рецепта в избранное."""
-        recipe = self.get_object()
-
-        if request.method == 'POST':
-            favorite, created = Favorite.objects.get_or_create(
-                user=request.user, recipe=recipe
-            )
-            if not created:
-                return Response(
-                    {'errors': 'Рецепт уже в избранном'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            serializer = RecipeMinifiedSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        favorite = request.user.favorites.filter(recipe=recipe).first()
-        if not favorite:
-            return Response(
-                {'errors': 'Рецепта нет в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self._change_relation(
+            relations.favorites, request, pk,
+            'Рецепт уже в избранном', 'Рецепта нет в избранном'
+        )
 
     @action(
         detail=True,
@@ -97,65 +277,99 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def shopping_cart(self, request, pk=None):
         """Добавление/удаление рецепта в список покупок."""
-        recipe = self.get_object()
+        return self._change_relation(
+            relations.shopping_cart, request, pk,
+            'Рецепт уже в списке покупок', 'Рецепта нет в списке покупок'
+        )
 
-        if request.method == 'POST':
-            cart_item, created = ShoppingCart.objects.get_or_create(
-                user=request.user, recipe=recipe
-            )
-            if not created:
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        paginator = FeedPagination()
+        recipe_ids = paginator.paginate_keys(
+            lambda position, limit: timeline.page(
+                request.user, position, limit
+            ),
+            request
+        )
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite'
+    )
+    def favorite_many(self, request):
+        """Добавление/удаление списка рецептов в избранное."""
+        return self.change_relations(relations.favorites, request)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart'
+    )
+    def shopping_cart_many(self, request):
+        """Добавление/удаление списка рецептов в список покупок."""
+        return self.change_relations(relations.shopping_cart, request)
+
+    def _change_relation(self, relation, request, pk, exists, missing):
+        """Меняет связь одним запросом без выборки рецепта по вьюсету."""
+        recipe_id = relations.parse_id(pk)
+        if request.method == 'DELETE':
+            if not relation.remove_one(request.user, recipe_id):
                 return Response(
-                    {'errors': 'Рецепт уже в списке покупок'},
-                    status=status.HTTP_400_BAD_REQUEST
+                    {'errors': missing}, status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = RecipeMinifiedSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-        cart_item = request.user.shopping_cart.filter(recipe=recipe).first()
-        if not cart_item:
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+            pk=recipe_id
+        )
+        if not relation.add_one(request.user, recipe.pk):
             return Response(
-                {'errors': 'Рецепта нет в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'errors': exists}, status=status.HTTP_400_BAD_REQUEST
             )
-        cart_item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = RecipeMinifiedSerializer(
+            recipe, context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ]
     )
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок."""
-        user = request.user
-
-        ingredients = user.shopping_cart.values(
-            'recipe__recipe_ingredients__ingredient__name',
-            'recipe__recipe_ingredients__ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('recipe__recipe_ingredients__amount')
-        ).order_by('recipe__recipe_ingredients__ingredient__name')
-
-        shopping_list = []
-        shopping_list.append('Список покупок:\n')
-        shopping_list.append('=' * 50 + '\n')
-
-        if not ingredients:
-            shopping_list.append('Список покупок пуст.\n')
-        else:
-            for item in ingredients:
-                shopping_list.append(
-                    f"{item['recipe__recipe_ingredients__ingredient__name']} "
-                    f"({item['recipe__recipe_ingredients__ingredient__measurement_unit']}) — "
-                    f"{item['total_amount']}\n"
-                )
+        """Скачивание списка покупок в формате txt, csv или json."""
+        renderer = request.accepted_renderer
+        ingredients = request.user.shopping_list_items.values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name').iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE
+        )
 
-        response = HttpResponse(
-            ''.join(shopping_list),
-            content_type='text/plain; charset=utf-8'
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
         return response
 
@@ -164,35 +378,59 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Получение короткой ссылки на рецепт."""
         recipe = self.get_object()
 
-        short_link, created = ShortLink.objects.get_or_create(
-            recipe=recipe,
-            defaults={
-                'short_code': self._generate_short_code(recipe.id)
-            }
-        )
-
+        short_link = short_links.get_or_create(recipe)
         serializer = ShortLinkSerializer(
             short_link, context={'request': request}
         )
         return Response(serializer.data)
 
-    def _generate_short_code(self, recipe_id):
-        """Генерация короткого кода для ссылки."""
-        hash_object = hashlib.md5(str(recipe_id).encode())
-        return hash_object.hexdigest()[:8]
 
-
-class UserViewSet(viewsets.GenericViewSet):
+class UserViewSet(
+    ConditionalGetMixin, ViewerContextMixin, BulkRelationMixin,
+    viewsets.GenericViewSet
+):
     """Вьюсет для пользователей."""
 
     queryset = User.objects.all()
+    raw_upload_field = 'avatar'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'subscribe' and self.request.method == 'POST':
+            queryset = self._with_recipes(queryset)
+        return queryset
+
+    def _with_recipes(self, queryset):
+        """Подгружает последние рецепты и их число для страницы авторов."""
+        return queryset.annotate(
+            recipes_count=Count('recipes')
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_per_author(
+                    get_recipes_limit(self.request)
+                ),
+                to_attr='latest_recipes',
+            )
+        )
+
+    def get_version_scopes(self):
+        if self.action == 'me':
+            return (versioning.user_scope(self.request.user.pk),)
+        user = generics.get_object_or_404(
+            User.objects.only('pk'), pk=self.kwargs['pk']
+        )
+        return (versioning.user_scope(user.pk),)
 
     def retrieve(self, request, pk=None):
         """Получение профиля пользователя."""
+        return self.conditional(self._retrieve, request, pk)
+
+    def _retrieve(self, request, pk=None):
         user = self.get_object()
         from .serializers import CustomUserSerializer
         serializer = CustomUserSerializer(
-            user, context={'request': request}
+            user, context=self.get_serializer_context()
         )
         return Response(serializer.data)
 
@@ -208,10 +446,12 @@ class UserViewSet(viewsets.GenericViewSet):
                 {'detail': 'Учетные данные не были предоставлены.'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
+        return self.conditional(self._me, request)
 
+    def _me(self, request):
         from .serializers import CustomUserSerializer
         serializer = CustomUserSerializer(
-            request.user, context={'request': request}
+            request.user, context=self.get_serializer_context()
         )
         return Response(serializer.data)
 
@@ -251,22 +491,27 @@ class UserViewSet(viewsets.GenericViewSet):
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        pagination_class=SubscriptionPagination
     )
     def subscriptions(self, request):
         """Список подписок пользователя."""
         user = request.user
-        subscriptions = User.objects.filter(following__user=user)
+        subscriptions = self._with_recipes(
+            User.objects.filter(following__user=user).annotate(
+                follow_id=F('following__id'), is_subscribed=Value(True)
+            ).order_by('-follow_id')
+        )
 
         page = self.paginate_queryset(subscriptions)
         if page is not None:
             serializer = UserWithRecipesSerializer(
-                page, many=True, context={'request': request}
+                page, many=True, context=self.get_serializer_context()
             )
             return self.get_paginated_response(serializer.data)
 
         serializer = UserWithRecipesSerializer(
-            subscriptions, many=True, context={'request': request}
+            subscriptions, many=True, context=self.get_serializer_context()
         )
         return Response(serializer.data)
 
@@ -277,43 +522,52 @@ class UserViewSet(viewsets.GenericViewSet):
     )
     def subscribe(self, request, pk=None):
         """Подписка/отписка на пользователя."""
-        author = self.get_object()
         user = request.user
+        author_id = relations.parse_id(pk)
 
-        if user == author:
+        if user.pk == author_id:
             return Response(
                 {'errors': 'Нельзя подписаться на себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if request.method == 'POST':
-            follow, created = Follow.objects.get_or_create(
-                user=user, author=author
-            )
-            if not created:
+            author = self.get_object()
+            if not relations.follows.add_one(user, author.pk):
                 return Response(
                     {'errors': 'Вы уже подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = UserWithRecipesSerializer(
-                author, context={'request': request}
+            context = self.get_serializer_context()
+            context['viewer'].remember(
+                ViewerRelations.FOLLOW, author.id, True
             )
+            serializer = UserWithRecipesSerializer(author, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        follow = user.follower.filter(author=author).first()
-        if not follow:
+        if not relations.follows.remove_one(user, author_id):
             return Response(
                 {'errors': 'Вы не подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe'
+    )
+    def subscribe_many(self, request):
+        """Подписка/отписка на список пользователей."""
+        return self.change_relations(relations.follows, request)
+
     @action(
         detail=False,
         methods=['put', 'delete'],
         permission_classes=[IsAuthenticated],
-        url_path='me/avatar'
+        url_path='me/avatar',
+        parser_classes=[JSONParser, MultiPartJSONParser, ImageUploadParser]
     )
     def avatar(self, request):
         """Управление аватаром пользователя."""
@@ -344,6 +598,29 @@ class UserViewSet(viewsets.GenericViewSet):
 
 def short_link_redirect(request, short_code):
     """Перенаправление по короткой ссылке на рецепт."""
-    from django.http import HttpResponseRedirect
-    short_link = get_object_or_404(ShortLink, short_code=short_code)
-    return HttpResponseRedirect(f'/recipes/{short_link.recipe.id}')
+    recipe_id = link_resolver.resolve(short_code)
+    if recipe_id is None:
+        raise Http404('Короткая ссылка не найдена.')
+    click_counter.add(recipe_id)
+    return HttpResponseRedirect(f'/recipes/{recipe_id}')
+
+
+def image_rendition(request, width, image_format, name):
+    """Отдает уменьшенную копию изображения, создавая ее при отсутствии."""
+    if not images.is_valid_rendition(name, width, image_format):
+        raise Http404('Изображение не найдено.')
+    try:
+        if not default_storage.exists(name):
+            raise Http404('Изображение не найдено.')
+        target = images.ensure_rendition(name, width, image_format)
+    except (SuspiciousFileOperation, images.ImageRejected, OSError):
+        raise Http404('Изображение не найдено.')
+    response = FileResponse(
+        default_storage.open(target),
+        content_type=f'image/{image_format}'
+    )
+    # Путь исходного файла уникален, поэтому копия никогда не меняется.
+    patch_cache_control(
+        response, public=True, max_age=IMAGE_MAX_AGE, immutable=True
+    )
+    return response
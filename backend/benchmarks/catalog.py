@@ -0,0 +1,62 @@
+"""Сравнение выдачи каталогов: рендеринг на каждый запрос и готовые ответы.
+
+Запуск: ``python -m benchmarks.catalog [--iterations N]``. Запросы
+выполняются тестовым клиентом Django через весь стек промежуточных
+слоев и DRF; параметр ``format=json`` отключает готовый ответ.
+"""
+import argparse
+
+from benchmarks.ingredient_search import load_catalog
+from benchmarks.utils import (
+    format_stats, measure, setup, temporary_database
+)
+
+setup()
+
+from django.test import Client  # noqa: E402
+
+from api.catalog import brotli  # noqa: E402
+from recipes.models import Tag  # noqa: E402
+
+CASES = (
+    ('Рендеринг JSON', '?format=json', ''),
+    ('Готовый ответ', '', ''),
+    ('Готовый ответ gzip', '', 'gzip'),
+    ('Готовый ответ br', '', 'br'),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+
+    with temporary_database():
+        load_catalog()
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(20)
+        )
+        client = Client()
+        for url in ('/api/ingredients/', '/api/tags/'):
+            print(url)
+            baseline = None
+            for name, query, encoding in CASES:
+                if encoding == 'br' and brotli is None:
+                    print(f'{name:<32} пропущено: пакет brotli не установлен')
+                    continue
+
+                def fetch(_, path=url + query, encoding=encoding):
+                    return client.get(path, HTTP_ACCEPT_ENCODING=encoding)
+
+                size = len(fetch(None).content)
+                stats = measure(fetch, [None] * args.iterations)
+                baseline = baseline or stats['rps']
+                print(
+                    f'{format_stats(name, stats)} '
+                    f'x{stats["rps"] / baseline:5.1f} {size:>8} байт'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""Задержка, пропускная способность и число SQL-запросов маршрутов API.
+
+Временная база заполняется генератором синтетических данных с
+фиксированным зерном, после чего каждый маршрут на чтение из
+``api/urls.py`` и короткая ссылка запрашиваются тестовым клиентом
+Django через весь стек промежуточных слоев. Запросы одного сценария
+перебирают разные рецепты, пользователей и параметры фильтров.
+
+Результаты сравниваются с базовой линией в JSON (отдельной для каждой
+СУБД): запуск завершается с кодом 1, если p50 или p95 сценария выросли
+больше чем на ``--threshold`` или выросло число SQL-запросов. Базовая
+линия создается при первом запуске и перезаписывается с ``--update``.
+Чтобы уменьшить шум, сценарии прогоняются несколькими чередующимися
+раундами и берется лучший, а рост меньше ``--min-delta-ms`` не
+считается регрессией.
+
+Запуск: ``python -m benchmarks.endpoints [--requests N] [--update]``;
+на PostgreSQL — с переменной окружения ``USE_SQLITE=False``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+from benchmarks.utils import (
+    format_stats, measure, setup, temporary_database
+)
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, override_settings
+)
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from api.click_counter import click_counter  # noqa: E402
+from recipes import short_links, synthetic  # noqa: E402
+from recipes.models import Ingredient, Recipe, ShortLink, Tag  # noqa: E402
+from users.models import Follow, User  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+DATASET = {
+    'seed': 1,
+    'users': 300,
+    'recipes': 3000,
+    'follows': 5000,
+    'favorites': 10000,
+    'cart': 3000,
+}
+# Сколько разных аргументов перебирает сценарий.
+ARGUMENTS = 50
+QUERY_SAMPLES = 10
+
+
+def build_cases(rng):
+    """Возвращает сценарии: имя, нужна ли авторизация, список адресов."""
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    author_ids = list(Recipe.objects.order_by().values_list(
+        'author_id', flat=True
+    ).distinct())
+    tags = list(Tag.objects.values_list('slug', flat=True))
+    words = [
+        name.split()[0] for name in Ingredient.objects.values_list(
+            'name', flat=True
+        )
+    ]
+    codes = list(ShortLink.objects.values_list('short_code', flat=True))
+    image = Recipe.objects.values_list('image', flat=True).first()
+
+    def sample(values):
+        return [rng.choice(values) for _ in range(ARGUMENTS)]
+
+    return [
+        ('recipes: список', False, [
+            f'/api/recipes/?page={page}' for page in sample(range(1, 51))
+        ]),
+        ('recipes: теги', False, [
+            f'/api/recipes/?tags={first}&tags={second}'
+            for first, second in zip(sample(tags), sample(tags))
+        ]),
+        ('recipes: автор', False, [
+            f'/api/recipes/?author={author_id}'
+            for author_id in sample(author_ids)
+        ]),
+        ('recipes: поиск', False, [
+            f'/api/recipes/?search={word}' for word in sample(words)
+        ]),
+        ('recipes: избранное', True, [
+            f'/api/recipes/?is_favorited=1&page={page}'
+            for page in sample(range(1, 4))
+        ]),
+        ('recipes: корзина', True, [
+            f'/api/recipes/?is_in_shopping_cart=1&page={page}'
+            for page in sample(range(1, 3))
+        ]),
+        ('recipes: рецепт', False, [
+            f'/api/recipes/{recipe_id}/' for recipe_id in sample(recipe_ids)
+        ]),
+        ('recipes: рецепт, авторизован', True, [
+            f'/api/recipes/{recipe_id}/' for recipe_id in sample(recipe_ids)
+        ]),
+        ('recipes: get-link', False, [
+            f'/api/recipes/{recipe_id}/get-link/'
+            for recipe_id in sample(recipe_ids)
+        ]),
+        ('recipes: лента', True, ['/api/recipes/feed/'] * ARGUMENTS),
+        ('recipes: список покупок', True, [
+            f'/api/recipes/download_shopping_cart/?format={file_format}'
+            for file_format in sample(('txt', 'csv', 'json'))
+        ]),
+        ('ingredients: поиск', False, [
+            f'/api/ingredients/?name={word[:3]}' for word in sample(words)
+        ]),
+        ('ingredients: каталог', False, ['/api/ingredients/'] * ARGUMENTS),
+        ('tags: каталог', False, ['/api/tags/'] * ARGUMENTS),
+        ('users: список', False, [
+            f'/api/users/?page={page}' for page in sample(range(1, 31))
+        ]),
+        ('users: профиль', False, [
+            f'/api/users/{user_id}/' for user_id in sample(user_ids)
+        ]),
+        ('users: me', True, ['/api/users/me/'] * ARGUMENTS),
+        ('users: подписки', True, [
+            f'/api/users/subscriptions/?recipes_limit=3&page={page}'
+            for page in sample(range(1, 3))
+        ]),
+        ('images: копия', False, [
+            f'/api/images/{width}/{image_format}/{image}'
+            for width, image_format in zip(
+                sample(settings.IMAGE_RENDITION_WIDTHS),
+                sample(settings.IMAGE_RENDITION_FORMATS),
+            )
+        ]),
+        ('s: короткая ссылка', False, [
+            f'/s/{code}/' for code in sample(codes)
+        ]),
+    ]
+
+
+def fetch(client, headers, path):
+    response = client.get(path, **headers)
+    if response.status_code not in (200, 302):
+        raise RuntimeError(f'{path}: ответ {response.status_code}')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def count_queries(client, headers, paths):
+    """Наибольшее число SQL-запросов на нескольких адресах сценария."""
+    counts = []
+    for path in paths[:QUERY_SAMPLES]:
+        with CaptureQueriesContext(connection) as context:
+            fetch(client, headers, path)
+        counts.append(len(context.captured_queries))
+    return max(counts)
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Возвращает описания регрессий относительно базовой линии."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if stats[metric] > max(
+                base[metric] * (1 + threshold), base[metric] + min_delta_ms
+            ):
+                regressions.append(
+                    f'{name}: {metric} {base[metric]:.3f} -> '
+                    f'{stats[metric]:.3f}'
+                )
+        if stats['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {base["queries"]} -> '
+                f'{stats["queries"]}'
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument(
+        '--threshold', type=float, default=0.25,
+        help='Допустимый относительный рост p50 и p95',
+    )
+    parser.add_argument(
+        '--min-delta-ms', type=float, default=1.0,
+        help='Рост задержки меньше этого значения не считается регрессией',
+    )
+    parser.add_argument(
+        '--rounds', type=int, default=3,
+        help='Число раундов по всем сценариям; берется лучший',
+    )
+    parser.add_argument(
+        '--baseline', help='Файл базовой линии (по умолчанию по СУБД)',
+    )
+    parser.add_argument(
+        '--update', action='store_true',
+        help='Записать результаты как новую базовую линию',
+    )
+    args = parser.parse_args()
+    baseline_path = args.baseline or os.path.join(
+        BASELINE_DIR, f'endpoints-{connection.vendor}.json'
+    )
+    rng = random.Random(DATASET['seed'])
+
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        MEDIA_ROOT=media_root,
+        CACHES={
+            alias: {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'benchmarks-endpoints-{alias}',
+            }
+            for alias in ('default', 'shared')
+        },
+    ), temporary_database():
+        synthetic.generate(synthetic.make_plan(**DATASET))
+        short_links.backfill()
+        viewer = User.objects.filter(
+            pk__in=Follow.objects.values('user_id')
+        ).order_by('id').first()
+        token = Token.objects.create(user=viewer)
+        authorized = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        client = Client()
+        cases = build_cases(rng)
+        results = {}
+        # Раунды чередуют сценарии, и фоновая нагрузка машины меньше
+        # влияет на отдельный сценарий; берется лучший раунд по p50.
+        for _ in range(args.rounds):
+            for name, needs_auth, paths in cases:
+                headers = authorized if needs_auth else {}
+                arguments = [
+                    paths[number % len(paths)]
+                    for number in range(args.requests)
+                ]
+                stats = measure(
+                    lambda path: fetch(client, headers, path), arguments
+                )
+                if name not in results or (
+                    stats['p50_ms'] < results[name]['p50_ms']
+                ):
+                    results[name] = stats
+        for name, needs_auth, paths in cases:
+            stats = results[name]
+            stats['queries'] = count_queries(
+                client, authorized if needs_auth else {}, paths
+            )
+            print(f'{format_stats(name, stats)} sql={stats["queries"]:3}')
+        click_counter.flush()
+
+    if args.update or not os.path.exists(baseline_path):
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as file:
+            json.dump(
+                {'dataset': DATASET, 'results': results}, file,
+                ensure_ascii=False, indent=2, sort_keys=True,
+            )
+        print(f'Базовая линия записана в {baseline_path}')
+        return
+
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    if baseline['dataset'] != DATASET:
+        sys.exit(
+            'Базовая линия снята на других данных, запустите с --update'
+        )
+    regressions = compare(
+        results, baseline['results'], args.threshold, args.min_delta_ms
+    )
+    if regressions:
+        print('Регрессии:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+    print(f'Регрессий нет (порог {args.threshold:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Лента подписок на синтетическом графе подписчиков.
+
+Сравнивает чтение ленты из таблицы ``FeedEntry`` (с подмешиванием
+рецептов популярных авторов) с наивным запросом
+``Recipe.objects.filter(author__following__user=...)`` для первой
+страницы и для страницы в глубине ленты, а также измеряет стоимость
+раскладки нового рецепта по лентам подписчиков. Популярность авторов
+распределена по закону Ципфа, поэтому у нескольких авторов подписчиков
+больше порога ``--celebrity-followers``.
+
+Запуск: ``python -m benchmarks.feed [--users N] [--authors N]``.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.utils import (
+    format_stats, measure, setup, summarize, temporary_database
+)
+
+setup()
+
+from django.test.utils import override_settings  # noqa: E402
+
+from recipes import timeline  # noqa: E402
+from recipes.models import FeedEntry, Recipe  # noqa: E402
+from users.models import Follow, User  # noqa: E402
+
+BATCH_SIZE = 5000
+PAGE_SIZE = 10
+
+
+def generate_graph(args, rng):
+    User.objects.bulk_create(
+        User(
+            email=f'user{number}@example.com', username=f'user{number}',
+            password='!',
+        )
+        for number in range(args.users)
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+    author_ids = user_ids[:args.authors]
+    for start in range(0, len(author_ids), BATCH_SIZE // args.recipes):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author_id=author_id, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='recipes/images/placeholder.jpg',
+            )
+            for author_id in author_ids[
+                start:start + BATCH_SIZE // args.recipes
+            ]
+            for number in range(args.recipes)
+        )
+    weights = [1 / (rank + 1) for rank in range(len(author_ids))]
+    follows = []
+    for user_id in user_ids:
+        followed = set(rng.choices(author_ids, weights, k=args.follows))
+        followed.discard(user_id)
+        follows.extend(
+            Follow(user_id=user_id, author_id=author_id)
+            for author_id in followed
+        )
+    Follow.objects.bulk_create(follows, batch_size=BATCH_SIZE)
+    return user_ids, author_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--authors', type=int, default=300)
+    parser.add_argument('--recipes', type=int, default=200)
+    parser.add_argument('--follows', type=int, default=150)
+    parser.add_argument('--celebrity-followers', type=int, default=150)
+    parser.add_argument('--backfill', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with temporary_database(), override_settings(
+        FEED_FANOUT_MAX_FOLLOWERS=args.celebrity_followers,
+        FEED_BACKFILL_LIMIT=args.backfill,
+    ):
+        user_ids, author_ids = generate_graph(args, rng)
+        timeline.forget_celebrities()
+        started = time.perf_counter()
+        for batch in timeline.user_batches():
+            timeline.rebuild(batch)
+        rebuild_seconds = time.perf_counter() - started
+        users = list(User.objects.filter(
+            pk__in=rng.sample(user_ids, min(args.queries, len(user_ids)))
+        ))
+
+        def naive_recipes(user):
+            return Recipe.objects.filter(
+                author__following__user=user
+            ).order_by('-pub_date', '-id').values_list('pub_date', 'id')
+
+        positions = {}
+        for user in users:
+            keys = list(naive_recipes(user)[args.depth:args.depth + 1])
+            positions[user.pk] = keys[0] if keys else None
+
+        print(
+            f'Пользователей: {args.users}, авторов: {args.authors}, '
+            f'подписок: {Follow.objects.count()}, '
+            f'записей лент: {FeedEntry.objects.count()}, '
+            f'популярных авторов: {len(timeline.celebrity_ids())}'
+        )
+        print(f'Пересборка всех лент: {rebuild_seconds:.2f} с')
+        print(format_stats('Наивно, первая страница', measure(
+            lambda user: list(naive_recipes(user)[:PAGE_SIZE]), users
+        )))
+        print(format_stats('Лента, первая страница', measure(
+            lambda user: timeline.page(user, None, PAGE_SIZE), users
+        )))
+        print(format_stats(f'Наивно, OFFSET {args.depth}', measure(
+            lambda user: list(
+                naive_recipes(user)[args.depth:args.depth + PAGE_SIZE]
+            ),
+            users
+        )))
+        print(format_stats(f'Лента, курсор после {args.depth}', measure(
+            lambda user: timeline.page(
+                user, positions[user.pk], PAGE_SIZE
+            ),
+            users
+        )))
+
+        # Раскладка новых рецептов авторов, которые раскладываются.
+        celebrities = timeline.celebrity_ids()
+        regular = [
+            author_id for author_id in author_ids
+            if author_id not in celebrities
+        ][:50]
+        new_recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author_id=author_id, name='Новый рецепт', text='Текст',
+                cooking_time=10, image='recipes/images/placeholder.jpg',
+            )
+            for author_id in regular
+        )
+        timings = []
+        for recipe in new_recipes:
+            started = time.perf_counter()
+            timeline.fan_out(recipe.pk)
+            timings.append(time.perf_counter() - started)
+        print(format_stats('Раскладка нового рецепта', summarize(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Сравнение поиска ингредиентов по префиксу: ORM и индекс в памяти.
+
+Запуск: ``python -m benchmarks.ingredient_search [--iterations N]``.
+"""
+import argparse
+import csv
+import random
+
+from benchmarks.utils import (
+    format_stats, measure, setup, temporary_database
+)
+
+setup()
+
+from django.conf import settings  # noqa: E402
+
+from api.filters import IngredientFilter  # noqa: E402
+from api.ingredient_index import IngredientIndex  # noqa: E402
+from recipes.models import Ingredient  # noqa: E402
+
+
+def load_catalog():
+    path = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+    with open(path, encoding='utf-8') as file:
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in csv.reader(file)
+        )
+
+
+def make_prefixes(iterations, seed):
+    """Префиксы длиной 1–4 символа, как при наборе в автодополнении."""
+    names = list(Ingredient.objects.values_list('name', flat=True))
+    rng = random.Random(seed)
+    return [
+        name[:rng.randint(1, 4)]
+        for name in (rng.choice(names) for _ in range(iterations))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with temporary_database():
+        load_catalog()
+        prefixes = make_prefixes(args.iterations, args.seed)
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        queryset = Ingredient.objects.all()
+
+        def orm_search(prefix):
+            return list(
+                IngredientFilter({'name': prefix}, queryset=queryset).qs
+                .values('id', 'name', 'measurement_unit')
+            )
+
+        index = IngredientIndex()
+        index.build()
+
+        def index_search(prefix):
+            return index.search(prefix, limit=limit)
+
+        print(f'Ингредиентов: {queryset.count()}, запросов: {len(prefixes)}')
+        print(format_stats('ORM name__istartswith', measure(
+            orm_search, prefixes
+        )))
+        print(format_stats('Индекс в памяти', measure(
+            index_search, prefixes
+        )))
+
+
+if __name__ == '__main__':
+    main()
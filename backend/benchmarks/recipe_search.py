@@ -0,0 +1,109 @@
+"""Задержка поиска рецептов на большом синтетическом корпусе.
+
+Сравнивает нативный индекс (FTS5 на SQLite, tsvector и pg_trgm на
+PostgreSQL) с наивным ``icontains`` по названию и описанию.
+
+Запуск: ``python -m benchmarks.recipe_search [--recipes N]``.
+"""
+import argparse
+import csv
+import random
+
+from benchmarks.utils import (
+    format_stats, measure, setup, temporary_database
+)
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.db.models import Q  # noqa: E402
+
+from recipes import search  # noqa: E402
+from recipes.models import Recipe  # noqa: E402
+from users.models import User  # noqa: E402
+
+DISHES = (
+    'суп', 'салат', 'пирог', 'запеканка', 'рагу', 'каша', 'омлет',
+    'котлеты', 'плов', 'борщ', 'блины', 'паста', 'соус', 'десерт',
+)
+BATCH_SIZE = 5000
+PAGE_SIZE = 10
+
+
+def catalog_words():
+    path = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+    with open(path, encoding='utf-8') as file:
+        return [
+            word for name, _ in csv.reader(file)
+            for word in name.split() if len(word) > 3
+        ]
+
+
+def generate_corpus(count, rng):
+    words = catalog_words()
+    author = User.objects.create_user(
+        email='bench@example.com', username='bench', password='bench'
+    )
+    for start in range(0, count, BATCH_SIZE):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'{rng.choice(DISHES)} {rng.choice(words)}',
+                text=' '.join(rng.choices(words, k=30)),
+                cooking_time=rng.randint(5, 120),
+                image='recipes/images/placeholder.jpg',
+            )
+            for _ in range(min(BATCH_SIZE, count - start))
+        )
+    # bulk_create не отправляет сигналы, поэтому индекс заполняется явно.
+    search.rebuild_index()
+    return words
+
+
+def make_queries(words, count, rng):
+    queries = []
+    for _ in range(count):
+        word = rng.choice(words)
+        queries.append(rng.choice((
+            word,
+            word[:max(3, len(word) - 2)],
+            f'{rng.choice(DISHES)} {word}',
+        )))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=50_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with temporary_database():
+        words = generate_corpus(args.recipes, rng)
+        queries = make_queries(words, args.queries, rng)
+        recipes = Recipe.objects.all()
+
+        def indexed(query):
+            results = search.search_recipes(recipes, query)
+            return results.count(), list(results[:PAGE_SIZE])
+
+        def naive(query):
+            condition = Q()
+            for term in query.split():
+                condition &= Q(name__icontains=term) | Q(text__icontains=term)
+            results = recipes.filter(condition)
+            return results.count(), list(results[:PAGE_SIZE])
+
+        print(f'Рецептов: {args.recipes}, запросов: {len(queries)}')
+        print(format_stats('Индекс (страница + count)', measure(
+            indexed, queries, warmup=5
+        )))
+        print(format_stats('icontains (страница + count)', measure(
+            naive, queries, warmup=5
+        )))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+"""Нагрузка на запущенный сервер по сценариям Postman-коллекции и логам.
+
+Каждая верхняя папка ``postman_collection/foodgram.postman_collection.json``
+становится сценарием, а запросы папки выполняются по порядку с
+авторизацией и телами из коллекции. Переменные, которые тесты коллекции
+сохраняют через ``pm.collectionVariables.set`` (id пользователей и
+рецептов, токены), извлекаются из ответов. У каждого виртуального
+пользователя свои учетные записи: к именам и адресам почты из
+переменных коллекции добавляется его метка.
+
+Виртуальный пользователь один раз проходит сценарии ``SETUP``
+(регистрация, ингредиенты, рецепты), затем до конца этапа выбирает
+сценарии случайно с весами ``--weight``. Лог запросов в формате JSON
+Lines (``{"method": "GET", "path": "/api/recipes/", "auth": true}``,
+необязательно ``"body"``) добавляет сценарий ``log``: каждая итерация
+отправляет ``LOG_BATCH`` случайных строк лога.
+
+Этапы ``--stages`` задают число виртуальных пользователей; они
+распределяются по ``--processes`` процессам, внутри процесса каждый
+пользователь работает в своем потоке. Для каждого маршрута выводятся
+пропускная способность и перцентили на каждом этапе, доля ошибок
+(5xx и сбои соединения) и ответов 4xx, гистограмма задержек последнего
+этапа и точка насыщения — этап, после которого рост нагрузки
+увеличивает пропускную способность меньше чем на ``SATURATION_GAIN``.
+
+Запуск::
+
+    gunicorn foodgram.wsgi -w 4 -b 127.0.0.1:8000
+    python -m benchmarks.replay --stages 1,2,4,8 --duration 30 \\
+        --log access.jsonl --weight log=3 --json replay.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from multiprocessing import Pool
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+from benchmarks.utils import percentile
+
+COLLECTION = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'postman_collection',
+    'foodgram.postman_collection.json',
+)
+SETUP = ('register_and_get_tokens', 'ingredients', 'recipes')
+LOG = 'log'
+DEFAULT_WEIGHTS = {
+    'register_and_get_tokens': 0,
+    'users': 3,
+    'ingredients': 3,
+    'recipes': 2,
+    'subscriptions': 1,
+    'shopping_cart': 1,
+    'favorite': 2,
+    'recipe_filters_for_favorite_and_shopping_cart': 3,
+    'delete_requests': 0,
+    LOG: 1,
+}
+# Переменные коллекции, которые должны различаться у пользователей.
+IDENTITY_VARIABLES = (
+    'username', 'email', 'secondUserUsername', 'secondUserEmail',
+    'thirdUserUsername', 'thirdUserEmail',
+)
+LOG_BATCH = 10
+TIMEOUT = 30
+SATURATION_GAIN = 0.1
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+HISTOGRAM_WIDTH = 40
+
+VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+CAPTURE = re.compile(
+    r'pm\.collectionVariables\.set\(\s*["\'](\w+)["\']\s*,\s*(.+?)\)\s*;?\s*$',
+    re.MULTILINE,
+)
+ALIAS = re.compile(r'const (\w+) = _\.get\(responseData, "(\w+)"\)')
+EXPRESSION = re.compile(
+    r'responseData(?:\[(\d+)\])?\.(\w+)(?:\.slice\(0,\s*(\d+)\))?$'
+)
+
+
+def load_collection(path, bad_requests=False):
+    """Возвращает переменные и сценарии коллекции {папка: [запрос]}.
+
+    Папки ``*bad_requests`` пропускаются, если не указан bad_requests.
+    """
+    with open(path, encoding='utf-8') as file:
+        collection = json.load(file)
+    variables = {
+        variable['key']: variable['value']
+        for variable in collection.get('variable', [])
+    }
+    scenarios = {
+        folder['name'].split('//')[0].strip(): list(
+            _steps(folder, collection.get('auth'), bad_requests)
+        )
+        for folder in collection['item']
+    }
+    return variables, scenarios
+
+
+def load_log(path):
+    """Возвращает запросы лога в виде шагов сценария."""
+    steps = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                method, target = entry['method'].upper(), entry['path']
+            except (ValueError, KeyError, AttributeError, TypeError):
+                raise ValueError(
+                    f'{path}, строка {number}: нужны method и path'
+                )
+            parts = urlsplit(target)
+            body = entry.get('body')
+            steps.append({
+                'name': f'{method} {target}',
+                'method': method,
+                'url': '{{baseUrl}}' + parts.path + (
+                    f'?{parts.query}' if parts.query else ''
+                ),
+                'headers': (
+                    {'Authorization': 'Token {{userToken}}'}
+                    if entry.get('auth') else {}
+                ) | (
+                    {'Content-Type': 'application/json'}
+                    if body is not None else {}
+                ),
+                'body': (
+                    body if body is None or isinstance(body, str)
+                    else json.dumps(body, ensure_ascii=False)
+                ),
+                'captures': {},
+            })
+    return steps
+
+
+def endpoint(method, url):
+    """Ключ маршрута: метод, путь с {id} вместо чисел и имена параметров."""
+    parts = urlsplit(url)
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', VARIABLE.sub('{id}', parts.path))
+    query = '&'.join(sorted({
+        key for key, _ in parse_qsl(parts.query, keep_blank_values=True)
+    }))
+    return f'{method} {path}' + (f'?{query}' if query else '')
+
+
+class VirtualUser:
+    """Пользователь со своей сессией HTTP и переменными коллекции."""
+
+    def __init__(self, base_url, variables, tag, records):
+        self.session = requests.Session()
+        self.variables = dict(variables, baseUrl=base_url.rstrip('/'))
+        for key in IDENTITY_VARIABLES:
+            if key in self.variables:
+                self.variables[key] = _personalize(self.variables[key], tag)
+        self.records = records
+
+    def run(self, steps, deadline):
+        """Выполняет шаги по порядку, пока не истекло время этапа."""
+        for step in steps:
+            if time.monotonic() >= deadline:
+                return
+            self.send(step)
+
+    def send(self, step):
+        url = self._render(step['url'])
+        body = step['body']
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                step['method'], url,
+                headers={
+                    key: self._render(value)
+                    for key, value in step['headers'].items()
+                },
+                data=self._render(body).encode() if body else None,
+                timeout=TIMEOUT,
+            )
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.records.append((
+            endpoint(step['method'], url),
+            time.perf_counter() - started,
+            status,
+        ))
+        if response is not None and status < 400 and step['captures']:
+            self._capture(step['captures'], response)
+
+    def _render(self, text):
+        return VARIABLE.sub(
+            lambda match: str(self.variables.get(match[1], match[0])), text
+        )
+
+    def _capture(self, captures, response):
+        try:
+            data = response.json()
+        except ValueError:
+            return
+        for variable, (index, field, length) in captures.items():
+            try:
+                value = (data if index is None else data[index])[field]
+            except (IndexError, KeyError, TypeError):
+                continue
+            self.variables[variable] = (
+                value if length is None else str(value)[:length]
+            )
+
+
+def run_process(job):
+    """Запускает виртуальных пользователей процесса на время этапа."""
+    config, users, duration, tag = job
+    records = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_virtual_user,
+            args=(config, f'{tag}u{number}', deadline, records),
+        )
+        for number in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def summarize_records(records, users, duration):
+    """Статистика этапа по маршрутам и в целом."""
+    by_endpoint = {}
+    for key, seconds, status in records:
+        by_endpoint.setdefault(key, []).append((seconds, status))
+    by_endpoint['*'] = [(seconds, status) for _, seconds, status in records]
+    return {
+        key: _stats(samples, users, duration)
+        for key, samples in by_endpoint.items()
+    }
+
+
+def saturation(stages):
+    """Возвращает этап, после которого пропускная способность не растет."""
+    for previous, current in zip(stages, stages[1:]):
+        if current['rps'] < previous['rps'] * (1 + SATURATION_GAIN):
+            return previous
+    return None
+
+
+def report(stage_results):
+    """Печатает отчет по этапам и маршрутам."""
+    for stats in stage_results:
+        total = stats['*']
+        print(
+            f'{total["users"]:>4} VU: {total["count"]:>7} запросов '
+            f'{total["rps"]:8.1f} rps, ошибок {total["errors"]:6.2%}, '
+            f'4xx {total["client_errors"]:6.2%}, '
+            f'p50={total["p50_ms"]:.1f}ms p95={total["p95_ms"]:.1f}ms'
+        )
+    keys = sorted({
+        key for stats in stage_results for key in stats if key != '*'
+    })
+    for key in ['*'] + keys:
+        stages = [stats[key] for stats in stage_results if key in stats]
+        print(f'\n{"Все маршруты" if key == "*" else key}')
+        print(
+            f'{"VU":>6} {"rps":>8} {"p50,ms":>8} {"p95,ms":>8} '
+            f'{"p99,ms":>8} {"ошибки":>7} {"4xx":>7}'
+        )
+        for stats in stages:
+            print(
+                f'{stats["users"]:>6} {stats["rps"]:8.1f} '
+                f'{stats["p50_ms"]:8.1f} {stats["p95_ms"]:8.1f} '
+                f'{stats["p99_ms"]:8.1f} {stats["errors"]:7.2%} '
+                f'{stats["client_errors"]:7.2%}'
+            )
+        point = saturation(stages)
+        print(
+            f'Насыщение: {point["users"]} VU, {point["rps"]:.1f} rps'
+            if point else 'Насыщение не достигнуто'
+        )
+        _print_histogram(stages[-1]['histogram'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--collection', default=COLLECTION)
+    parser.add_argument('--log', help='Лог запросов в формате JSON Lines')
+    parser.add_argument(
+        '--stages', default='1,2,4,8',
+        help='Числа виртуальных пользователей на этапах через запятую',
+    )
+    parser.add_argument(
+        '--duration', type=float, default=30,
+        help='Длительность этапа в секундах',
+    )
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument(
+        '--weight', action='append', default=[], metavar='СЦЕНАРИЙ=ВЕС',
+        help='Вес сценария (папки коллекции или log); 0 отключает',
+    )
+    parser.add_argument(
+        '--bad-requests', action='store_true',
+        help='Выполнять и запросы из папок *bad_requests',
+    )
+    parser.add_argument(
+        '--tag', default=format(int(time.time()), 'x'),
+        help='Метка запуска в именах создаваемых пользователей',
+    )
+    parser.add_argument('--json', help='Записать результаты в файл')
+    args = parser.parse_args()
+
+    variables, scenarios = load_collection(
+        args.collection, args.bad_requests
+    )
+    weights = {name: DEFAULT_WEIGHTS.get(name, 1) for name in scenarios}
+    if args.log:
+        scenarios[LOG] = load_log(args.log)
+        weights[LOG] = DEFAULT_WEIGHTS[LOG]
+    for option in args.weight:
+        name, _, weight = option.partition('=')
+        if name not in weights:
+            parser.error(f'Неизвестный сценарий {name}')
+        weights[name] = float(weight)
+    config = {
+        'url': args.url,
+        'variables': variables,
+        'scenarios': scenarios,
+        'weights': weights,
+    }
+
+    stage_results = []
+    for stage, users in enumerate(
+        int(value) for value in args.stages.split(',')
+    ):
+        processes = min(args.processes, users)
+        jobs = [
+            (
+                config,
+                users // processes + (number < users % processes),
+                args.duration,
+                f'{args.tag}s{stage}p{number}',
+            )
+            for number in range(processes)
+        ]
+        with Pool(processes) as pool:
+            records = [
+                record for part in pool.map(run_process, jobs)
+                for record in part
+            ]
+        stage_results.append(
+            summarize_records(records, users, args.duration)
+        )
+    report(stage_results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(stage_results, file, ensure_ascii=False, indent=2)
+
+
+def _steps(item, auth, bad_requests):
+    if 'item' not in item:
+        yield _step(item, auth)
+        return
+    if not bad_requests and item['name'].endswith('bad_requests'):
+        return
+    auth = item.get('auth') or auth
+    for child in item['item']:
+        yield from _steps(child, auth, bad_requests)
+
+
+def _step(item, auth):
+    request = item['request']
+    auth = request.get('auth') or auth
+    headers = {
+        header['key']: header['value']
+        for header in request.get('header', [])
+        if not header.get('disabled')
+    }
+    if auth and auth['type'] == 'apikey':
+        fields = {field['key']: field['value'] for field in auth['apikey']}
+        headers[fields.get('key', 'Authorization')] = fields['value']
+    body = request.get('body') or {}
+    if body.get('mode') == 'raw' and body.get('raw'):
+        headers.setdefault('Content-Type', 'application/json')
+    url = request['url']
+    return {
+        'name': item['name'],
+        'method': request['method'],
+        'url': url['raw'] if isinstance(url, dict) else url,
+        'headers': headers,
+        'body': body.get('raw') if body.get('mode') == 'raw' else None,
+        'captures': _captures(item),
+    }
+
+
+def _captures(item):
+    """Переменные, которые тест запроса сохраняет из ответа."""
+    captures = {}
+    for event in item.get('event', []):
+        if event['listen'] != 'test':
+            continue
+        source = '\n'.join(event['script'].get('exec', []))
+        aliases = dict(ALIAS.findall(source))
+        for variable, expression in CAPTURE.findall(source):
+            if expression in aliases:
+                captures[variable] = (None, aliases[expression], None)
+                continue
+            match = EXPRESSION.match(expression)
+            if match:
+                index, field, length = match.groups()
+                captures[variable] = (
+                    None if index is None else int(index),
+                    field,
+                    None if length is None else int(length),
+                )
+    return captures
+
+
+def _personalize(value, tag):
+    quoted = value.startswith('"') and value.endswith('"')
+    text = value.strip('"')
+    local, at, domain = text.partition('@')
+    text = f'{local}-{tag}{at}{domain}'
+    return f'"{text}"' if quoted else text
+
+
+def _virtual_user(config, tag, deadline, records):
+    rng = random.Random(tag)
+    user = VirtualUser(config['url'], config['variables'], tag, records)
+    for name in SETUP:
+        user.run(config['scenarios'].get(name, []), deadline)
+    names = [name for name, weight in config['weights'].items() if weight]
+    weights = [config['weights'][name] for name in names]
+    if not names:
+        return
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        steps = config['scenarios'][name]
+        if name == LOG:
+            steps = rng.choices(steps, k=LOG_BATCH)
+        user.run(steps, deadline)
+
+
+def _stats(samples, users, duration):
+    timings = sorted(seconds for seconds, _ in samples)
+    statuses = [status for _, status in samples]
+    histogram = [0] * (len(HISTOGRAM_MS) + 1)
+    for seconds in timings:
+        histogram[_bucket(seconds * 1000)] += 1
+    return {
+        'users': users,
+        'count': len(samples),
+        'rps': len(samples) / duration,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'errors': sum(
+            status == 0 or status >= 500 for status in statuses
+        ) / len(samples),
+        'client_errors': sum(
+            400 <= status < 500 for status in statuses
+        ) / len(samples),
+        'histogram': histogram,
+    }
+
+
+def _bucket(milliseconds):
+    for index, bound in enumerate(HISTOGRAM_MS):
+        if milliseconds <= bound:
+            return index
+    return len(HISTOGRAM_MS)
+
+
+def _print_histogram(histogram):
+    largest = max(histogram) or 1
+    labels = [f'<={bound}ms' for bound in HISTOGRAM_MS] + [
+        f'>{HISTOGRAM_MS[-1]}ms'
+    ]
+    for label, count in zip(labels, histogram):
+        if count:
+            bar = '#' * max(1, count * HISTOGRAM_WIDTH // largest)
+            print(f'  {label:>9} {count:>7} {bar}')
+
+
+if __name__ == '__main__':
+    main()
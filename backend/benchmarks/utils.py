@@ -0,0 +1,83 @@
+"""Общие средства для бенчмарков.
+
+Бенчмарки запускаются из каталога backend как модули, например
+``python -m benchmarks.ingredient_search``, и работают во временной
+тестовой базе данных, не затрагивая рабочие данные.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    """Настраивает Django для запуска бенчмарка как отдельного модуля.
+
+    Метрики Server-Timing отключаются: они искажают измерения.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    os.environ['SERVER_TIMING'] = 'False'
+    django.setup()
+
+
+@contextmanager
+def temporary_database():
+    """Создает тестовую базу данных с миграциями и удаляет ее после."""
+    from django.test.utils import (
+        setup_databases, setup_test_environment, teardown_databases,
+        teardown_test_environment
+    )
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(sorted_values, fraction):
+    """Возвращает перцентиль отсортированной выборки."""
+    if not sorted_values:
+        return 0.0
+    index = min(
+        len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1)))
+    )
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """Сводит длительности (в секундах) в статистику в миллисекундах."""
+    ordered = sorted(timings)
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'mean_ms': total / len(ordered) * 1000 if ordered else 0.0,
+        'rps': len(ordered) / total if total else 0.0,
+    }
+
+
+def measure(func, arguments, warmup=10):
+    """Вызывает func для каждого аргумента и возвращает статистику."""
+    for argument in arguments[:warmup]:
+        func(argument)
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        func(argument)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def format_stats(name, stats):
+    """Форматирует строку отчета."""
+    return (
+        f'{name:<32} p50={stats["p50_ms"]:8.3f}ms '
+        f'p95={stats["p95_ms"]:8.3f}ms p99={stats["p99_ms"]:8.3f}ms '
+        f'rps={stats["rps"]:10.1f}'
+    )
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.timing.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,6 +77,55 @@ else:
         }
     }
 
+# Кэш default хранит фрагменты представлений рецептов: их ключи включают
+# версии данных, поэтому кэш может быть своим у каждого процесса.
+# Версии данных и счетчики хранятся в кэше shared, общем для всех
+# воркеров и команд управления: file по умолчанию или redis.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'foodgram',
+    'file': str(BASE_DIR / 'cache'),
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": os.getenv(
+            'CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]
+        ),
+        "TIMEOUT": int(os.getenv('CACHE_TIMEOUT', 3600)),
+    }
+}
+SHARED_CACHE_BACKEND = os.getenv(
+    'SHARED_CACHE_BACKEND', 'redis' if CACHE_BACKEND == 'redis' else 'file'
+)
+CACHES['shared'] = {
+    "BACKEND": CACHE_BACKENDS[SHARED_CACHE_BACKEND],
+    "LOCATION": os.getenv(
+        'SHARED_CACHE_LOCATION',
+        str(BASE_DIR / 'cache' / 'shared')
+        if SHARED_CACHE_BACKEND == 'file'
+        else CACHE_LOCATIONS[SHARED_CACHE_BACKEND],
+    ),
+    "TIMEOUT": None,
+}
+for alias, backend in (
+    ('default', CACHE_BACKEND), ('shared', SHARED_CACHE_BACKEND)
+):
+    if backend != 'redis':
+        CACHES[alias]['OPTIONS'] = {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10_000)),
+        }
+
+RECIPE_FRAGMENT_CACHE = (
+    os.getenv('RECIPE_FRAGMENT_CACHE', 'True').lower() == 'true'
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -105,6 +155,16 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    "default": {
+        "BACKEND": "recipes.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+MEDIA_GC_GRACE_SECONDS = 24 * 60 * 60
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = 'users.User'
@@ -144,4 +204,47 @@ MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32_000
 MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 32_000
-
+INGREDIENT_SEARCH_LIMIT = 50
+BULK_RELATION_MAX_IDS = 100
+FEED_FANOUT_MAX_FOLLOWERS = 10_000
+FEED_CELEBRITIES_TIMEOUT = 10 * 60
+FEED_BACKFILL_LIMIT = 50
+FEED_PENDING_DELAY = 60
+FEED_WORKERS = 2
+SHORT_LINK_CACHE_SIZE = 10_000
+SHORT_LINK_LOCAL_TIMEOUT = 30
+SHORT_LINK_NEGATIVE_TIMEOUT = 60
+SHORT_LINK_CLICKS_FLUSH_INTERVAL = 10
+SHORT_LINK_CLICKS_FLUSH_THRESHOLD = 1000
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_HEADER_PEEK = 64 * 1024
+IMAGE_RENDITION_WIDTHS = (320, 640, 1280)
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_PIPELINE_WORKERS = 2
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+# Метрики запросов: заголовок Server-Timing и строка JSON в логе
+# api.timing. Текст SQL пишется для доли SQL_SAMPLE_RATE запросов,
+# при заданном SQL_SAMPLE_VIEWS — только для перечисленных
+# представлений (например, RecipeViewSet.list,UserViewSet.subscriptions).
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False').lower() == 'true'
+SQL_SAMPLE_RATE = float(os.getenv('SQL_SAMPLE_RATE', 0))
+SQL_SAMPLE_VIEWS = [
+    name for name in os.getenv('SQL_SAMPLE_VIEWS', '').split(',') if name
+]
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': os.getenv('SERVER_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
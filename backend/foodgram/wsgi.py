@@ -10,7 +10,17 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
 application = get_wsgi_application()
+
+# Индекс ингредиентов строится при старте воркера, чтобы первый запрос
+# автодополнения не ждал загрузки каталога.
+from api.ingredient_index import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.build()
+except DatabaseError:
+    pass
@@ -4,18 +4,19 @@
 """
 import os
 import sys
-import json
 import django
 
 # Настройка Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 django.setup()
 
-from recipes.models import Ingredient
-
 
 def load_ingredients():
     """Загрузка ингредиентов из JSON файла."""
+    # Модули приложений импортируются после django.setup().
+    from api import versioning
+    from recipes import ingredient_loader
+
     print("Загрузка ингредиентов...")
 
     # Путь к файлу с ингредиентами
@@ -27,24 +28,18 @@ def load_ingredients():
 
     try:
         with open(ingredients_file, 'r', encoding='utf-8') as f:
-            ingredients_data = json.load(f)
-
-        # Очищаем существующие ингредиенты
-        Ingredient.objects.all().delete()
-
-        # Загружаем новые ингредиенты
-        ingredients_to_create = []
-        for item in ingredients_data:
-            ingredient = Ingredient(
-                name=item['name'],
-                measurement_unit=item['measurement_unit']
+            # Существующие ингредиенты не удаляются, чтобы не потерять
+            # ингредиенты рецептов; добавляются только новые.
+            result = ingredient_loader.load(
+                ingredient_loader.read_rows(f, 'json')
             )
-            ingredients_to_create.append(ingredient)
-
-        # Массовое создание для ускорения
-        Ingredient.objects.bulk_create(ingredients_to_create, batch_size=1000)
+        if result.inserted:
+            versioning.bump_version(versioning.INGREDIENTS)
 
-        print(f"Загружено {len(ingredients_to_create)} ингредиентов")
+        print(
+            f"Добавлено {result.inserted} ингредиентов, "
+            f"без изменений {result.unchanged}"
+        )
 
     except Exception as e:
         print(f"Ошибка при загрузке ингредиентов: {e}")
@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
+from . import shopping_list
 from .models import (
     Ingredient, Tag, Recipe, RecipeIngredient,
-    Favorite, ShoppingCart, ShortLink
+    Favorite, ShoppingCart, ShoppingListItem, ShortLink
 )
 
 
@@ -48,6 +49,11 @@ class RecipeAdmin(admin.ModelAdmin):
     filter_horizontal = ('tags',)
     inlines = (RecipeIngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        """Переносит правки состава в списки покупок."""
+        with shopping_list.tracking_recipes(form.instance.pk):
+            super().save_related(request, form, formsets, change)
+
     def get_favorites_count(self, obj):
         """Возвращает количество добавлений в избранное."""
         return obj.favorites.count()
@@ -70,6 +76,24 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
     list_filter = ('recipe', 'ingredient')
 
+    def save_model(self, request, obj, form, change):
+        """Переносит правку в списки покупок старого и нового рецепта."""
+        with shopping_list.tracking_recipes(
+            form.initial.get('recipe'), obj.recipe_id
+        ):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        """Вычитает удаленный ингредиент из списков покупок."""
+        with shopping_list.tracking_recipes(obj.recipe_id):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """Вычитает удаленные ингредиенты из списков покупок."""
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        with shopping_list.tracking_recipes(*recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -87,9 +111,21 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user', 'recipe')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Админка для сумм ингредиентов в списках покупок."""
+
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    list_filter = ('user',)
+    readonly_fields = ('user', 'ingredient', 'amount')
+
+
 @admin.register(ShortLink)
 class ShortLinkAdmin(admin.ModelAdmin):
     """Админка для коротких ссылок."""
 
-    list_display = ('id', 'recipe', 'short_code')
-    readonly_fields = ('short_code',)
+    list_display = ('id', 'recipe', 'short_code', 'clicks')
+    readonly_fields = ('short_code', 'clicks')
+    ordering = ('-clicks',)
+    list_select_related = ('recipe',)
+    show_full_result_count = False
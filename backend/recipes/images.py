@@ -0,0 +1,187 @@
+"""Обработка загружаемых изображений и их уменьшенные копии.
+
+При загрузке размеры изображения проверяются по заголовку до декодирования
+пикселей, затем изображение поворачивается по EXIF и пересохраняется без
+метаданных. Уменьшенные копии (ширины ``IMAGE_RENDITION_WIDTHS`` в
+форматах ``IMAGE_RENDITION_FORMATS``) строятся в пуле потоков после
+сохранения объекта, а недостающие создаются при первом запросе.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'renditions'
+# Каталоги исходных изображений, для которых строятся копии.
+SOURCE_DIRS = ('recipes/images/', 'users/avatars/')
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'WEBP': {'quality': 80, 'method': 4},
+    'PNG': {'optimize': True},
+}
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+# Снимки MPO с телефонов — это JPEG с дополнительными кадрами.
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Блокировки по хэшу пути: копии разных изображений строятся параллельно,
+# а одна и та же копия не строится дважды в одном процессе.
+_render_locks = [threading.Lock() for _ in range(64)]
+
+
+class ImageRejected(ValueError):
+    """Изображение не может быть принято."""
+
+
+class ImageTooLarge(ImageRejected):
+    """Размеры изображения превышают допустимые."""
+
+
+def check_dimensions(file):
+    """Проверяет размеры по заголовку, не декодируя изображение."""
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError):
+        raise ImageRejected('Файл не является изображением.')
+    finally:
+        file.seek(0)
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Изображение слишком большое: {width}×{height} пикселей.'
+        )
+    return width, height
+
+
+def sanitize(file, name):
+    """Возвращает копию изображения без метаданных EXIF, XMP и ICC."""
+    check_dimensions(file)
+    try:
+        with Image.open(file) as image:
+            image_format = FORMAT_ALIASES.get(image.format, image.format)
+            image = ImageOps.exif_transpose(image)
+            # Из служебных данных сохраняется только прозрачность.
+            image.info = {
+                key: value for key, value in image.info.items()
+                if key == 'transparency'
+            }
+            if image_format not in SAVE_OPTIONS:
+                image_format = 'PNG'
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, image_format, **SAVE_OPTIONS[image_format])
+    except (Image.DecompressionBombError, OSError, ValueError):
+        raise ImageRejected('Не удалось обработать изображение.')
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    return ContentFile(
+        output.getvalue(), name=f'{os.path.splitext(name)[0]}.{extension}'
+    )
+
+
+def rendition_name(name, width, image_format):
+    """Путь уменьшенной копии в хранилище."""
+    stem = os.path.splitext(name)[0]
+    return f'{RENDITIONS_DIR}/{stem}/{width}.{EXTENSIONS[image_format]}'
+
+
+def is_valid_rendition(name, width, image_format):
+    """Проверяет, что копия с такими параметрами предусмотрена."""
+    return (
+        name.startswith(SOURCE_DIRS)
+        and width in settings.IMAGE_RENDITION_WIDTHS
+        and image_format in settings.IMAGE_RENDITION_FORMATS
+    )
+
+
+def ensure_rendition(name, width, image_format, storage=default_storage):
+    """Создает уменьшенную копию, если ее еще нет, и возвращает ее путь."""
+    target = rendition_name(name, width, image_format)
+    if not storage.exists(target):
+        with _open_source(name, storage) as image:
+            _save_rendition(image, target, width, image_format, storage)
+    return target
+
+
+def build_renditions(name, storage=default_storage):
+    """Создает все недостающие копии изображения, декодируя его один раз."""
+    missing = [
+        (rendition_name(name, width, image_format), width, image_format)
+        for width in settings.IMAGE_RENDITION_WIDTHS
+        for image_format in settings.IMAGE_RENDITION_FORMATS
+        if not storage.exists(rendition_name(name, width, image_format))
+    ]
+    if not missing:
+        return
+    try:
+        with _open_source(name, storage) as image:
+            for target, width, image_format in missing:
+                _save_rendition(image, target, width, image_format, storage)
+    except (ImageRejected, OSError):
+        logger.exception('Не удалось создать копии изображения %s', name)
+
+
+def schedule_renditions(name):
+    """Ставит построение копий в пул потоков после фиксации транзакции."""
+    if name:
+        transaction.on_commit(lambda: _get_executor().submit(
+            build_renditions, name
+        ))
+
+
+def variant_urls(name, build_url):
+    """Возвращает {формат: {ширина: адрес}} для уменьшенных копий."""
+    if not name:
+        return None
+    return {
+        image_format: {
+            width: build_url(width, image_format, name)
+            for width in settings.IMAGE_RENDITION_WIDTHS
+        }
+        for image_format in settings.IMAGE_RENDITION_FORMATS
+    }
+
+
+def _open_source(name, storage):
+    with storage.open(name) as source:
+        image = Image.open(source)
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageTooLarge('Исходное изображение слишком большое.')
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def _save_rendition(image, target, width, image_format, storage):
+    with _render_locks[hash(target) % len(_render_locks)]:
+        if storage.exists(target):
+            return
+        rendition = image.copy()
+        rendition.thumbnail((width, width * 4))
+        output = io.BytesIO()
+        pil_format = image_format.upper()
+        rendition.save(output, pil_format, **SAVE_OPTIONS[pil_format])
+        storage.save(target, ContentFile(output.getvalue()))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PIPELINE_WORKERS,
+                thread_name_prefix='image-renditions',
+            )
+        return _executor
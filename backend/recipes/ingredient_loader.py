@@ -0,0 +1,170 @@
+"""Потоковая загрузка справочника ингредиентов без удаления строк.
+
+Файл (CSV, JSON-массив или NDJSON) читается по частям, и каждая пачка
+из ``CHUNK_SIZE`` строк сверяется с базой одним запросом: новые пары
+(название, единица измерения) вставляются ``bulk_create`` с
+``ignore_conflicts`` по ограничению ``unique_ingredient``, существующие
+не трогаются. Поэтому рецепты сохраняют свои ингредиенты, а память
+не зависит от размера файла.
+"""
+import csv
+import json
+import os
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from .models import Ingredient
+
+CHUNK_SIZE = 5000
+READ_SIZE = 64 * 1024
+FORMATS = ('csv', 'json', 'ndjson')
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+class LoadError(ValueError):
+    """Файл справочника не удалось разобрать."""
+
+
+@dataclass
+class LoadResult:
+    """Итоги загрузки."""
+
+    inserted: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+
+
+def detect_format(path):
+    """Определяет формат файла по расширению."""
+    try:
+        return EXTENSIONS[os.path.splitext(path)[1].lower()]
+    except KeyError:
+        raise LoadError(f'Неизвестный формат файла {path}.')
+
+
+def read_rows(file, file_format):
+    """Возвращает строки файла как словари или списки."""
+    if file_format == 'csv':
+        return csv.reader(file)
+    if file_format == 'ndjson':
+        return (
+            _decode(line, number)
+            for number, line in enumerate(file, 1) if line.strip()
+        )
+    if file_format == 'json':
+        return _iter_json_array(file)
+    raise LoadError(f'Неизвестный формат {file_format}.')
+
+
+def normalize(row):
+    """Возвращает пару (название, единица) или None для неполной строки."""
+    if isinstance(row, dict):
+        row = (row.get('name'), row.get('measurement_unit'))
+    if not isinstance(row, (list, tuple)) or len(row) < 2:
+        return None
+    if not all(isinstance(value, str) for value in row[:2]):
+        return None
+    name, measurement_unit = row[0].strip(), row[1].strip()
+    if not name or not measurement_unit:
+        return None
+    return name, measurement_unit
+
+
+def load(rows, chunk_size=CHUNK_SIZE, dry_run=False, on_insert=None):
+    """Добавляет недостающие ингредиенты и возвращает LoadResult.
+
+    ``on_insert`` вызывается для каждой новой пары, в том числе
+    в режиме ``dry_run``, когда база не изменяется.
+    """
+    result = LoadResult()
+    # В режиме dry_run пары из прошлых пачек не попадают в базу, поэтому
+    # новые пары запоминаются на всю загрузку, чтобы не считать дважды.
+    planned = set()
+    chunk = {}
+    for row in rows:
+        key = normalize(row)
+        if key is None:
+            result.skipped += 1
+            continue
+        chunk[key] = None
+        if len(chunk) >= chunk_size:
+            _load_chunk(list(chunk), result, dry_run, on_insert, planned)
+            chunk = {}
+    if chunk:
+        _load_chunk(list(chunk), result, dry_run, on_insert, planned)
+    return result
+
+
+def _load_chunk(keys, result, dry_run, on_insert, planned):
+    with transaction.atomic():
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        new = [
+            key for key in keys if key not in existing and key not in planned
+        ]
+        if dry_run:
+            planned.update(new)
+        result.unchanged += len(keys) - len(new)
+        result.inserted += len(new)
+        if on_insert is not None:
+            for key in new:
+                on_insert(*key)
+        if new and not dry_run:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in new
+                ),
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+
+
+def _decode(text, number):
+    try:
+        return json.loads(text)
+    except ValueError as error:
+        raise LoadError(f'Строка {number}: {error}')
+
+
+def _iter_json_array(file):
+    """Разбирает JSON-массив объектов по одному элементу."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (
+                buffer[position].isspace() or buffer[position] == ','
+            ):
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise LoadError('Ожидался JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise LoadError('Некорректный JSON в конце файла.')
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            raise LoadError('JSON-массив не закрыт.')
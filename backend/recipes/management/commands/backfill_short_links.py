@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes import short_links
+
+
+class Command(BaseCommand):
+    """Команда для создания коротких ссылок всех рецептов."""
+
+    help = 'Создание коротких кодов для рецептов, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=short_links.BATCH_SIZE,
+            help='Количество ссылок в одной вставке',
+        )
+
+    def handle(self, *args, **options):
+        created = short_links.backfill(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано коротких ссылок: {created}'
+        ))
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes import media_gc
+
+
+class Command(BaseCommand):
+    """Команда для удаления медиафайлов, на которые нет ссылок."""
+
+    help = 'Удаление изображений, не используемых рецептами и аватарами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество потоков, просматривающих каталоги',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_GC_GRACE_SECONDS,
+            help='Не удалять файлы, измененные за это число секунд',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, которые будут удалены',
+        )
+
+    def handle(self, *args, **options):
+        result = media_gc.collect(
+            workers=options['workers'],
+            grace=timedelta(seconds=options['grace']),
+            dry_run=options['dry_run'],
+        )
+        for name in sorted(result.deleted):
+            self.stdout.write(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {result.scanned}. {action}: '
+            f'{len(result.deleted)} ({result.freed_bytes} байт)'
+        ))
@@ -0,0 +1,104 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes import synthetic
+
+
+class Command(BaseCommand):
+    """Команда для генерации синтетических данных для нагрузочных тестов.
+
+    Пользователи, рецепты и связи создаются пачками в пуле процессов;
+    одинаковые ``--seed`` и ``--chunk-size`` дают одинаковые данные
+    при любом числе процессов.
+    """
+
+    help = 'Генерация синтетических пользователей, рецептов и связей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Количество пользователей',
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=5000,
+            help='Количество рецептов',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20000,
+            help='Количество подписок (повторы отбрасываются)',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=50000,
+            help='Количество записей избранного (повторы отбрасываются)',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10000,
+            help='Количество записей корзин (повторы отбрасываются)',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=3.0,
+            help='Степень неравномерности популярности авторов и рецептов',
+        )
+        parser.add_argument(
+            '--images', type=int, default=len(synthetic.PLACEHOLDER_COLORS),
+            choices=range(1, len(synthetic.PLACEHOLDER_COLORS) + 1),
+            metavar='N',
+            help='Количество общих изображений-заглушек',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора случайных чисел',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=synthetic.CHUNK_SIZE,
+            help='Количество строк, создаваемых процессом за одну задачу',
+        )
+
+        parser.add_argument(
+            '--skip-feeds',
+            action='store_true',
+            help='Не пересобирать ленты подписок (команда rebuild_feed)',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('users', 'recipes', 'follows', 'favorites', 'cart'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть отрицательным')
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError(
+                '--workers и --chunk-size должны быть положительными'
+            )
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            # SQLite допускает одного пишущего: процессы ждали бы друг друга
+            # и получали «database is locked».
+            self.stdout.write('SQLite: данные создаются одним процессом')
+            workers = 1
+        try:
+            plan = synthetic.make_plan(
+                seed=options['seed'],
+                users=options['users'],
+                recipes=options['recipes'],
+                follows=options['follows'],
+                favorites=options['favorites'],
+                cart=options['cart'],
+                skew=options['skew'],
+                images=options['images'],
+                chunk_size=options['chunk_size'],
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        synthetic.generate(
+            plan, workers=workers, feeds=not options['skip_feeds'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Созданы пользователи с id от {plan.first_user_id} и рецепты '
+            f'с id от {plan.first_recipe_id}; пароль «{synthetic.PASSWORD}»'
+        ))
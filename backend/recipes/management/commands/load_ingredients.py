@@ -1,49 +1,75 @@
-import csv
 import os
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from recipes.models import Ingredient
+from api import versioning
+from recipes import ingredient_loader
 
 
 class Command(BaseCommand):
-    """Команда для загрузки ингредиентов из CSV файла."""
+    """Команда для загрузки ингредиентов из CSV, JSON или NDJSON файла.
 
-    help = 'Загрузка ингредиентов из CSV файла'
+    Существующие ингредиенты не удаляются: добавляются только новые
+    пары (название, единица измерения).
+    """
 
-    def handle(self, *args, **options):
-        # Путь к файлу с ингредиентами
-        csv_file_path = os.path.join(
-            settings.BASE_DIR.parent, 'data', 'ingredients.csv'
+    help = 'Загрузка ингредиентов из CSV, JSON или NDJSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR.parent, 'data', 'ingredients.csv'
+            ),
+            help='Путь к файлу (по умолчанию data/ingredients.csv)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=ingredient_loader.FORMATS,
+            help='Формат файла, если он не следует из расширения',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=ingredient_loader.CHUNK_SIZE,
+            help='Количество строк, сверяемых с базой за один запрос',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести ингредиенты, которые будут добавлены',
         )
 
-        if not os.path.exists(csv_file_path):
-            self.stdout.write(
-                self.style.ERROR(f'Файл {csv_file_path} не найден')
-            )
-            return
-
-        # Очищаем существующие ингредиенты
-        Ingredient.objects.all().delete()
-
-        ingredients_to_create = []
-
-        with open(csv_file_path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if len(row) >= 2:
-                    name, measurement_unit = row[0], row[1]
-                    ingredients_to_create.append(
-                        Ingredient(
-                            name=name,
-                            measurement_unit=measurement_unit
-                        )
-                    )
-
-        # Массовое создание ингредиентов
-        Ingredient.objects.bulk_create(ingredients_to_create)
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Успешно загружено {len(ingredients_to_create)} ингредиентов'
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+
+        dry_run = options['dry_run']
+
+        def show_insert(name, measurement_unit):
+            self.stdout.write(f'+ {name}, {measurement_unit}')
+
+        try:
+            file_format = (
+                options['format'] or ingredient_loader.detect_format(path)
             )
-        )
+            with open(path, encoding='utf-8', newline='') as file:
+                result = ingredient_loader.load(
+                    ingredient_loader.read_rows(file, file_format),
+                    chunk_size=options['chunk_size'],
+                    dry_run=dry_run,
+                    on_insert=show_insert if dry_run else None,
+                )
+        except ingredient_loader.LoadError as error:
+            raise CommandError(str(error))
+
+        if result.inserted and not dry_run:
+            # bulk_create не отправляет сигналы, версию меняем явно.
+            versioning.bump_version(versioning.INGREDIENTS)
+
+        action = 'Будет добавлено' if dry_run else 'Добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action}: {result.inserted}, без изменений: '
+            f'{result.unchanged}, пропущено строк: {result.skipped}'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from recipes import timeline
+
+
+class Command(BaseCommand):
+    """Команда для пересборки лент подписок."""
+
+    help = 'Пересборка лент подписок по текущим подпискам и рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничить обработку указанными пользователями',
+        )
+        parser.add_argument(
+            '--pending',
+            action='store_true',
+            help='Только разложить рецепты с незавершенной раскладкой',
+        )
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            recipes_count = timeline.drain_pending()
+            self.stdout.write(self.style.SUCCESS(
+                f'Разложено рецептов: {recipes_count}'
+            ))
+            return
+        # Порог популярности мог измениться, множество авторов
+        # вычисляется заново.
+        timeline.forget_celebrities()
+        users_count = 0
+        for user_ids in timeline.user_batches(options['user_ids']):
+            timeline.rebuild(user_ids)
+            users_count += len(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны для {users_count} пользователей'
+        ))
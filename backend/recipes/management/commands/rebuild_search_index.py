@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    """Команда для перестроения поискового индекса рецептов."""
+
+    help = 'Перестроение таблицы FTS5 для поиска рецептов на SQLite'
+
+    def handle(self, *args, **options):
+        if not search.has_fts_table():
+            self.stdout.write(
+                'Таблица FTS5 не используется для текущей базы данных'
+            )
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
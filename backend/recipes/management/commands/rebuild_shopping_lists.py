@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    """Команда для пересчета и проверки сумм списков покупок."""
+
+    help = 'Пересчет или проверка сумм ингредиентов в списках покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не изменяя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничить обработку указанными пользователями',
+        )
+
+    def handle(self, *args, **options):
+        drift_count = 0
+        users_count = 0
+        for user_ids in shopping_list.user_batches(options['user_ids']):
+            users_count += len(user_ids)
+            if not options['check']:
+                shopping_list.rebuild(user_ids)
+                continue
+            drift = shopping_list.find_drift(user_ids)
+            drift_count += len(drift)
+            for (user_id, ingredient_id), (stored, expected) in sorted(
+                drift.items()
+            ):
+                self.stdout.write(
+                    f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                    f'сохранено {stored}, ожидается {expected}'
+                )
+
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересчитаны для {users_count} пользователей'
+            ))
+        elif drift_count:
+            raise CommandError(f'Найдено расхождений: {drift_count}')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Расхождений нет ({users_count} пользователей)'
+            ))
@@ -0,0 +1,94 @@
+"""Сборка мусора в медиафайлах, на которые не ссылается ни один объект.
+
+Ссылки считаются по полям ``MEDIA_REFERENCES``. Каталоги с файлами,
+адресуемыми по содержимому, разбиты на подкаталоги по первым символам
+хэша и просматриваются параллельно. Файл удаляется вместе с его
+уменьшенными копиями, только если ссылок на него нет и он не менялся
+дольше заданного времени: так не удаляются файлы загрузок, объекты
+которых еще не сохранены.
+"""
+import posixpath
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import images
+from .storage import CONTENT_ADDRESSED_DIRS
+
+MEDIA_REFERENCES = (
+    ('recipes.Recipe', 'image'),
+    ('users.User', 'avatar'),
+)
+
+
+@dataclass
+class CollectionResult:
+    """Итоги сборки мусора."""
+
+    scanned: int = 0
+    deleted: list = field(default_factory=list)
+    freed_bytes: int = 0
+
+
+def reference_counts():
+    """Возвращает число ссылок на каждый файл {путь: ссылок}."""
+    counts = Counter()
+    for model_label, field_name in MEDIA_REFERENCES:
+        model = apps.get_model(model_label)
+        counts.update(
+            model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list(field_name, flat=True).iterator()
+        )
+    return counts
+
+
+def collect(storage=default_storage, workers=4, grace=None, dry_run=False):
+    """Удаляет файлы без ссылок и возвращает CollectionResult."""
+    if grace is None:
+        grace = timedelta(seconds=settings.MEDIA_GC_GRACE_SECONDS)
+    referenced = reference_counts()
+    cutoff = timezone.now() - grace
+    directories = []
+    for root in CONTENT_ADDRESSED_DIRS:
+        if not storage.exists(root):
+            continue
+        shards, _ = storage.listdir(root)
+        directories.append(root)
+        directories.extend(posixpath.join(root, shard) for shard in shards)
+    result = CollectionResult()
+
+    def scan(directory):
+        _, files = storage.listdir(directory)
+        garbage = []
+        for filename in files:
+            name = posixpath.join(directory, filename)
+            if referenced[name] or storage.get_modified_time(name) > cutoff:
+                continue
+            garbage.append((name, storage.size(name)))
+            if not dry_run:
+                _delete(storage, name)
+        return len(files), garbage
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for scanned, garbage in executor.map(scan, directories):
+            result.scanned += scanned
+            result.deleted.extend(name for name, _ in garbage)
+            result.freed_bytes += sum(size for _, size in garbage)
+    return result
+
+
+def _delete(storage, name):
+    purge = getattr(storage, 'purge', storage.delete)
+    purge(name)
+    for width in settings.IMAGE_RENDITION_WIDTHS:
+        for image_format in settings.IMAGE_RENDITION_FORMATS:
+            rendition = images.rendition_name(name, width, image_format)
+            if storage.exists(rendition):
+                storage.delete(rendition)
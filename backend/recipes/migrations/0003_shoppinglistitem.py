@@ -0,0 +1,58 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list_items(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__shopping_cart__user_id'],
+                ingredient_id=row['ingredient_id'],
+                amount=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списка покупок',
+                'ordering': ['user', 'ingredient'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(
+            fill_shopping_list_items, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import DatabaseError, migrations, transaction
+
+POSTGRESQL_FORWARD = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    'CREATE INDEX recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector)',
+    'CREATE INDEX recipes_recipe_name_trgm_idx '
+    'ON recipes_recipe USING GIN (name gin_trgm_ops)',
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_recipe_name_trgm_idx',
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, text, tokenize = 'unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'SELECT id, name, text FROM recipes_recipe',
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in POSTGRESQL_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        # SQLite может быть собран без FTS5: тогда поиск работает
+        # через icontains.
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                for statement in SQLITE_FORWARD:
+                    schema_editor.execute(statement)
+        except DatabaseError:
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {
+        'postgresql': POSTGRESQL_BACKWARD,
+        'sqlite': SQLITE_BACKWARD,
+    }.get(vendor, ())
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
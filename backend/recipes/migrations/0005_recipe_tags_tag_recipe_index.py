@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipes_recipe_tags_tag_recipe_idx',
+        ),
+    ]
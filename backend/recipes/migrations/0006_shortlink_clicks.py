@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortlink',
+            name='clicks',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, verbose_name='Переходы'),
+        ),
+    ]
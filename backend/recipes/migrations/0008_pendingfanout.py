@@ -0,0 +1,26 @@
+# Generated by Django 4.2.21 on 2026-10-17 05:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFanOut',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Ожидающая раскладка',
+                'verbose_name_plural': 'Ожидающие раскладки',
+                'ordering': ['created'],
+            },
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from users.models import User
+from users.models import Follow, User
 
 
 class Ingredient(models.Model):
@@ -52,6 +54,59 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов, подготовленные для сериализации."""
+
+    def with_related(self):
+        """Подгружает автора, ингредиенты и теги набором запросов."""
+        return self.select_related('author').prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+            'tags',
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, покупок и подписки на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed_to_author=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_subscribed_to_author=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('author'))
+            ),
+        )
+
+    def latest_per_author(self, limit=None):
+        """Оставляет не более limit последних рецептов каждого автора.
+
+        Ранжирование выполняется оконной функцией ROW_NUMBER() в одном
+        запросе, поэтому подходит для prefetch рецептов целой страницы
+        авторов.
+        """
+        if limit is None:
+            return self
+        return self.annotate(
+            author_position=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).filter(author_position__lte=limit)
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -93,10 +148,19 @@ class Recipe(models.Model):
         auto_now_add=True,
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            # Последние рецепты автора: лента подписок и профиль автора.
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -216,6 +280,11 @@ class ShortLink(models.Model):
         max_length=10,
         unique=True,
     )
+    clicks = models.PositiveBigIntegerField(
+        'Переходы',
+        default=0,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Короткая ссылка'
@@ -224,3 +293,126 @@ class ShortLink(models.Model):
 
     def __str__(self):
         return f'Ссылка на {self.recipe.name}: {self.short_code}'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Таблица поддерживается инкрементально модулем ``shopping_list``
+    при изменении корзины и ингредиентов рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        'Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        ordering = ['user', 'ingredient']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} — {self.amount} для {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Таблица заполняется модулем ``timeline`` при публикации рецепта
+    и подписке на автора. Автор и дата публикации копируются из рецепта,
+    чтобы лента читалась по одному индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        'Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['user', '-pub_date', '-recipe']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class PendingFanOut(models.Model):
+    """Рецепт, который еще не разложен по лентам подписчиков.
+
+    Запись создается в одной транзакции с рецептом и удаляется после
+    раскладки, поэтому задачи, потерянные при перезапуске воркера,
+    можно выполнить повторно.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    created = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Ожидающая раскладка'
+        verbose_name_plural = 'Ожидающие раскладки'
+        ordering = ['created']
+
+    def __str__(self):
+        return f'Раскладка {self.recipe_id}'
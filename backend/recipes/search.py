@@ -0,0 +1,116 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+На PostgreSQL поиск использует сгенерированный столбец ``search_vector``
+(русская конфигурация, индекс GIN) и триграммы ``pg_trgm`` по названию
+для устойчивости к опечаткам. На SQLite используется отдельная таблица
+FTS5, которая обновляется при сохранении и удалении рецепта. На прочих
+бэкендах поиск выполняется через ``icontains``.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+SEARCH_CONFIG = 'russian'
+WORD_RE = re.compile(r'\w+')
+
+_fts_tables = {}
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по запросу и упорядочивает по релевантности."""
+    terms = WORD_RE.findall(query.casefold())
+    if not terms:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, query)
+    if vendor == 'sqlite' and has_fts_table(queryset.db):
+        return _search_sqlite(queryset, terms)
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(text__icontains=term)
+    return queryset.filter(condition)
+
+
+def _search_postgresql(queryset, query):
+    table = Recipe._meta.db_table
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    return queryset.filter(RawSQL(
+        f'({table}.search_vector @@ {tsquery} OR {table}.name %% %s)',
+        (query, query),
+        output_field=BooleanField(),
+    )).annotate(search_rank=RawSQL(
+        f'ts_rank({table}.search_vector, {tsquery}) '
+        f'+ similarity({table}.name, %s)',
+        (query, query),
+        output_field=FloatField(),
+    )).order_by('-search_rank', '-pub_date', '-id')
+
+
+def _search_sqlite(queryset, terms):
+    table = Recipe._meta.db_table
+    # Каждое слово ищется как префикс, что частично заменяет стемминг.
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.extra(
+        select={'search_rank': f'bm25({FTS_TABLE}, 10.0, 1.0)'},
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match],
+    ).order_by('search_rank', '-pub_date', '-id')
+
+
+def has_fts_table(using='default'):
+    """Проверяет наличие таблицы FTS5 (SQLite может собираться без нее)."""
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[using]
+
+
+def index_recipe(recipe, using='default'):
+    """Обновляет запись рецепта в таблице FTS5."""
+    if not has_fts_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe.pk]
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            [recipe.pk, recipe.name, recipe.text],
+        )
+
+
+def unindex_recipe(recipe_id, using='default'):
+    """Удаляет рецепт из таблицы FTS5."""
+    if not has_fts_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id]
+        )
+
+
+def rebuild_index(using='default'):
+    """Заполняет таблицу FTS5 заново по всем рецептам."""
+    if not has_fts_table(using):
+        return
+    table = Recipe._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'SELECT id, name, text FROM {table}'
+        )
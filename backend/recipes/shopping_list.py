@@ -0,0 +1,236 @@
+"""Инкрементальное обслуживание сумм ингредиентов в списках покупок.
+
+Таблица ``ShoppingListItem`` хранит для каждого пользователя итоговое
+количество каждого ингредиента из рецептов его корзины. Все изменения
+корзины и состава рецептов применяются к ней как разности, поэтому
+выгрузка списка покупок сводится к одному чтению по индексу.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+
+from users.models import User
+from .models import Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 500
+
+
+def add_recipe(user, recipe_id):
+    """Добавляет ингредиенты рецепта в список покупок пользователя."""
+    _apply_recipes(user, [recipe_id], 1)
+
+
+def remove_recipe(user, recipe_id):
+    """Вычитает ингредиенты рецепта из списка покупок пользователя."""
+    _apply_recipes(user, [recipe_id], -1)
+
+
+def add_recipes(user, recipe_ids):
+    """Добавляет ингредиенты нескольких рецептов одним пересчетом."""
+    _apply_recipes(user, recipe_ids, 1)
+
+
+def remove_recipes(user, recipe_ids):
+    """Вычитает ингредиенты нескольких рецептов одним пересчетом."""
+    _apply_recipes(user, recipe_ids, -1)
+
+
+@transaction.atomic
+def change_recipe(recipe_id, changes):
+    """Применяет изменение состава рецепта ко всем корзинам с ним.
+
+    ``changes`` — словарь {ingredient_id: разность количества}.
+    """
+    changes = {
+        ingredient_id: delta
+        for ingredient_id, delta in changes.items() if delta
+    }
+    if not changes:
+        return
+    _lock_recipes([recipe_id])
+    user_ids = _cart_user_ids(recipe_id)
+    apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in changes.items()
+    })
+
+
+@transaction.atomic
+def discard_recipe(recipe_id):
+    """Вычитает удаляемый рецепт из всех корзин, где он лежит."""
+    _lock_recipes([recipe_id])
+    amounts = _recipe_amounts(recipe_id)
+    user_ids = _cart_user_ids(recipe_id)
+    apply_deltas({
+        (user_id, ingredient_id): -amount
+        for user_id in user_ids
+        for ingredient_id, amount in amounts.items()
+    })
+
+
+@contextmanager
+def tracking_recipes(*recipe_ids):
+    """Переносит в корзины изменения состава рецептов внутри блока.
+
+    Нужен для правок ``RecipeIngredient`` в обход API, например в
+    админке: разности считаются по составу до и после блока.
+    """
+    recipe_ids = sorted({pk for pk in recipe_ids if pk is not None})
+    with transaction.atomic():
+        _lock_recipes(recipe_ids)
+        before = {pk: _recipe_amounts(pk) for pk in recipe_ids}
+        yield
+        for pk in recipe_ids:
+            after = _recipe_amounts(pk)
+            change_recipe(pk, {
+                ingredient_id:
+                    after.get(ingredient_id, 0)
+                    - before[pk].get(ingredient_id, 0)
+                for ingredient_id in before[pk].keys() | after.keys()
+            })
+
+
+@transaction.atomic
+def apply_deltas(deltas):
+    """Применяет разности {(user_id, ingredient_id): delta} к таблице."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = sorted({user_id for user_id, _ in deltas})
+    # Блокировка строк пользователей упорядочивает параллельные изменения
+    # одного списка покупок, включая вставку еще не существующих строк.
+    list(
+        User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas},
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for (user_id, ingredient_id), delta in deltas.items():
+        item = existing.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                to_create.append(ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=delta
+                ))
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def expected_totals(user_ids):
+    """Вычисляет эталонные суммы по корзинам указанных пользователей."""
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__user_id__in=user_ids
+    ).values(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    return {
+        (row['recipe__shopping_cart__user_id'], row['ingredient_id']):
+            row['total']
+        for row in rows
+    }
+
+
+def stored_totals(user_ids):
+    """Возвращает сохраненные суммы для указанных пользователей."""
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in ShoppingListItem.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'ingredient_id', 'amount')
+    }
+
+
+def find_drift(user_ids):
+    """Возвращает расхождения {ключ: (сохранено, ожидается)}."""
+    expected = expected_totals(user_ids)
+    stored = stored_totals(user_ids)
+    return {
+        key: (stored.get(key, 0), expected.get(key, 0))
+        for key in expected.keys() | stored.keys()
+        if stored.get(key, 0) != expected.get(key, 0)
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids):
+    """Пересчитывает списки покупок указанных пользователей с нуля."""
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for (user_id, ingredient_id), amount
+        in expected_totals(user_ids).items()
+    )
+
+
+def user_batches(user_ids=None, batch_size=BATCH_SIZE):
+    """Разбивает пользователей с корзинами или списками на пачки."""
+    if user_ids is None:
+        user_ids = sorted(
+            set(_distinct_user_ids(ShoppingCart))
+            | set(_distinct_user_ids(ShoppingListItem))
+        )
+    for start in range(0, len(user_ids), batch_size):
+        yield user_ids[start:start + batch_size]
+
+
+@transaction.atomic
+def _apply_recipes(user, recipe_ids, sign):
+    if not recipe_ids:
+        return
+    _lock_recipes(recipe_ids)
+    apply_deltas({
+        (user.id, ingredient_id): sign * amount
+        for ingredient_id, amount in _recipe_amounts(*recipe_ids).items()
+    })
+
+
+def _lock_recipes(recipe_ids):
+    # Корзина и состав рецепта меняются под блокировкой строки рецепта:
+    # изменение состава видит все корзины, добавленные до него, а
+    # добавление в корзину читает уже сохраненный состав. Рецепты
+    # блокируются раньше пользователей и всегда в порядке pk.
+    list(
+        Recipe.objects.select_for_update().filter(
+            pk__in=recipe_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def _cart_user_ids(recipe_id):
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+
+
+def _recipe_amounts(*recipe_ids):
+    amounts = defaultdict(int)
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+def _distinct_user_ids(model):
+    return model.objects.order_by().values_list(
+        'user_id', flat=True
+    ).distinct()
@@ -0,0 +1,59 @@
+"""Выдача коротких кодов для ссылок на рецепты.
+
+Код — это идентификатор рецепта в системе счисления по основанию 62,
+поэтому он уникален без проверок и повторных попыток. Коды, выданные
+раньше (8 шестнадцатеричных символов от md5), не пересекаются с новыми:
+новый код достигает 8 символов только для идентификаторов от 62 ** 7.
+"""
+import string
+
+from .models import Recipe, ShortLink
+
+ALPHABET = string.digits + string.ascii_letters
+BATCH_SIZE = 1000
+
+
+def encode(number):
+    """Записывает неотрицательное число в системе по основанию 62."""
+    if number < 0:
+        raise ValueError('Число должно быть неотрицательным.')
+    digits = []
+    while True:
+        number, remainder = divmod(number, len(ALPHABET))
+        digits.append(ALPHABET[remainder])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def get_or_create(recipe):
+    """Возвращает короткую ссылку рецепта, создавая ее при отсутствии."""
+    short_link, _ = ShortLink.objects.get_or_create(
+        recipe=recipe, defaults={'short_code': encode(recipe.pk)}
+    )
+    return short_link
+
+
+def backfill(batch_size=BATCH_SIZE):
+    """Создает коды для всех рецептов без ссылок, возвращает их число."""
+    missing = Recipe.objects.filter(
+        short_link__isnull=True
+    ).order_by('pk').values_list('pk', flat=True)
+    created = 0
+    last_id = 0
+    # Пачки выбираются по ключу заново, а не одним курсором: таблица
+    # ссылок меняется во время обхода.
+    while recipe_ids := list(missing.filter(pk__gt=last_id)[:batch_size]):
+        # Ссылки, созданные параллельно через API, пропускаются, поэтому
+        # созданные считаются по числу ссылок до и после вставки.
+        links = ShortLink.objects.filter(recipe_id__in=recipe_ids)
+        before = links.count()
+        ShortLink.objects.bulk_create(
+            (
+                ShortLink(recipe_id=recipe_id, short_code=encode(recipe_id))
+                for recipe_id in recipe_ids
+            ),
+            ignore_conflicts=True,
+        )
+        created += links.count() - before
+        last_id = recipe_ids[-1]
+    return created
@@ -0,0 +1,57 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import Follow, User
+from . import images, search, shopping_list, timeline
+from .models import Recipe
+
+
+@receiver(pre_delete, sender=Recipe)
+def discard_deleted_recipe(sender, instance, **kwargs):
+    """Убирает ингредиенты удаляемого рецепта из списков покупок."""
+    shopping_list.discard_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, using, **kwargs):
+    """Обновляет рецепт в поисковом индексе SQLite."""
+    search.index_recipe(instance, using)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_deleted_recipe(sender, instance, using, **kwargs):
+    """Удаляет рецепт из поискового индекса SQLite."""
+    search.unindex_recipe(instance.pk, using)
+
+
+@receiver(post_save, sender=Recipe)
+def build_recipe_image_renditions(sender, instance, **kwargs):
+    """Строит уменьшенные копии изображения рецепта в фоне."""
+    images.schedule_renditions(instance.image.name)
+
+
+@receiver(post_save, sender=User)
+def build_avatar_renditions(sender, instance, update_fields=None, **kwargs):
+    """Строит уменьшенные копии аватара в фоне."""
+    if update_fields is None or 'avatar' in update_fields:
+        images.schedule_renditions(instance.avatar.name)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if created:
+        timeline.schedule_fan_out(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    """Добавляет в ленту рецепты автора, на которого подписались."""
+    if created:
+        timeline.schedule_backfill(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def forget_feed_author(sender, instance, **kwargs):
+    """Убирает из ленты рецепты автора, от которого отписались."""
+    timeline.forget(instance.user_id, [instance.author_id])
@@ -0,0 +1,71 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Загрузки в каталоги ``CONTENT_ADDRESSED_DIRS`` сохраняются под именем,
+равным SHA-256 содержимого, поэтому одинаковые файлы записываются один
+раз и разделяются всеми ссылающимися на них объектами. Файлы в этих
+каталогах не удаляются сразу: на них может ссылаться несколько
+объектов, и их удаляет команда ``collect_media_garbage``, когда ссылок
+не остается. Остальные пути (например, уменьшенные копии) обслуживаются
+как обычно.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_ADDRESSED_DIRS = ('recipes/images/', 'users/avatars/')
+
+
+def is_content_addressed(name):
+    """Проверяет, что файл хранится по хэшу содержимого."""
+    return name.replace('\\', '/').startswith(CONTENT_ADDRESSED_DIRS)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, не дублирующее одинаковые загрузки."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not is_content_addressed(name):
+            return super().save(name, content, max_length)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.blob_name(name, content)
+        if self.exists(name):
+            # Обновленное время защищает файл от удаления сборщиком,
+            # пока новая ссылка на него еще не сохранена.
+            os.utime(self.path(name))
+            return name
+        saved = self._save(name, content)
+        if saved != name:
+            # Тот же файл одновременно записал другой процесс.
+            super().delete(saved)
+        return name
+
+    def blob_name(self, name, content):
+        """Путь файла по SHA-256 его содержимого."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return f'{directory}/{digest[:2]}/{digest}{extension}'
+
+    def delete(self, name):
+        """Удаляет файл, кроме адресуемых по содержимому.
+
+        Для них вызов ничего не делает: ссылки на файл при сохранении и
+        удалении объектов не отслеживаются, их подсчитывает только
+        ``collect_media_garbage``, который и удаляет файлы без ссылок.
+        """
+        if name and is_content_addressed(name):
+            return
+        super().delete(name)
+
+    def purge(self, name):
+        """Удаляет файл независимо от способа хранения."""
+        super().delete(name)
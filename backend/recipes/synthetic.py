@@ -0,0 +1,405 @@
+"""Синтетические данные для нагрузочного тестирования.
+
+Объем каждой таблицы задается числом строк. Строки создаются пачками
+``bulk_create`` в пуле процессов, и каждая пачка получает собственный
+генератор случайных чисел, зерно которого составлено из общего
+``seed``, названия таблицы и номера первой строки пачки. Поэтому при
+том же размере пачки результат не зависит от числа процессов.
+Пользователи и рецепты получают явные id, и процессы ссылаются на них
+без запросов к базе.
+Популярность авторов и рецептов распределена по степенному закону:
+номер выбирается как ``int(n * u ** skew)`` для равномерного ``u``.
+Все рецепты ссылаются на несколько общих изображений-заглушек.
+
+``bulk_create`` не отправляет сигналы, поэтому после генерации
+производные данные (поисковый индекс, списки покупок, ленты подписок,
+версии данных) пересчитываются целиком.
+"""
+import io
+import os
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import lru_cache
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from api import versioning
+from users.models import Follow, User
+from . import ingredient_loader, search, shopping_list, timeline
+from .models import (
+    Favorite, FeedEntry, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Tag,
+)
+
+CHUNK_SIZE = 10_000
+BATCH_SIZE = 1000
+PASSWORD = 'password'
+PLACEHOLDER_SIZE = (640, 480)
+PLACEHOLDER_COLORS = (
+    (214, 96, 77), (244, 165, 130), (253, 219, 199), (209, 229, 240),
+    (146, 197, 222), (67, 147, 195), (166, 217, 106), (255, 224, 102),
+)
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Быстро', 'fast'),
+)
+FIRST_NAMES = (
+    'Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена',
+    'Дмитрий', 'Наталья', 'Алексей', 'Татьяна', 'Михаил',
+)
+LAST_NAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+    'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков',
+)
+DISHES = (
+    'Салат', 'Суп', 'Запеканка', 'Пирог', 'Рагу', 'Омлет', 'Каша',
+    'Паста', 'Смузи', 'Котлеты', 'Оладьи', 'Соус',
+)
+# Рецепты публикуются равномерно за этот период до начала генерации.
+PUBLICATION_PERIOD = timedelta(days=365 * 3)
+
+
+@dataclass
+class Plan:
+    """Параметры генерации, передаваемые в процессы пула."""
+
+    seed: int
+    users: int
+    recipes: int
+    follows: int
+    favorites: int
+    cart: int
+    skew: float
+    first_user_id: int
+    first_recipe_id: int
+    started_at: object
+    password: str
+    images: list = field(default_factory=list)
+    ingredients_per_recipe: tuple = (3, 10)
+    chunk_size: int = CHUNK_SIZE
+
+
+def make_plan(seed, users, recipes, follows, favorites, cart, skew=3.0,
+              images=len(PLACEHOLDER_COLORS), chunk_size=CHUNK_SIZE):
+    """Готовит справочники и заглушки и возвращает план генерации.
+
+    Все связи создаются только между новыми объектами, которые
+    получают id после существующих.
+    """
+    if not users and (recipes or follows):
+        raise ValueError('Для рецептов и подписок нужны пользователи.')
+    if not recipes and (favorites or cart):
+        raise ValueError('Для избранного и корзин нужны рецепты.')
+    ensure_catalog()
+    return Plan(
+        seed=seed,
+        users=users,
+        recipes=recipes,
+        follows=follows,
+        favorites=favorites,
+        cart=cart,
+        skew=skew,
+        first_user_id=_next_id(User),
+        first_recipe_id=_next_id(Recipe),
+        started_at=timezone.now(),
+        # Хэш одного пароля на всех: PBKDF2 для каждой строки занял бы
+        # больше времени, чем сама вставка.
+        password=make_password(PASSWORD),
+        images=placeholder_images(images),
+        chunk_size=chunk_size,
+    )
+
+
+def ensure_catalog():
+    """Загружает ингредиенты из data/ingredients.csv и теги по умолчанию."""
+    path = os.path.join(settings.BASE_DIR.parent, 'data', 'ingredients.csv')
+    with open(path, encoding='utf-8', newline='') as file:
+        result = ingredient_loader.load(ingredient_loader.read_rows(
+            file, 'csv'
+        ))
+    if result.inserted:
+        versioning.bump_version(versioning.INGREDIENTS)
+    if not Tag.objects.exists():
+        Tag.objects.bulk_create(
+            Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS
+        )
+        versioning.bump_version(versioning.TAGS)
+
+
+def placeholder_images(count):
+    """Сохраняет ``count`` одноцветных заглушек и возвращает их имена.
+
+    Хранилище адресует файлы по содержимому, поэтому повторный запуск
+    не создает новых файлов.
+    """
+    names = []
+    for color in PLACEHOLDER_COLORS[:count]:
+        buffer = io.BytesIO()
+        Image.new('RGB', PLACEHOLDER_SIZE, color).save(buffer, 'JPEG')
+        names.append(default_storage.save(
+            'recipes/images/placeholder.jpg', ContentFile(buffer.getvalue())
+        ))
+    return names
+
+
+def generate(plan, workers=1, feeds=True, log=None):
+    """Создает все строки плана и пересчитывает производные данные."""
+    log = log or (lambda message: None)
+    phases = (
+        ('Пользователи', create_users, plan.users),
+        ('Рецепты', create_recipes, plan.recipes),
+        ('Подписки', create_follows, plan.follows),
+        ('Избранное', create_favorites, plan.favorites),
+        ('Корзины', create_cart, plan.cart),
+    )
+    with _executor(workers) as executor:
+        for title, create, total in phases:
+            started = time.perf_counter()
+            futures = [
+                executor.submit(create, plan, start, min(
+                    plan.chunk_size, total - start
+                ))
+                for start in range(0, total, plan.chunk_size)
+            ]
+            for future in futures:
+                future.result()
+            log(f'{title}: {total} за {time.perf_counter() - started:.1f} с')
+    reset_sequences()
+    started = time.perf_counter()
+    rebuild_derived(plan, feeds)
+    log(
+        'Производные данные пересчитаны за '
+        f'{time.perf_counter() - started:.1f} с'
+    )
+
+
+def create_users(plan, start, count):
+    """Создает пользователей с номерами [start, start + count)."""
+    rng = _chunk_random(plan, 'users', start)
+    User.objects.bulk_create(
+        (
+            User(
+                id=user_id,
+                username=f'synthetic{user_id}',
+                email=f'synthetic{user_id}@example.com',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                password=plan.password,
+            )
+            for user_id in range(
+                plan.first_user_id + start,
+                plan.first_user_id + start + count,
+            )
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def create_recipes(plan, start, count):
+    """Создает рецепты с ингредиентами и тегами."""
+    rng = _chunk_random(plan, 'recipes', start)
+    ingredient_ids, ingredient_names = _catalog()
+    tag_ids = _tag_ids()
+    recipes, ingredients, tags = [], [], []
+    for recipe_id in range(
+        plan.first_recipe_id + start, plan.first_recipe_id + start + count
+    ):
+        picked = rng.sample(
+            range(len(ingredient_ids)),
+            rng.randint(*plan.ingredients_per_recipe),
+        )
+        recipes.append(Recipe(
+            id=recipe_id,
+            author_id=plan.first_user_id + _skewed(rng, plan.users, plan),
+            name=(
+                f'{rng.choice(DISHES)}: {ingredient_names[picked[0]]}'
+            )[:settings.MAX_LENGTH_RECIPE_NAME],
+            text=', '.join(ingredient_names[index] for index in picked),
+            image=rng.choice(plan.images),
+            cooking_time=rng.randint(5, 180),
+            pub_date=plan.started_at - PUBLICATION_PERIOD * rng.random(),
+        ))
+        ingredients.extend(
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_ids[index],
+                amount=rng.randint(1, 500),
+            )
+            for index in picked
+        )
+        tags.extend(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 2))
+        )
+    with transaction.atomic(), _keep_pub_date():
+        Recipe.objects.bulk_create(recipes, batch_size=BATCH_SIZE)
+        RecipeIngredient.objects.bulk_create(
+            ingredients, batch_size=BATCH_SIZE
+        )
+        Recipe.tags.through.objects.bulk_create(tags, batch_size=BATCH_SIZE)
+
+
+def create_follows(plan, start, count):
+    """Создает подписки: подписчики равновероятны, авторы — по закону."""
+    rng = _chunk_random(plan, 'follows', start)
+    pairs = set()
+    for _ in range(count):
+        user_id = plan.first_user_id + rng.randrange(plan.users)
+        author_id = plan.first_user_id + _skewed(rng, plan.users, plan)
+        if user_id != author_id:
+            pairs.add((user_id, author_id))
+    Follow.objects.bulk_create(
+        (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def create_favorites(plan, start, count):
+    """Добавляет популярные рецепты в избранное новых пользователей."""
+    _create_recipe_relations(Favorite, plan, 'favorites', start, count)
+
+
+def create_cart(plan, start, count):
+    """Добавляет популярные рецепты в корзины новых пользователей."""
+    _create_recipe_relations(ShoppingCart, plan, 'cart', start, count)
+
+
+def reset_sequences():
+    """Сдвигает последовательности id после вставки явных значений."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [User, Recipe]
+    )
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def rebuild_derived(plan, feeds=True):
+    """Пересчитывает данные, которые обновляют сигналы моделей."""
+    search.rebuild_index()
+    user_ids = list(range(
+        plan.first_user_id, plan.first_user_id + plan.users
+    ))
+    for batch in shopping_list.user_batches(user_ids):
+        shopping_list.rebuild(batch)
+    if feeds:
+        # Подписки плана связывают только его пользователей, поэтому
+        # ленты собираются по авторам плана: рецепты каждого автора
+        # читаются один раз.
+        timeline.forget_celebrities()
+        FeedEntry.objects.filter(
+            user_id__gte=plan.first_user_id,
+            user_id__lt=plan.first_user_id + plan.users,
+        ).delete()
+        timeline.rebuild_authors(user_ids)
+    for kind in (versioning.RECIPES, versioning.USERS):
+        versioning.bump_version(kind)
+
+
+def _create_recipe_relations(model, plan, kind, start, count):
+    rng = _chunk_random(plan, kind, start)
+    pairs = {
+        (
+            plan.first_user_id + rng.randrange(plan.users),
+            plan.first_recipe_id + _skewed(rng, plan.recipes, plan),
+        )
+        for _ in range(count)
+    }
+    model.objects.bulk_create(
+        (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in pairs
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _chunk_random(plan, kind, start):
+    return random.Random(f'{plan.seed}:{kind}:{start}')
+
+
+def _skewed(rng, count, plan):
+    """Номер от 0 до count - 1; малые номера выпадают чаще."""
+    return int(count * rng.random() ** plan.skew)
+
+
+@lru_cache(maxsize=None)
+def _catalog():
+    ingredients = list(Ingredient.objects.order_by('id').values_list(
+        'id', 'name'
+    ))
+    return (
+        [ingredient_id for ingredient_id, _ in ingredients],
+        [name for _, name in ingredients],
+    )
+
+
+@lru_cache(maxsize=None)
+def _tag_ids():
+    return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+
+@contextmanager
+def _keep_pub_date():
+    # auto_now_add заменил бы сгенерированные даты публикации.
+    pub_date = Recipe._meta.get_field('pub_date')
+    pub_date.auto_now_add = False
+    try:
+        yield
+    finally:
+        pub_date.auto_now_add = True
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class _InlineExecutor:
+    """Выполняет задачи сразу в текущем процессе и соединении."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+def _executor(workers):
+    # Один процесс работает в текущем соединении: так генератор
+    # заполняет и тестовую базу SQLite в памяти.
+    if workers == 1:
+        return _InlineExecutor()
+    # Процессы пула не должны наследовать открытые соединения родителя.
+    connections.close_all()
+    return ProcessPoolExecutor(workers, initializer=_init_worker)
+
+
+def _init_worker():
+    # При запуске процессов через spawn Django еще не настроен.
+    django.setup()
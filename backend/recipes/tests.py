@@ -0,0 +1,1179 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api import relations
+from api.click_counter import click_counter
+from api.versioning import shared_cache
+from recipes import (
+    images, ingredient_loader, media_gc, search, shopping_list, short_links,
+    timeline
+)
+from recipes.models import (
+    Favorite, FeedEntry, Ingredient, PendingFanOut, Recipe, RecipeIngredient,
+    ShoppingCart, ShortLink, Tag
+)
+from recipes.storage import ContentAddressedStorage
+from users.models import Follow, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TEST_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'recipes-tests-{alias}',
+    }
+    for alias in ('default', 'shared')
+}
+
+
+def image_bytes(size=(40, 30), orientation=None):
+    """JPEG-изображение; orientation записывается в EXIF вместе с камерой."""
+    exif = Image.Exif()
+    exif[0x010F] = 'Камера'
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    Image.new('RGB', size, 'red').save(output, 'JPEG', exif=exif.tobytes())
+    return output.getvalue()
+
+
+def image_data_uri(**kwargs):
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        image_bytes(**kwargs)
+    ).decode()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=TEST_CACHES)
+class RecipeTestCase(TestCase):
+    """Авторы с рецептами и зритель с избранным, корзиной и подписками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                first_name='Автор',
+                last_name=str(number),
+                password='secret-pass-1',
+            )
+            for number in range(3)
+        ]
+        cls.viewer = User.objects.create_user(
+            email='viewer@example.com',
+            username='viewer',
+            first_name='Зритель',
+            last_name='Зритель',
+            password='secret-pass-1',
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 3],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/test.png',
+            )
+            recipe.tags.set(cls.tags[:number % 2 + 1])
+            for offset in range(3):
+                RecipeIngredient.objects.create(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(number + offset) % 6],
+                    amount=offset + 1,
+                )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[:4]:
+            Favorite.objects.create(user=cls.viewer, recipe=recipe)
+        for recipe in cls.recipes[2:5]:
+            ShoppingCart.objects.create(user=cls.viewer, recipe=recipe)
+        Follow.objects.create(user=cls.viewer, author=cls.authors[0])
+        shopping_list.rebuild([cls.viewer.pk])
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def author_client(self, author):
+        client = APIClient()
+        client.force_authenticate(author)
+        return client
+
+    def count_queries(self, client, path):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class RecipeQueryCountTest(RecipeTestCase):
+    """Число запросов списка и рецепта не зависит от размера страницы."""
+
+    def assert_constant_list_queries(self, client):
+        # Страницы сравниваются при пустом кэше фрагментов.
+        caches['default'].clear()
+        queries = self.count_queries(client, '/api/recipes/?limit=2')
+        caches['default'].clear()
+        with self.assertNumQueries(queries):
+            client.get('/api/recipes/?limit=12')
+
+    @override_settings(RECIPE_FRAGMENT_CACHE=False)
+    def test_list_without_fragment_cache(self):
+        self.assert_constant_list_queries(self.client)
+        self.assert_constant_list_queries(self.anonymous)
+
+    def test_list_with_fragment_cache(self):
+        self.assert_constant_list_queries(self.client)
+        self.assert_constant_list_queries(self.anonymous)
+
+    def test_detail_does_not_depend_on_ingredients(self):
+        small, large = self.recipes[0], self.recipes[1]
+        for ingredient in self.ingredients:
+            RecipeIngredient.objects.get_or_create(
+                recipe=large, ingredient=ingredient, defaults={'amount': 1}
+            )
+        queries = self.count_queries(
+            self.client, f'/api/recipes/{small.pk}/'
+        )
+        with self.assertNumQueries(queries):
+            self.client.get(f'/api/recipes/{large.pk}/')
+
+    def test_viewer_flags(self):
+        results = self.client.get('/api/recipes/?limit=12').json()['results']
+        self.assertEqual(
+            {recipe['id'] for recipe in results if recipe['is_favorited']},
+            {recipe.pk for recipe in self.recipes[:4]},
+        )
+        self.assertEqual(
+            {
+                recipe['id'] for recipe in results
+                if recipe['is_in_shopping_cart']
+            },
+            {recipe.pk for recipe in self.recipes[2:5]},
+        )
+        self.assertEqual(
+            {
+                recipe['author']['id'] for recipe in results
+                if recipe['author']['is_subscribed']
+            },
+            {self.authors[0].pk},
+        )
+        results = self.anonymous.get('/api/recipes/').json()['results']
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['is_in_shopping_cart']
+            for recipe in results
+        ))
+
+
+class KeysetPaginationTest(RecipeTestCase):
+    """Курсорный режим пагинации рецептов."""
+
+    def collect(self, path):
+        ids = []
+        while path:
+            data = self.anonymous.get(path).json()
+            self.assertNotIn('count', data)
+            ids += [recipe['id'] for recipe in data['results']]
+            path = data['next']
+        return ids
+
+    def test_pages_cover_all_recipes_in_order(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(
+            self.collect('/api/recipes/?cursor=&limit=5'), expected
+        )
+
+    def test_new_recipe_does_not_shift_pages(self):
+        first = self.anonymous.get('/api/recipes/?cursor=&limit=5').json()
+        Recipe.objects.create(
+            author=self.authors[1],
+            name='Новый рецепт',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/images/test.png',
+        )
+        ids = [recipe['id'] for recipe in first['results']]
+        ids += self.collect(first['next'])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {recipe.pk for recipe in self.recipes})
+
+    def test_page_number_fallback(self):
+        data = self.anonymous.get(
+            '/api/recipes/?cursor=&page=2&limit=5'
+        ).json()
+        self.assertEqual(data['count'], len(self.recipes))
+        data = self.anonymous.get(
+            '/api/recipes/?cursor=&search=Рецепт&limit=5'
+        ).json()
+        self.assertIn('count', data)
+
+
+class ShoppingListTest(RecipeTestCase):
+    """Суммы списка покупок обновляются разностями."""
+
+    def assert_no_drift(self):
+        self.assertEqual(shopping_list.find_drift([self.viewer.pk]), {})
+
+    def download(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        return b''.join(response.streaming_content) if (
+            response.streaming
+        ) else response.content
+
+    def admin_client(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            first_name='Админ',
+            last_name='Админ',
+            password='secret-pass-1',
+        )
+        client = Client()
+        client.force_login(admin)
+        return client
+
+    def test_cart_changes(self):
+        recipe = self.recipes[7]
+        before = self.download()
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assert_no_drift()
+        self.client.delete(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assert_no_drift()
+        self.assertEqual(self.download(), before)
+
+    def test_recipe_changes(self):
+        recipe = self.recipes[2]
+        response = self.author_client(recipe.author).patch(
+            f'/api/recipes/{recipe.pk}/',
+            {
+                'ingredients': [
+                    {'id': self.ingredients[0].pk, 'amount': 7},
+                    {'id': self.ingredients[5].pk, 'amount': 2},
+                ],
+                'tags': [self.tags[0].pk],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_no_drift()
+        self.author_client(recipe.author).delete(
+            f'/api/recipes/{recipe.pk}/'
+        )
+        self.assert_no_drift()
+
+    def test_tracking_recipes(self):
+        recipe = self.recipes[3]
+        with shopping_list.tracking_recipes(recipe.pk, None):
+            RecipeIngredient.objects.filter(recipe=recipe).update(amount=9)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredients[0], amount=4
+            )
+        self.assert_no_drift()
+
+    def test_admin_ingredient_changes(self):
+        client = self.admin_client()
+        item = RecipeIngredient.objects.get(
+            recipe=self.recipes[4], ingredient=self.ingredients[0]
+        )
+        response = client.post(
+            f'/admin/recipes/recipeingredient/{item.pk}/change/',
+            {
+                'recipe': self.recipes[2].pk,
+                'ingredient': item.ingredient_id,
+                'amount': 5,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_no_drift()
+        response = client.post(
+            f'/admin/recipes/recipeingredient/{item.pk}/delete/',
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(RecipeIngredient.objects.filter(pk=item.pk).exists())
+        self.assert_no_drift()
+
+    def test_download_is_single_query(self):
+        with self.assertNumQueries(1):
+            self.download()
+
+
+class ShoppingListDownloadTest(RecipeTestCase):
+    """Список покупок выгружается потоком в txt и csv."""
+
+    totals = ((0, 3), (2, 1), (3, 3), (4, 6), (5, 5))
+
+    def download(self, client, file_format):
+        response = client.get(
+            f'/api/recipes/download_shopping_cart/?format={file_format}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{file_format}"',
+        )
+        return b''.join(response.streaming_content).decode()
+
+    def test_text(self):
+        self.assertEqual(
+            self.download(self.client, 'txt'),
+            'Список покупок:\n' + '=' * 50 + '\n' + ''.join(
+                f'ингредиент {number} (г) — {amount}\n'
+                for number, amount in self.totals
+            ),
+        )
+
+    def test_csv(self):
+        self.assertEqual(
+            self.download(self.client, 'csv'),
+            'name,measurement_unit,amount\r\n' + ''.join(
+                f'ингредиент {number},г,{amount}\r\n'
+                for number, amount in self.totals
+            ),
+        )
+
+    def test_empty(self):
+        client = self.author_client(self.authors[0])
+        self.assertTrue(
+            self.download(client, 'txt').endswith('Список покупок пуст.\n')
+        )
+        self.assertEqual(
+            self.download(client, 'csv'), 'name,measurement_unit,amount\r\n'
+        )
+
+
+class RecipeSearchTest(RecipeTestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    def create_recipe(self, name, text):
+        return Recipe.objects.create(
+            author=self.authors[0],
+            name=name,
+            text=text,
+            cooking_time=10,
+            image='recipes/images/test.png',
+        )
+
+    def search(self, query):
+        return [
+            recipe['id'] for recipe in self.anonymous.get(
+                '/api/recipes/', {'search': query, 'limit': 20}
+            ).json()['results']
+        ]
+
+    def test_name_ranks_above_text(self):
+        self.assertTrue(search.has_fts_table())
+        in_name = self.create_recipe('Борщ', 'Описание')
+        in_text = self.create_recipe('Суп', 'Почти как борщ')
+        self.assertEqual(self.search('борщ'), [in_name.pk, in_text.pk])
+
+    def test_every_word_must_match(self):
+        recipe = self.create_recipe('Борщ зеленый', 'Со щавелем')
+        self.create_recipe('Борщ', 'Описание')
+        self.assertEqual(self.search('зелен борщ'), [recipe.pk])
+
+    def test_index_follows_changes(self):
+        recipe = self.create_recipe('Борщ', 'Описание')
+        recipe.name = 'Солянка'
+        recipe.save()
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('солянка'), [recipe.pk])
+        recipe.delete()
+        self.assertEqual(self.search('солянка'), [])
+
+
+class TagFilterTest(RecipeTestCase):
+    """Фильтр по тегам возвращает рецепты хотя бы с одним из тегов."""
+
+    def filter(self, *slugs):
+        return [
+            recipe['id'] for recipe in self.anonymous.get(
+                '/api/recipes/', {'tags': slugs, 'limit': 20}
+            ).json()['results']
+        ]
+
+    def test_single_tag(self):
+        self.assertEqual(
+            set(self.filter('tag1')),
+            {recipe.pk for recipe in self.recipes[1::2]},
+        )
+
+    def test_any_of_tags_without_duplicates(self):
+        ids = self.filter('tag0', 'tag1')
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {recipe.pk for recipe in self.recipes})
+
+    def test_tags_are_embedded(self):
+        recipe = self.anonymous.get(
+            '/api/recipes/', {'tags': 'tag1'}
+        ).json()['results'][0]
+        self.assertEqual(
+            [tag['slug'] for tag in recipe['tags']], ['tag0', 'tag1']
+        )
+
+    def test_query_count_does_not_depend_on_tags(self):
+        Tag.objects.create(name='Тег 2', slug='tag2')
+        queries = self.count_queries(self.anonymous, '/api/recipes/?tags=tag1')
+        caches['default'].clear()
+        with self.assertNumQueries(queries):
+            self.anonymous.get('/api/recipes/?tags=tag0&tags=tag1&tags=tag2')
+
+
+class VersionInvalidationTest(RecipeTestCase):
+    """ETag рецептов меняется после фиксации изменений данных."""
+
+    def assert_changed_by(self, client, path, change):
+        etag = client.get(path)['ETag']
+        self.assertEqual(
+            client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(
+            client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def rename_ingredient(self):
+        ingredient = self.ingredients[0]
+        ingredient.name = 'переименованный ингредиент'
+        ingredient.save()
+
+    def test_recipe_list(self):
+        path = '/api/recipes/?limit=12'
+        self.assert_changed_by(
+            self.client, path, lambda: self.recipes[0].save()
+        )
+        self.assert_changed_by(self.client, path, self.rename_ingredient)
+        self.assert_changed_by(
+            self.client, path, lambda: Favorite.objects.create(
+                user=self.viewer, recipe=self.recipes[9]
+            )
+        )
+
+    def test_recipe_detail(self):
+        recipe = self.recipes[0]
+        path = f'/api/recipes/{recipe.pk}/'
+        self.assert_changed_by(self.anonymous, path, self.rename_ingredient)
+        self.assert_changed_by(
+            self.anonymous, path, lambda: recipe.author.save()
+        )
+
+    def test_version_changes_after_commit(self):
+        recipe = self.recipes[0]
+        path = f'/api/recipes/{recipe.pk}/'
+        etag = self.anonymous.get(path)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                recipe.name = 'Новое название'
+                recipe.save()
+                # До фиксации параллельные запросы читают прежние данные.
+                self.assertEqual(self.anonymous.get(path)['ETag'], etag)
+        self.assertNotEqual(self.anonymous.get(path)['ETag'], etag)
+
+    def test_unknown_recipe_has_no_version(self):
+        for pk in ('999999', 'missing'):
+            response = self.anonymous.get(f'/api/recipes/{pk}/')
+            self.assertEqual(response.status_code, 404)
+            self.assertIsNone(
+                caches['shared'].get(f'data-version:recipe:{pk}')
+            )
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        path = '/api/recipes/?limit=12'
+        modified = self.client.get(path)['Last-Modified']
+        self.assertEqual(
+            self.client.get(
+                path, HTTP_IF_MODIFIED_SINCE=modified
+            ).status_code,
+            200,
+        )
+
+
+class ShortLinkTest(RecipeTestCase):
+    """Выдача, разрешение и заполнение коротких ссылок."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(click_counter.flush)
+
+    def test_resolution(self):
+        recipe = self.recipes[3]
+        link = self.anonymous.get(
+            f'/api/recipes/{recipe.pk}/get-link/'
+        ).json()['short-link']
+        code = link.rstrip('/').rsplit('/', 1)[-1]
+        self.assertEqual(code, short_links.encode(recipe.pk))
+        response = self.anonymous.get(f'/s/{code}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/recipes/{recipe.pk}')
+        with self.assertNumQueries(0):
+            self.anonymous.get(f'/s/{code}/')
+
+    def test_unknown_code(self):
+        self.assertEqual(self.anonymous.get('/s/missing/').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.anonymous.get('/s/missing/').status_code, 404
+            )
+
+    def test_deleted_recipe(self):
+        recipe = self.recipes[4]
+        self.anonymous.get(f'/api/recipes/{recipe.pk}/get-link/')
+        code = ShortLink.objects.get(recipe=recipe).short_code
+        self.assertEqual(self.anonymous.get(f'/s/{code}/').status_code, 302)
+        recipe.delete()
+        self.assertEqual(self.anonymous.get(f'/s/{code}/').status_code, 404)
+
+    def test_backfill_counts_only_created_links(self):
+        short_links.get_or_create(self.recipes[0])
+        links = ShortLink.objects.filter
+
+        def create_in_parallel(*args, **kwargs):
+            # Пока пачка выбиралась, ссылку создали через API.
+            short_links.get_or_create(self.recipes[1])
+            return links(*args, **kwargs)
+
+        with mock.patch.object(
+            ShortLink.objects, 'filter', create_in_parallel
+        ):
+            created = short_links.backfill(batch_size=5)
+        self.assertEqual(created, len(self.recipes) - 2)
+        self.assertEqual(ShortLink.objects.count(), len(self.recipes))
+        self.assertEqual(short_links.backfill(), 0)
+
+
+class ImageUploadTest(RecipeTestCase):
+    """Загруженные изображения проверяются и очищаются от метаданных."""
+
+    def create_recipe(self, image):
+        return self.author_client(self.authors[0]).post(
+            '/api/recipes/',
+            {
+                'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+                'tags': [self.tags[0].pk],
+                'image': image,
+                'name': 'Рецепт с фото',
+                'text': 'Описание',
+                'cooking_time': 5,
+            },
+            format='json',
+        )
+
+    def test_exif_is_stripped(self):
+        response = self.create_recipe(image_data_uri(orientation=6))
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        with default_storage.open(recipe.image.name) as file:
+            with Image.open(file) as image:
+                self.assertEqual(dict(image.getexif()), {})
+                # Поворот из EXIF применен к пикселям.
+                self.assertEqual(image.size, (30, 40))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_oversized_image_is_rejected(self):
+        count = Recipe.objects.count()
+        response = self.create_recipe(image_data_uri())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+        self.assertEqual(Recipe.objects.count(), count)
+
+    def test_not_an_image_is_rejected(self):
+        response = self.create_recipe(
+            'data:image/png;base64,' + base64.b64encode(b'text').decode()
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_renditions(self):
+        response = self.create_recipe(
+            image_data_uri(size=(800, 400))
+        ).json()
+        self.assertIn('320w', response['image_variants']['webp'])
+        name = Recipe.objects.get(pk=response['id']).image.name
+        response = self.anonymous.get(f'/api/images/320/webp/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        body = b''.join(response.streaming_content)
+        with Image.open(io.BytesIO(body)) as image:
+            self.assertEqual(image.size, (320, 160))
+        self.assertEqual(
+            self.anonymous.get(f'/api/images/300/webp/{name}').status_code,
+            404,
+        )
+
+    def test_avatar_variants(self):
+        response = self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': image_data_uri()},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        variants = self.client.get('/api/users/me/').json()[
+            'avatar_variants'
+        ]
+        self.assertEqual(set(variants), {'webp', 'jpeg'})
+
+
+class FileUploadTest(RecipeTestCase):
+    """Загрузка изображений файлом: multipart и тело image/*."""
+
+    def recipe_data(self, **fields):
+        return json.dumps({
+            'ingredients': [{'id': self.ingredients[1].pk, 'amount': 3}],
+            'tags': [self.tags[1].pk],
+            'name': 'Рецепт из формы',
+            'text': 'Описание',
+            'cooking_time': 15,
+            **fields,
+        })
+
+    def photo(self, content=None):
+        return SimpleUploadedFile(
+            'photo.jpg', content or image_bytes(), 'image/jpeg'
+        )
+
+    def test_multipart_create(self):
+        response = self.author_client(self.authors[1]).post(
+            '/api/recipes/',
+            {'data': self.recipe_data(), 'image': self.photo()},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(recipe.name, 'Рецепт из формы')
+        self.assertEqual(
+            list(recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.ingredients[1].pk, 3)],
+        )
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def test_multipart_patch(self):
+        recipe = self.recipes[1]
+        response = self.author_client(recipe.author).patch(
+            f'/api/recipes/{recipe.pk}/',
+            {
+                'data': self.recipe_data(name='Новое название'),
+                'image': self.photo(),
+            },
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertNotEqual(recipe.image.name, 'recipes/images/test.png')
+
+    def test_malformed_data_part(self):
+        response = self.author_client(self.authors[1]).post(
+            '/api/recipes/',
+            {'data': '[1, 2]', 'image': self.photo()},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_raw_avatar(self):
+        response = self.client.put(
+            '/api/users/me/avatar/',
+            image_bytes(),
+            content_type='image/jpeg',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.viewer.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.viewer.avatar.name))
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1000)
+    def test_multipart_above_limit(self):
+        count = Recipe.objects.count()
+        response = self.author_client(self.authors[1]).post(
+            '/api/recipes/',
+            {'data': self.recipe_data(), 'image': self.photo(b'0' * 5000)},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(Recipe.objects.count(), count)
+
+    @override_settings(
+        IMAGE_UPLOAD_MAX_SIZE=1000, DATA_UPLOAD_MAX_MEMORY_SIZE=1000
+    )
+    def test_raw_avatar_above_limit(self):
+        response = self.client.put(
+            '/api/users/me/avatar/', b'0' * 5000, content_type='image/jpeg'
+        )
+        self.assertEqual(response.status_code, 413)
+        self.viewer.refresh_from_db()
+        self.assertFalse(self.viewer.avatar)
+
+
+class StorageTestMixin:
+    """Хранилище с адресацией по содержимому во временном каталоге."""
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=location)
+
+    def save(self, content, name='recipes/images/photo.jpg'):
+        return self.storage.save(name, ContentFile(content))
+
+    def files(self, directory='recipes/images'):
+        location = self.storage.location
+        return sorted(
+            os.path.relpath(os.path.join(root, filename), location)
+            for root, _, filenames in os.walk(self.storage.path(directory))
+            for filename in filenames
+        )
+
+
+class ContentAddressedStorageTest(StorageTestMixin, SimpleTestCase):
+    """Одинаковые загрузки хранятся одним файлом."""
+
+    def test_same_content_is_stored_once(self):
+        first = self.save(b'content', 'recipes/images/a.jpg')
+        second = self.save(b'content', 'recipes/images/b.JPG')
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.jpg'))
+        self.assertNotEqual(self.save(b'other'), first)
+        self.assertEqual(len(self.files()), 2)
+
+    def test_parallel_write_of_same_file(self):
+        name = self.save(b'content')
+        # Другой процесс записал файл между проверкой и записью.
+        exists = self.storage.exists
+        checks = []
+
+        def missing_on_first_check(path):
+            checks.append(path)
+            return len(checks) > 1 and exists(path)
+
+        with mock.patch.object(
+            self.storage, 'exists', missing_on_first_check
+        ):
+            self.assertEqual(self.save(b'content'), name)
+        self.assertEqual(self.files(), [name])
+
+    def test_delete_keeps_content_addressed_files(self):
+        name = self.save(b'content')
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.purge(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_other_paths_are_stored_as_usual(self):
+        name = self.storage.save('renditions/a/320.webp', ContentFile(b'1'))
+        self.assertEqual(name, 'renditions/a/320.webp')
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+
+class MediaGarbageTest(StorageTestMixin, RecipeTestCase):
+    """Сборщик удаляет только старые файлы без ссылок."""
+
+    def save_old(self, content):
+        name = self.save(content)
+        old = time.time() - 7200
+        os.utime(self.storage.path(name), (old, old))
+        return name
+
+    def collect(self):
+        return media_gc.collect(
+            storage=self.storage, workers=2, grace=timedelta(hours=1)
+        )
+
+    def test_collect(self):
+        referenced = self.save_old(image_bytes())
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(image=referenced)
+        garbage = self.save_old(image_bytes(size=(50, 30)))
+        images.build_renditions(garbage, self.storage)
+        self.assertEqual(len(self.files('renditions')), 6)
+        recent = self.save(b'recent')
+        result = self.collect()
+        self.assertEqual(result.deleted, [garbage])
+        self.assertEqual(sorted(self.files()), sorted([referenced, recent]))
+        self.assertEqual(self.files('renditions'), [])
+
+    def test_dry_run_deletes_nothing(self):
+        garbage = self.save_old(b'garbage')
+        result = media_gc.collect(
+            storage=self.storage, grace=timedelta(hours=1), dry_run=True
+        )
+        self.assertEqual(result.deleted, [garbage])
+        self.assertTrue(self.storage.exists(garbage))
+
+
+class RecipeUpdateTest(RecipeTestCase):
+    """PATCH рецепта записывает только изменившиеся ингредиенты."""
+
+    def payload(self, ingredients):
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            'tags': [self.tags[1].pk],
+            'name': 'Обновленный рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+
+    def test_ingredient_diff(self):
+        recipe = self.recipes[0]
+        rows = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        kept, changed, removed = (
+            self.ingredients[0], self.ingredients[1], self.ingredients[2]
+        )
+        added = self.ingredients[3]
+        response = self.author_client(recipe.author).patch(
+            f'/api/recipes/{recipe.pk}/',
+            self.payload([
+                (kept, rows[kept.pk].amount), (changed, 9), (added, 4)
+            ]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        self.assertEqual(set(current), {kept.pk, changed.pk, added.pk})
+        self.assertNotIn(removed.pk, current)
+        self.assertEqual(current[kept.pk].pk, rows[kept.pk].pk)
+        self.assertEqual(current[changed.pk].pk, rows[changed.pk].pk)
+        self.assertEqual(current[changed.pk].amount, 9)
+        self.assertEqual(current[added.pk].amount, 4)
+        self.assertEqual(
+            sorted(
+                (item['id'], item['amount'])
+                for item in response.json()['ingredients']
+            ),
+            sorted([
+                (kept.pk, rows[kept.pk].amount), (changed.pk, 9),
+                (added.pk, 4),
+            ]),
+        )
+
+    def test_unknown_ingredient_changes_nothing(self):
+        recipe = self.recipes[0]
+        before = list(RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'))
+        payload = self.payload([(self.ingredients[0], 1)])
+        payload['ingredients'].append({'id': 10 ** 6, 'amount': 1})
+        response = self.author_client(recipe.author).patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            list(RecipeIngredient.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')),
+            before,
+        )
+
+
+class BulkRelationTest(RecipeTestCase):
+    """Массовые изменения избранного, корзины и подписок."""
+
+    def change(self, method, path, ids):
+        response = getattr(self.client, method)(
+            path, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['id']: item['status'] for item in response.json()['results']
+        }
+
+    def test_favorite_outcomes(self):
+        kept, new = self.recipes[0].pk, self.recipes[5].pk
+        path = '/api/recipes/favorite/'
+        self.assertEqual(
+            self.change('post', path, [kept, new, 10 ** 6, new]),
+            {
+                kept: relations.EXISTS,
+                new: relations.CREATED,
+                10 ** 6: relations.NOT_FOUND,
+            },
+        )
+        self.assertTrue(
+            Favorite.objects.filter(user=self.viewer, recipe_id=new).exists()
+        )
+        self.assertEqual(
+            self.change('delete', path, [kept, new, self.recipes[9].pk]),
+            {
+                kept: relations.DELETED,
+                new: relations.DELETED,
+                self.recipes[9].pk: relations.MISSING,
+            },
+        )
+        self.assertFalse(Favorite.objects.filter(
+            user=self.viewer, recipe_id__in=[kept, new]
+        ).exists())
+
+    def test_subscribe_outcomes(self):
+        followed, author = self.authors[0].pk, self.authors[1].pk
+        self.assertEqual(
+            self.change(
+                'post', '/api/users/subscribe/',
+                [self.viewer.pk, followed, author],
+            ),
+            {
+                self.viewer.pk: relations.SELF,
+                followed: relations.EXISTS,
+                author: relations.CREATED,
+            },
+        )
+        self.assertTrue(
+            Follow.objects.filter(user=self.viewer, author_id=author).exists()
+        )
+
+    def test_cart_outcomes_update_shopping_list(self):
+        ids = [recipe.pk for recipe in self.recipes[3:8]]
+        outcomes = relations.shopping_cart.add_many(self.viewer, ids)
+        self.assertEqual(
+            [outcomes[pk] for pk in ids],
+            [relations.EXISTS] * 2 + [relations.CREATED] * 3,
+        )
+        self.assertEqual(shopping_list.find_drift([self.viewer.pk]), {})
+        outcomes = relations.shopping_cart.remove_many(self.viewer, ids)
+        self.assertEqual(set(outcomes.values()), {relations.DELETED})
+        self.assertEqual(shopping_list.find_drift([self.viewer.pk]), {})
+        self.assertFalse(ShoppingCart.objects.filter(
+            user=self.viewer, recipe_id__in=ids
+        ).exists())
+
+    def test_invalid_ids(self):
+        too_many = list(range(1, settings.BULK_RELATION_MAX_IDS + 2))
+        for ids in ([], ['first'], [0], too_many):
+            response = self.client.post(
+                '/api/recipes/favorite/', {'ids': ids}, format='json'
+            )
+            self.assertEqual(response.status_code, 400, ids)
+
+
+class TimelineTest(RecipeTestCase):
+    """Лента подписок: заполнение, отписка и догоняющая раскладка."""
+
+    def setUp(self):
+        super().setUp()
+        # Фоновые задачи в TestCase не запускаются: ленты собираются
+        # явно, а задачи вызываются в тестах напрямую.
+        PendingFanOut.objects.all().delete()
+        timeline.rebuild([self.viewer.pk])
+
+    def feed_authors(self):
+        return set(FeedEntry.objects.filter(
+            user=self.viewer
+        ).values_list('author_id', flat=True))
+
+    def feed_ids(self):
+        return [
+            recipe['id'] for recipe in self.client.get(
+                '/api/recipes/feed/?limit=20'
+            ).json()['results']
+        ]
+
+    def test_feed_page(self):
+        self.assertEqual(self.feed_ids(), list(Recipe.objects.filter(
+            author=self.authors[0]
+        ).order_by('-pub_date', '-id').values_list('id', flat=True)))
+
+    def test_backfill_after_follow(self):
+        author = self.authors[1]
+        Follow.objects.create(user=self.viewer, author=author)
+        timeline.backfill(self.viewer.pk, [author.pk])
+        self.assertEqual(
+            self.feed_authors(), {self.authors[0].pk, author.pk}
+        )
+
+    def test_unfollow_before_backfill(self):
+        author = self.authors[1]
+        follow = Follow.objects.create(user=self.viewer, author=author)
+        # Отписка успела раньше, чем задача заполнения ленты.
+        follow.delete()
+        timeline.backfill(self.viewer.pk, [author.pk])
+        self.assertEqual(self.feed_authors(), {self.authors[0].pk})
+
+    def test_unfollow_forgets_author(self):
+        Follow.objects.filter(
+            user=self.viewer, author=self.authors[0]
+        ).delete()
+        self.assertEqual(self.feed_authors(), set())
+
+    def test_drain_pending(self):
+        recipe = Recipe.objects.create(
+            author=self.authors[0],
+            name='Новый рецепт',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/images/test.png',
+        )
+        self.assertTrue(PendingFanOut.objects.filter(recipe=recipe).exists())
+        self.assertNotIn(recipe.pk, self.feed_ids())
+        # Свежая отметка: задача раскладки, возможно, еще выполняется.
+        timeline.reconcile(set())
+        self.assertNotIn(recipe.pk, self.feed_ids())
+        PendingFanOut.objects.update(
+            created=timezone.now() - timedelta(hours=1)
+        )
+        timeline.reconcile(set())
+        self.assertEqual(self.feed_ids()[0], recipe.pk)
+        self.assertFalse(PendingFanOut.objects.exists())
+
+    def test_demoted_celebrity_catch_up(self):
+        author = self.authors[0]
+        FeedEntry.objects.all().delete()
+        shared_cache.set(timeline.PREVIOUS_CELEBRITIES_KEY, {author.pk})
+        timeline.reconcile(set())
+        self.assertEqual(self.feed_authors(), {author.pk})
+        self.assertEqual(
+            shared_cache.get(timeline.PREVIOUS_CELEBRITIES_KEY), set()
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_celebrity_recipes_are_mixed_in_on_read(self):
+        FeedEntry.objects.all().delete()
+        timeline.forget_celebrities()
+        self.assertEqual(timeline.celebrity_ids(), {self.authors[0].pk})
+        self.assertEqual(len(self.feed_ids()), 4)
+
+    def test_rebuild_authors_matches_rebuild(self):
+        Follow.objects.create(user=self.viewer, author=self.authors[1])
+        timeline.rebuild([self.viewer.pk])
+        expected = set(FeedEntry.objects.values_list(
+            'user_id', 'recipe_id', 'author_id', 'pub_date'
+        ))
+        FeedEntry.objects.all().delete()
+        author_ids = [author.pk for author in self.authors]
+        with CaptureQueriesContext(connection) as context:
+            timeline.rebuild_authors(author_ids, batch_size=1)
+        # Рецепты читаются по разу для каждого автора с подписчиками.
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if 'FROM "recipes_recipe"' in query['sql']
+        ]), 2)
+        self.assertEqual(set(FeedEntry.objects.values_list(
+            'user_id', 'recipe_id', 'author_id', 'pub_date'
+        )), expected)
+
+
+class IngredientLoaderTest(TestCase):
+    """Потоковая загрузка справочника ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def load(self, text, file_format, **kwargs):
+        return ingredient_loader.load(
+            ingredient_loader.read_rows(io.StringIO(text), file_format),
+            **kwargs,
+        )
+
+    def pairs(self):
+        return set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ))
+
+    def test_csv(self):
+        result = self.load(
+            'мука,г\nсахар,г\n,г\nсоль\n сахар , г\n', 'csv'
+        )
+        self.assertEqual(
+            (result.inserted, result.unchanged, result.skipped), (1, 1, 2)
+        )
+        self.assertEqual(self.pairs(), {('мука', 'г'), ('сахар', 'г')})
+        self.assertTrue(Ingredient.objects.filter(pk=self.flour.pk).exists())
+
+    def test_json_array_is_read_in_parts(self):
+        rows = [
+            {'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(20)
+        ]
+        with mock.patch.object(ingredient_loader, 'READ_SIZE', 7):
+            result = self.load(json.dumps(rows, ensure_ascii=False), 'json')
+        self.assertEqual(result.inserted, 20)
+        self.assertEqual(len(self.pairs()), 21)
+
+    def test_malformed_files(self):
+        for text, file_format in (
+            ('{"name": "соль"}', 'json'),
+            ('[{"name": "соль", "measurement_unit": "г"}', 'json'),
+            ('{"name": "соль", "measurement_unit": "г"}\n{', 'ndjson'),
+        ):
+            with self.assertRaises(ingredient_loader.LoadError):
+                self.load(text, file_format)
+
+    def test_dry_run_counts_duplicates_across_chunks_once(self):
+        inserted = []
+        result = self.load(
+            'соль,г\nсахар,г\nсоль,г\nмука,г\n', 'csv',
+            chunk_size=2, dry_run=True,
+            on_insert=lambda *pair: inserted.append(pair),
+        )
+        self.assertEqual((result.inserted, result.unchanged), (2, 2))
+        self.assertEqual(inserted, [('соль', 'г'), ('сахар', 'г')])
+        self.assertEqual(self.pairs(), {('мука', 'г')})
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'ingredients.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('{"name": "соль", "measurement_unit": "г"}\n')
+        output = io.StringIO()
+        call_command('load_ingredients', path, '--dry-run', stdout=output)
+        self.assertIn('+ соль, г', output.getvalue())
+        self.assertEqual(self.pairs(), {('мука', 'г')})
+        call_command('load_ingredients', path, stdout=io.StringIO())
+        self.assertEqual(self.pairs(), {('мука', 'г'), ('соль', 'г')})
+        with self.assertRaises(CommandError):
+            call_command('load_ingredients', path + '.missing')
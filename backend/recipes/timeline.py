@@ -0,0 +1,309 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Опубликованный рецепт раскладывается в таблицу ``FeedEntry`` всех
+подписчиков автора в фоновом потоке после фиксации транзакции (fan-out
+on write), поэтому страница ленты читается по индексу
+(пользователь, дата публикации). Рецепты авторов, у которых не меньше
+``FEED_FANOUT_MAX_FOLLOWERS`` подписчиков, не раскладываются: при чтении
+они подмешиваются запросом к рецептам этих авторов (fan-out on read).
+Множество таких авторов кэшируется на ``FEED_CELEBRITIES_TIMEOUT``
+секунд; после смены порога ленты пересобирает команда ``rebuild_feed``.
+
+Рецепт, ожидающий раскладки, отмечается записью ``PendingFanOut`` в той
+же транзакции. При каждом пересчете множества популярных авторов
+в фоне раскладываются рецепты, отметки которых старше
+``FEED_PENDING_DELAY`` секунд (задача потеряна при перезапуске
+воркера), и последние рецепты авторов, выбывших из популярных.
+Прошлое множество хранится в общем кэше; если оно потеряно, выбывшие
+авторы обнаруживаются только командой ``rebuild_feed``.
+"""
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from api.versioning import shared_cache
+from users.models import Follow
+from .models import FeedEntry, PendingFanOut, Recipe
+
+logger = logging.getLogger(__name__)
+
+CELEBRITIES_KEY = 'feed:celebrities'
+PREVIOUS_CELEBRITIES_KEY = 'feed:celebrities:previous'
+BATCH_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def celebrity_ids():
+    """Возвращает множество авторов, рецепты которых не раскладываются."""
+    authors = cache.get(CELEBRITIES_KEY)
+    if authors is None:
+        authors = set(
+            Follow.objects.values('author_id').annotate(
+                followers=Count('id')
+            ).filter(
+                followers__gte=settings.FEED_FANOUT_MAX_FOLLOWERS
+            ).values_list('author_id', flat=True)
+        )
+        cache.set(
+            CELEBRITIES_KEY, authors, settings.FEED_CELEBRITIES_TIMEOUT
+        )
+        _submit(reconcile, authors)
+    return authors
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков его автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date'
+    ).first()
+    if recipe is not None and recipe['author_id'] not in celebrity_ids():
+        _add_to_followers(recipe_id, recipe)
+    PendingFanOut.objects.filter(recipe_id=recipe_id).delete()
+
+
+def _add_to_followers(recipe_id, recipe):
+    follower_ids = Follow.objects.filter(
+        author_id=recipe['author_id']
+    ).values_list('user_id', flat=True).iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for user_id in follower_ids:
+        batch.append(FeedEntry(user_id=user_id, recipe_id=recipe_id, **recipe))
+        if len(batch) == BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_ids, limit=None):
+    """Добавляет в ленту последние рецепты авторов, на которых подписались."""
+    limit = limit or settings.FEED_BACKFILL_LIMIT
+    author_ids = set(author_ids) - celebrity_ids()
+    if not author_ids:
+        return
+    with transaction.atomic():
+        # Пока задача ждала в очереди, от автора могли отписаться, и
+        # forget уже отработал. Рецепты добавляются только для подписок,
+        # которые есть сейчас; блокировка не дает отписке завершиться
+        # до конца вставки.
+        author_ids = list(Follow.objects.select_for_update().filter(
+            user_id=user_id, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+        if not author_ids:
+            return
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids
+        ).latest_per_author(limit).values_list(
+            'id', 'author_id', 'pub_date'
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date,
+                )
+                for recipe_id, author_id, pub_date in recipes
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def drain_pending(before=None):
+    """Раскладывает рецепты с незавершенной раскладкой.
+
+    Возвращает число обработанных рецептов.
+    """
+    pending = PendingFanOut.objects.all()
+    if before is not None:
+        pending = pending.filter(created__lt=before)
+    recipe_ids = list(pending.values_list('recipe_id', flat=True))
+    for recipe_id in recipe_ids:
+        fan_out(recipe_id)
+    return len(recipe_ids)
+
+
+def reconcile(celebrities):
+    """Догоняет раскладку после сбоев и снижения популярности авторов."""
+    drain_pending(
+        timezone.now() - timedelta(seconds=settings.FEED_PENDING_DELAY)
+    )
+    previous = shared_cache.get(PREVIOUS_CELEBRITIES_KEY)
+    shared_cache.set(PREVIOUS_CELEBRITIES_KEY, celebrities, timeout=None)
+    demoted = (previous or set()) - celebrities
+    if not demoted:
+        return
+    for recipe_id in Recipe.objects.filter(
+        author_id__in=demoted
+    ).latest_per_author(settings.FEED_BACKFILL_LIMIT).values_list(
+        'id', flat=True
+    ):
+        fan_out(recipe_id)
+
+
+def forget(user_id, author_ids):
+    """Убирает из ленты рецепты авторов, от которых отписались."""
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def schedule_fan_out(recipe_id):
+    """Раскладывает рецепт по лентам в фоне после фиксации транзакции."""
+    PendingFanOut.objects.create(recipe_id=recipe_id)
+    _submit(fan_out, recipe_id)
+
+
+def schedule_backfill(user_id, author_ids):
+    """Заполняет ленту после подписки в фоне после фиксации транзакции."""
+    _submit(backfill, user_id, list(author_ids))
+
+
+@transaction.atomic
+def rebuild(user_ids):
+    """Пересобирает ленты указанных пользователей с нуля."""
+    FeedEntry.objects.filter(user_id__in=user_ids).delete()
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.filter(
+        user_id__in=user_ids
+    ).exclude(
+        author_id__in=celebrity_ids()
+    ).values_list('user_id', 'author_id'):
+        followers[author_id].append(user_id)
+    # Последние рецепты всех авторов пачки выбираются одним запросом.
+    recipes = Recipe.objects.filter(
+        author_id__in=list(followers)
+    ).latest_per_author(settings.FEED_BACKFILL_LIMIT).values_list(
+        'id', 'author_id', 'pub_date'
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for recipe_id, author_id, pub_date in recipes
+            for user_id in followers[author_id]
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def rebuild_authors(author_ids, batch_size=BATCH_SIZE):
+    """Раскладывает последние рецепты авторов по лентам подписчиков.
+
+    Рецепты каждого автора читаются один раз, а не для каждой пачки
+    подписчиков, как при ``rebuild``. Старые записи лент не удаляются.
+    """
+    author_ids = sorted(set(author_ids) - celebrity_ids())
+    for start in range(0, len(author_ids), batch_size):
+        followers = defaultdict(list)
+        for user_id, author_id in Follow.objects.filter(
+            author_id__in=author_ids[start:start + batch_size]
+        ).values_list('user_id', 'author_id'):
+            followers[author_id].append(user_id)
+        recipes = Recipe.objects.filter(
+            author_id__in=list(followers)
+        ).latest_per_author(settings.FEED_BACKFILL_LIMIT).values_list(
+            'id', 'author_id', 'pub_date'
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date,
+                )
+                for recipe_id, author_id, pub_date in recipes
+                for user_id in followers[author_id]
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def user_batches(user_ids=None, batch_size=BATCH_SIZE):
+    """Разбивает пользователей с подписками или лентами на пачки."""
+    if user_ids is None:
+        user_ids = sorted(
+            set(Follow.objects.order_by().values_list(
+                'user_id', flat=True
+            ).distinct())
+            | set(FeedEntry.objects.order_by().values_list(
+                'user_id', flat=True
+            ).distinct())
+        )
+    for start in range(0, len(user_ids), batch_size):
+        yield user_ids[start:start + batch_size]
+
+
+def forget_celebrities():
+    """Сбрасывает кэш популярных авторов."""
+    cache.delete(CELEBRITIES_KEY)
+
+
+def page(user, position, limit):
+    """Возвращает до ``limit`` ключей (дата, id рецепта) после position.
+
+    Ключи из таблицы ленты объединяются с последними рецептами
+    отслеживаемых популярных авторов и сортируются по убыванию.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    if position is not None:
+        entries = entries.filter(_before(position, 'recipe_id'))
+    keys = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit])
+    celebrities = celebrity_ids()
+    if celebrities:
+        recipes = Recipe.objects.filter(
+            author_id__in=celebrities,
+            author__following__user=user,
+        )
+        if position is not None:
+            recipes = recipes.filter(_before(position, 'id'))
+        keys.update(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:limit])
+    return sorted(keys, reverse=True)[:limit]
+
+
+def _before(position, id_field):
+    pub_date, recipe_id = position
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f'{id_field}__lt': recipe_id}
+    )
+
+
+def _submit(function, *args):
+    def run():
+        # Потоки пула живут долго: соединения с базой обновляются так же,
+        # как между запросами.
+        close_old_connections()
+        try:
+            function(*args)
+        except Exception:
+            logger.exception('Не удалось обновить ленты подписок')
+        finally:
+            close_old_connections()
+
+    transaction.on_commit(lambda: _get_executor().submit(run))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FEED_WORKERS,
+                thread_name_prefix='feed-fan-out',
+            )
+        return _executor
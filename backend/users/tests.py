@@ -0,0 +1,161 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import Follow, User
+
+TEST_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'users-tests-{alias}',
+    }
+    for alias in ('default', 'shared')
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriptionTestCase(TestCase):
+    """Зритель, подписанный на авторов с рецептами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(
+            email='viewer@example.com',
+            username='viewer',
+            first_name='Зритель',
+            last_name='Зритель',
+            password='secret-pass-1',
+        )
+        cls.authors = []
+        for number in range(6):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                first_name='Автор',
+                last_name=str(number),
+                password='secret-pass-1',
+            )
+            for recipe_number in range(3):
+                Recipe.objects.create(
+                    author=author,
+                    name=f'Рецепт {number}.{recipe_number}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipes/images/test.png',
+                )
+            Follow.objects.create(user=cls.viewer, author=author)
+            cls.authors.append(author)
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+
+class SubscriptionPaginationTest(SubscriptionTestCase):
+    """Курсорный режим пагинации подписок."""
+
+    def test_cursor_matches_page_order(self):
+        pages = self.client.get(
+            '/api/users/subscriptions/?limit=6'
+        ).json()['results']
+        ids = []
+        path = '/api/users/subscriptions/?cursor=&limit=4'
+        while path:
+            data = self.client.get(path).json()
+            self.assertNotIn('count', data)
+            ids += [author['id'] for author in data['results']]
+            path = data['next']
+        self.assertEqual(ids, [author['id'] for author in pages])
+        self.assertEqual(ids[0], self.authors[-1].pk)
+
+
+class SubscriptionRecipesTest(SubscriptionTestCase):
+    """Рецепты подписок выбираются одним запросом на страницу."""
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/users/subscriptions/?limit=2')
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get('/api/users/subscriptions/?limit=6')
+
+    def test_recipes_limit(self):
+        results = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=2'
+        ).json()['results']
+        self.assertEqual(len(results), len(self.authors))
+        for author in results:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], 3)
+            self.assertEqual(len(author['recipes']), 2)
+            ids = [recipe['id'] for recipe in author['recipes']]
+            self.assertEqual(ids, sorted(ids, reverse=True))
+
+
+class UnsubscribeTest(SubscriptionTestCase):
+    """Отписка убирает автора из подписок."""
+
+    def test_unsubscribe(self):
+        author = self.authors[0]
+        response = self.client.delete(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        ids = [
+            user['id'] for user in self.client.get(
+                '/api/users/subscriptions/'
+            ).json()['results']
+        ]
+        self.assertNotIn(author.pk, ids)
+        response = self.client.delete(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unsubscribe_from_unknown_user(self):
+        response = self.client.delete('/api/users/999999/subscribe/')
+        self.assertEqual(response.status_code, 404)
+
+
+class UserConditionalGetTest(SubscriptionTestCase):
+    """ETag профилей меняется после фиксации изменений."""
+
+    def assert_changed_by(self, path, change):
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def rename(self, user):
+        user.first_name = 'Новое имя'
+        user.save()
+
+    def test_me(self):
+        self.assert_changed_by(
+            '/api/users/me/', lambda: self.rename(self.viewer)
+        )
+
+    def test_profile(self):
+        author = self.authors[0]
+        self.assert_changed_by(
+            f'/api/users/{author.pk}/', lambda: self.rename(author)
+        )
+        self.assert_changed_by(
+            f'/api/users/{author.pk}/',
+            lambda: Follow.objects.filter(
+                user=self.viewer, author=author
+            ).delete(),
+        )
+
+    def test_unknown_profile_has_no_version(self):
+        for pk in ('999999', 'missing'):
+            response = self.client.get(f'/api/users/{pk}/')
+            self.assertEqual(response.status_code, 404)
+            self.assertIsNone(
+                caches['shared'].get(f'data-version:user:{pk}')
+            )